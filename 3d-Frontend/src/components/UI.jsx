@@ -1,5 +1,5 @@
 import { useRef, useState, useEffect } from "react";
-import { useChat } from "../hooks/useChat";
+import { SESSION_KEY, useChat } from "../hooks/useChat";
 
 export const UI = ({ hidden, chatMode = "human", onModeChange, ...props }) => {
   const input = useRef();
@@ -45,14 +45,21 @@ export const UI = ({ hidden, chatMode = "human", onModeChange, ...props }) => {
           const response = await fetch("http://localhost:5001/chat-text", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ message: text }),
+            body: JSON.stringify({
+              message: text,
+              session_id: sessionStorage.getItem(SESSION_KEY),
+            }),
           });
 
-          if (!response.ok) {
+          // 503 means the server is shedding load; its body carries a message to show
+          if (!response.ok && response.status !== 503) {
             throw new Error(`HTTP error! status: ${response.status}`);
           }
 
           const data = await response.json();
+          if (data.session_id) {
+            sessionStorage.setItem(SESSION_KEY, data.session_id);
+          }
 
           setChatHistory((prev) => [
             ...prev,
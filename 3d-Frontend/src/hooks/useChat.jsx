@@ -4,6 +4,30 @@ const backendUrl = import.meta.env.VITE_API_URL || "http://localhost:5001";
 
 const ChatContext = createContext();
 
+// Server-side conversation session, shared with the text chat mode
+export const SESSION_KEY = "nexbot_session_id";
+
+// Audio and lipsync are generated in the background; poll until the job finishes.
+// The server answers each poll at once, so the client paces them
+const AUDIO_POLL_MS = 500;
+const AUDIO_POLL_TIMEOUT_MS = 30000;
+
+const fetchAudioJob = async (jobId) => {
+  const deadline = Date.now() + AUDIO_POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const response = await fetch(`${backendUrl}/chat/audio/${jobId}`);
+    if (response.status === 200) {
+      return response.json();
+    }
+    if (response.status !== 202) {
+      return null;
+    }
+    await new Promise((resolve) => setTimeout(resolve, AUDIO_POLL_MS));
+  }
+  console.warn("Audio generation timed out, proceeding without audio");
+  return null;
+};
+
 export const ChatProvider = ({ children }) => {
   // Voice type removed - using single British female voice for all avatars
 
@@ -18,14 +42,31 @@ export const ChatProvider = ({ children }) => {
         body: JSON.stringify({
           message,
           voice_type: "female", // Always use British female voice
+          session_id: sessionStorage.getItem(SESSION_KEY),
         }),
       });
 
-      if (!response.ok) {
+      // 503 means the server is shedding load; its body carries a message to show
+      if (!response.ok && response.status !== 503) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
       const data = await response.json();
+      if (data.session_id) {
+        sessionStorage.setItem(SESSION_KEY, data.session_id);
+      }
+
+      if (data.audio_job) {
+        try {
+          const job = await fetchAudioJob(data.audio_job);
+          if (job && job.state === "done") {
+            data.audio = job.audio;
+            data.lipsync = job.lipsync;
+          }
+        } catch (audioError) {
+          console.warn("Audio fetch failed, proceeding without audio:", audioError);
+        }
+      }
 
       // Handle different response formats
       let newMessages = [];
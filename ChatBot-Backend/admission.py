@@ -0,0 +1,205 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+# Requests running at once in this process across all lanes
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "6"))
+# Longest a request may queue before it is turned away
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+# gunicorn threads per worker (gunicorn.conf.py). Running and queued requests each hold one,
+# so the lanes below the top priority must not be able to take all of them
+WORKER_THREADS = int(os.getenv("NEXBOT_THREADS", "16"))
+
+LATENCY_EWMA_ALPHA = 0.2
+DECREASE_FACTOR = 0.8
+DECREASE_COOLDOWN_SECONDS = 2.0  # One multiplicative decrease per cooldown, not per slow request
+
+
+def _lane_setting(lane: str, name: str, default: float) -> float:
+    return float(os.getenv(f"ADMISSION_{lane.upper()}_{name}", str(default)))
+
+
+# lane -> (priority, concurrency, queue, target latency ms); lower priority numbers are admitted first.
+# avatar + batch hold at most 3 + 6 + 1 + 1 = 11 of the 16 threads, leaving 5 for text and audio polls
+DEFAULT_LANES = {
+    "text": (0, 4, 32, 4000),
+    "avatar": (1, 3, 6, 8000),
+    "batch": (2, 1, 1, 60000),
+}
+
+
+class Overloaded(Exception):
+    """The lane's queue is full or its estimated wait is too long"""
+
+    def __init__(self, lane: str, retry_after: int, reason: str):
+        super().__init__(f"{lane} lane overloaded: {reason}")
+        self.lane = lane
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Lane:
+    """Concurrency limit, wait queue and latency tracking for one class of traffic"""
+
+    def __init__(self, name: str, priority: int, concurrency: int, max_queue: int, target_ms: float):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max(1, concurrency)
+        self.limit = float(self.max_concurrency)  # Adapted between 1 and max_concurrency from latency
+        self.max_queue = max_queue
+        self.target = target_ms / 1000.0
+        self.inflight = 0
+        self.waiting = deque()
+        self.latency = None  # EWMA of seconds per request
+        self.last_decrease = 0.0
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    def record(self, seconds: float):
+        """Fold a finished request's latency in and adjust the limit (AIMD)"""
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_EWMA_ALPHA * (seconds - self.latency)
+        now = time.time()
+        if self.latency > self.target:
+            if now - self.last_decrease >= DECREASE_COOLDOWN_SECONDS:
+                self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+                self.last_decrease = now
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+    def estimated_wait(self, position: int) -> float:
+        """Seconds until a request at this queue position would start, from observed latency"""
+        if self.latency is None:
+            return 0.0
+        return (position + 1) * self.latency / max(1, int(self.limit))
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            "priority": self.priority,
+            "inflight": self.inflight,
+            "waiting": len(self.waiting),
+            "limit": int(self.limit),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+            "target_ms": round(self.target * 1000),
+        }
+
+
+class AdmissionController:
+    """Per-lane concurrency limits and bounded FIFO queues under a shared in-flight cap
+
+    When a slot frees up, the oldest waiter of the highest-priority lane that is below
+    its own limit goes first. Requests are rejected up front when their lane's queue is
+    full or its latency-based wait estimate already exceeds max_wait.
+    """
+
+    def __init__(self, lanes: Dict[str, tuple] = None, max_inflight: int = ADMISSION_MAX_INFLIGHT,
+                 max_wait: float = ADMISSION_MAX_WAIT_SECONDS, threads: int = WORKER_THREADS):
+        self.max_inflight = max_inflight
+        self.max_wait = max_wait
+        self.lanes = {}
+        for name, (priority, concurrency, max_queue, target_ms) in (lanes or DEFAULT_LANES).items():
+            self.lanes[name] = Lane(
+                name,
+                int(_lane_setting(name, "PRIORITY", priority)),
+                int(_lane_setting(name, "CONCURRENCY", concurrency)),
+                int(_lane_setting(name, "QUEUE", max_queue)),
+                _lane_setting(name, "TARGET_MS", target_ms),
+            )
+        self.inflight = 0
+        self._cond = threading.Condition()
+
+        held = self.lower_priority_threads()
+        if held >= threads:
+            print(f"⚠️ Admission: lanes below the top priority can hold {held} of {threads} threads, so "
+                  f"top-priority requests may find none free; lower their _CONCURRENCY or _QUEUE")
+
+    def lower_priority_threads(self) -> int:
+        """Threads the lanes below the top priority can hold at once, running plus queued"""
+        top = min(lane.priority for lane in self.lanes.values())
+        return sum(lane.max_concurrency + lane.max_queue for lane in self.lanes.values() if lane.priority > top)
+
+    def _has_room(self, lane: Lane) -> bool:
+        return self.inflight < self.max_inflight and lane.inflight < int(lane.limit)
+
+    def _outranked(self, lane: Lane) -> bool:
+        """A higher-priority lane has waiters that could take the next slot"""
+        return any(other.waiting and other.priority < lane.priority and self._has_room(other)
+                   for other in self.lanes.values())
+
+    def _may_start(self, lane: Lane, ticket) -> bool:
+        return bool(lane.waiting) and lane.waiting[0] is ticket and self._has_room(lane) and not self._outranked(lane)
+
+    def _reject(self, lane: Lane, wait: float, reason: str):
+        lane.counters["rejected"] += 1
+        raise Overloaded(lane.name, max(1, math.ceil(wait)), reason)
+
+    def acquire(self, name: str):
+        lane = self.lanes[name]
+        with self._cond:
+            if not lane.waiting and self._has_room(lane) and not self._outranked(lane):
+                lane.inflight += 1
+                self.inflight += 1
+                lane.counters["admitted"] += 1
+                return
+
+            position = len(lane.waiting)
+            wait = lane.estimated_wait(position)
+            if position >= lane.max_queue:
+                self._reject(lane, wait, "queue full")
+            if wait > self.max_wait:
+                self._reject(lane, wait, "latency too high")
+
+            ticket = object()
+            lane.waiting.append(ticket)
+            lane.counters["queued"] += 1
+            deadline = time.time() + self.max_wait
+            try:
+                while not self._may_start(lane, ticket):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        lane.counters["timed_out"] += 1
+                        raise Overloaded(name, max(1, math.ceil(lane.estimated_wait(len(lane.waiting)))),
+                                         "timed out in queue")
+                    self._cond.wait(remaining)
+            finally:
+                lane.waiting.remove(ticket)
+                # Whoever is now at the head of this lane may be able to go
+                self._cond.notify_all()
+            lane.inflight += 1
+            self.inflight += 1
+            lane.counters["admitted"] += 1
+
+    def release(self, name: str, seconds: float):
+        lane = self.lanes[name]
+        with self._cond:
+            lane.inflight -= 1
+            self.inflight -= 1
+            lane.record(seconds)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, name: str):
+        """Hold a slot in lane name for the duration of the block; raises Overloaded"""
+        self.acquire(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(name, time.perf_counter() - start)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "inflight": self.inflight,
+                "max_inflight": self.max_inflight,
+                "max_wait_seconds": self.max_wait,
+                "lanes": {name: lane.stats() for name, lane in self.lanes.items()},
+            }
@@ -0,0 +1,240 @@
+"""Pre-generated answers, audio and lipsync for the most common policy questions
+
+Build offline against the current index (uses the LLM and gTTS once per question):
+    python answer_store.py build                       # default + mined questions
+    python answer_store.py build --questions faq.txt   # plus one question per line
+    python answer_store.py list
+
+At request time a question whose embedding is close enough to a stored question is
+answered from memory, skipping the LLM and TTS. Entries built against a different
+index generation (the corpus changed since the build) are not served.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from intent_router import content_words, hashed_vector, normalize_message, FAQ_THRESHOLD
+
+ANSWER_STORE_FILE = os.getenv("ANSWER_STORE_FILE", "answer_store.json")
+# Cosine similarity a question needs to a stored question to reuse its answer
+ANSWER_STORE_THRESHOLD = float(os.getenv("ANSWER_STORE_THRESHOLD", "0.92"))
+MAX_MINED_QUESTIONS = 200
+RELOAD_CHECK_SECONDS = 10  # How often a running server looks for a newer build
+
+# Always answered offline; extend with --questions
+CANONICAL_QUESTIONS = [
+    "What is the 10% attendance waiver criteria?",
+    "How many MOOC credits can be transferred?",
+    "What are the CARE guidelines?",
+    "Who is eligible for duty leave?",
+    "What is the policy for hackathon participation?",
+    "How does recognition of prior learning work?",
+    "What is the grade upgrade policy for internships?",
+    "What are the rules for patent and copyright filing?",
+]
+
+_question_re = re.compile(r"(?:^|(?<=[.!:\n]))\s*((?:what|how|who|when|where|which|can|is|are|do|does|will|should)\b[^?\n]{8,160}\?)",
+                          re.IGNORECASE)
+
+
+def mine_questions(documents, limit: int = MAX_MINED_QUESTIONS) -> List[str]:
+    """Questions written in the policy documents themselves (FAQ sections), most frequent first"""
+    counts = {}
+    for doc in documents:
+        for match in _question_re.finditer(doc.page_content):
+            question = " ".join(match.group(1).split())
+            key = normalize_message(question)
+            if key:
+                count, text = counts.get(key, (0, question))
+                counts[key] = (count + 1, text)
+    ranked = sorted(counts.values(), key=lambda item: item[0], reverse=True)
+    return [text for _, text in ranked[:limit]]
+
+
+def index_generation(retriever) -> Optional[str]:
+    generation = getattr(retriever, "generation", None)
+    return generation() if generation else None
+
+
+class AnswerStore:
+    """Stored question -> answer/audio/lipsync entries served by nearest-question lookup"""
+
+    def __init__(self, path: str = ANSWER_STORE_FILE, threshold: float = ANSWER_STORE_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.generation = None
+        self.entries = []
+        self._lock = Lock()
+        self._vectors = None  # (encoder key, matrix of stored question vectors)
+        self._generation_check = (None, None)  # (index version key, matches)
+        self.counters = {"hits": 0, "misses": 0, "stale": 0}
+        self._loaded_mtime = None
+        self._checked_at = 0.0
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        with self._lock:
+            self._loaded_mtime = mtime
+            self.generation = data.get("generation")
+            self.entries = data.get("entries", [])
+            self._vectors = None
+            self._generation_check = (None, None)
+        print(f"📦 Loaded {len(self.entries)} pre-generated answers (index generation {self.generation})")
+
+    def save(self, generation: str, entries: List[Dict]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"generation": generation, "built_at": time.time(), "entries": entries}, f)
+        os.replace(tmp_path, self.path)
+        self.load()
+
+    def _reload_if_rebuilt(self):
+        """Pick up a newer build written by the offline job without a restart"""
+        now = time.time()
+        if now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        try:
+            if os.path.exists(self.path) and os.path.getmtime(self.path) != self._loaded_mtime:
+                self.load()
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not reload pre-generated answers: {e}")
+
+    def _encode(self, texts: List[str], model):
+        if model is not None:
+            return np.asarray(model.encode(texts), dtype=np.float32)
+        return np.vstack([hashed_vector(text) for text in texts])
+
+    def _is_current(self, retriever) -> bool:
+        """Whether the store was built against the index the retriever serves now"""
+        version_key = (id(retriever), getattr(retriever, "version", None),
+                       tuple((name, shard.version) for name, shard in sorted(getattr(retriever, "shards", {}).items())))
+        checked_key, matches = self._generation_check
+        if checked_key != version_key:
+            matches = index_generation(retriever) == self.generation
+            if not matches:
+                print("⚠️ Pre-generated answers are stale (documents changed); rebuild with: python answer_store.py build")
+            self._generation_check = (version_key, matches)
+        return matches
+
+    def lookup(self, question: str, retriever) -> Optional[Dict]:
+        """Stored entry for a question close enough to this one, if the store is current"""
+        self._reload_if_rebuilt()
+        if not self.entries or retriever is None:
+            return None
+        if not self._is_current(retriever):
+            self._count("stale")
+            return None
+
+        model = getattr(retriever, "embedding_model", None) if getattr(retriever, "use_embeddings", False) else None
+        with self._lock:
+            entries = self.entries
+            if self._vectors is None or self._vectors[0] is not model:
+                self._vectors = (model, self._encode([entry["question"] for entry in entries], model))
+            vectors = self._vectors[1]
+
+        query_vector = self._encode([question], model)[0]
+        scores = vectors @ query_vector
+        best = int(np.argmax(scores))
+        # Hashed bag-of-words vectors (no embedding model) score lower; use the router's FAQ rule instead
+        threshold = self.threshold if model is not None else FAQ_THRESHOLD
+        same_words = model is not None or (content_words(normalize_message(question)) ==
+                                           content_words(normalize_message(entries[best]["question"])))
+        if scores[best] < threshold or not same_words:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return {**entries[best], "score": float(scores[best])}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self.entries), "generation": self.generation, **self.counters}
+
+
+def build(extra_questions: List[str] = (), mine: bool = True, with_audio: bool = True):
+    """Answer the canonical questions with the live QA chain and store answers, audio and lipsync"""
+    # Not integrated_backend: importing it starts the server's watchers, queues and sweepers
+    from intent_router import IntentRouter
+    from local_embedding_retriever import NO_DOCUMENTS_ANSWER, get_qa_chain
+    from speech import generate_audio_with_voice_variants, generate_simple_lipsync
+
+    qa_chain = get_qa_chain()
+    retriever = qa_chain.retriever
+    intent_router = IntentRouter()
+
+    questions = list(CANONICAL_QUESTIONS) + list(extra_questions)
+    if mine:
+        documents = getattr(retriever, "documents", None)
+        if documents is None:
+            documents = [doc for shard in retriever.shards.values() for doc in shard.documents]
+        questions += mine_questions(documents)
+
+    # Skip duplicates and questions the intent router already answers without the LLM
+    seen, pending = set(), []
+    for question in questions:
+        key = normalize_message(question)
+        if key and key not in seen and not intent_router.route(question):
+            seen.add(key)
+            pending.append(question)
+
+    generation = index_generation(retriever)
+    print(f"🔄 Generating {len(pending)} answers against index generation {generation}...")
+    entries = []
+    for result in qa_chain.batch(pending):
+        if result["error"] or not result["answer"]:
+            print(f"⚠️ Skipped '{result['query']}': {result['error']}")
+            continue
+        answer = result["answer"]
+        # A stored "not found" would outlive documents added later that do answer it
+        if answer == NO_DOCUMENTS_ANSWER:
+            print(f"⚠️ Skipped '{result['query']}': no answer from the documents")
+            continue
+        entry = {"question": result["query"], "answer": answer, "audio": "", "lipsync": None}
+        if with_audio:
+            entry["audio"] = generate_audio_with_voice_variants(answer, "female") or ""
+            entry["lipsync"] = generate_simple_lipsync(answer)
+        entries.append(entry)
+
+    # Make sure nothing changed the index while the answers were generated
+    if index_generation(retriever) != generation:
+        raise RuntimeError("The index changed during the build; run it again")
+    AnswerStore(ANSWER_STORE_FILE).save(generation, entries)
+    print(f"✅ Stored {len(entries)} answers in {ANSWER_STORE_FILE}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generated FAQ answer store")
+    parser.add_argument("command", choices=["build", "list"])
+    parser.add_argument("--questions", help="File with one extra canonical question per line")
+    parser.add_argument("--no-mine", action="store_true", help="Do not add questions found in the documents")
+    parser.add_argument("--no-audio", action="store_true", help="Store answers only, without TTS audio")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        store = AnswerStore()
+        print(f"Index generation: {store.generation}")
+        for entry in store.entries:
+            print(f"- {entry['question']}{'' if entry.get('audio') else ' (no audio)'}")
+        sys.exit(0)
+
+    extra = []
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            extra = [line.strip() for line in f if line.strip()]
+    build(extra, mine=not args.no_mine, with_audio=not args.no_audio)
@@ -1,6 +1,7 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session
 from werkzeug.utils import secure_filename
 import os
+from threading import Thread
 from local_embedding_retriever import get_qa_chain, build_retriever, rebuild_embeddings_cache
 from dotenv import load_dotenv
 
@@ -17,7 +18,25 @@ UPLOAD_FOLDER = "data"
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'xlsx'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-qa_chain = get_qa_chain()
+# NEXBOT_LAZY_STARTUP=1 binds the port first and builds the QA chain in the background
+qa_chain = None
+qa_status = {"state": "starting", "error": None}
+
+def warm_up_qa_chain():
+    global qa_chain
+    qa_status["state"] = "loading"
+    try:
+        qa_chain = get_qa_chain()
+        qa_status.update(state="ready", error=None)
+    except Exception as e:
+        # Keep serving /healthz and report the failure from /readyz instead of dying silently
+        qa_status.update(state="failed", error=str(e))
+        print(f"⚠️ Failed to initialize QA system: {e}")
+
+if os.getenv("NEXBOT_LAZY_STARTUP", "0") == "1":
+    Thread(target=warm_up_qa_chain, name="qa-warmup", daemon=True).start()
+else:
+    warm_up_qa_chain()
 
 # ------------------ Helper ------------------
 def allowed_file(filename):
@@ -33,9 +52,20 @@ def ask():
     query = request.json.get("query", "")
     if not query:
         return jsonify({"answer": "Please enter a question."})
+    if qa_chain is None:
+        return jsonify({"answer": "The policy assistant is still starting up. Please try again in a few seconds."}), 503
     answer = qa_chain(query)
     return jsonify({"answer": answer})
 
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "alive"})
+
+@app.route("/readyz")
+def readyz():
+    body = {"ready": qa_chain is not None, "state": qa_status["state"], "error": qa_status["error"]}
+    return jsonify(body), (200 if qa_chain is not None else 503)
+
 # ------------------ ADMIN AUTH ------------------
 @app.route("/admin")
 def admin_login():
@@ -80,7 +110,7 @@ def rebuild_index():
         return redirect(url_for("admin_login"))
     global qa_chain
     rebuild_embeddings_cache()  # Clear old embeddings cache
-    qa_chain = get_qa_chain()  # Rebuild with new embeddings
+    warm_up_qa_chain()  # Rebuild with new embeddings
     return redirect(url_for("admin_dashboard"))
 
 if __name__ == "__main__":
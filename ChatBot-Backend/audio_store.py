@@ -0,0 +1,170 @@
+import os
+import time
+import uuid
+from threading import Lock, Thread
+from typing import Optional
+
+# Defaults, overridable through the environment
+DEFAULT_MAX_BYTES = int(os.getenv("AUDIO_STORE_MAX_MB", "200")) * 1024 * 1024
+DEFAULT_TTL = int(os.getenv("AUDIO_STORE_TTL_SECONDS", "3600"))
+SWEEP_INTERVAL = 60
+# Once over the cap, evict down to this fraction of it so the next writes don't sweep again
+EVICT_TO_FRACTION = 0.9
+
+# Only files under this subfolder belong to the store; the rest of the audio folder is left alone
+MANAGED_DIR = "generated"
+TMP_DIR = ".tmp"
+
+
+class AudioArtifactStore:
+    """Bounded store for generated audio/lipsync files with TTL expiry and LRU eviction
+
+    The files themselves are the index, so every worker process sees the same store and the
+    size cap covers all of them: a file's mtime is set to its expiry time and its atime to
+    its last use.
+    """
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES, ttl: int = DEFAULT_TTL):
+        self.root = os.path.join(root, MANAGED_DIR)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.tmp_root = os.path.join(self.root, TMP_DIR)
+        os.makedirs(self.tmp_root, exist_ok=True)
+
+        self._sweeper = None
+        # Bytes seen by the last sweep plus this worker's writes since; other workers' writes
+        # are only counted by the next sweep, so the cap can briefly be exceeded
+        self._bytes_in_use = 0
+        self._bytes_lock = Lock()
+        self._remove_stale_scratch_files()
+        self.sweep()
+
+    def _remove_stale_scratch_files(self):
+        for entry in os.scandir(self.tmp_root):
+            # Leftovers from writes interrupted by a crash; recent ones may belong to another worker
+            try:
+                if entry.stat().st_mtime < time.time() - self.ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def new_filename(self, extension: str) -> str:
+        """Unique artifact name, safe across threads and worker processes"""
+        return f"message_{uuid.uuid4().hex}.{extension.lstrip('.')}"
+
+    def temp_path(self, extension: str) -> str:
+        """Scratch path for tools (ffmpeg, rhubarb) that must write to a file themselves"""
+        return os.path.join(self.tmp_root, f"{uuid.uuid4().hex}.{extension.lstrip('.')}")
+
+    def write_bytes(self, filename: str, data: bytes, ttl: Optional[int] = None) -> str:
+        """Atomically write an artifact and return its path"""
+        tmp_path = self.temp_path(os.path.splitext(filename)[1] or "tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self.adopt(tmp_path, filename, ttl)
+
+    def adopt(self, tmp_path: str, filename: str, ttl: Optional[int] = None) -> str:
+        """Move a finished scratch file into the store under filename"""
+        path = self._path(filename)
+        now = time.time()
+        size = os.path.getsize(tmp_path)
+        os.utime(tmp_path, (now, now + (ttl if ttl is not None else self.ttl)))
+        # rename is atomic, so readers never see a partially written file
+        os.replace(tmp_path, path)
+        # Scanning the folder on every write would stall writers; only sweep once over the cap
+        with self._bytes_lock:
+            self._bytes_in_use += size
+            over_cap = self._bytes_in_use > self.max_bytes
+        if over_cap:
+            self.sweep()
+        return path
+
+    def _path(self, filename: str) -> str:
+        if not filename or filename.startswith(".") or os.path.basename(filename) != filename:
+            raise ValueError(f"Invalid artifact name: {filename!r}")
+        return os.path.join(self.root, filename)
+
+    def path_for(self, filename: str) -> Optional[str]:
+        """Path of a live artifact (marking it recently used), or None if missing/expired"""
+        try:
+            path = self._path(filename)
+            expires_at = os.stat(path).st_mtime
+        except (ValueError, FileNotFoundError):
+            return None
+
+        if expires_at <= time.time():
+            self.delete(filename)
+            return None
+        try:
+            os.utime(path, (time.time(), expires_at))
+        except FileNotFoundError:
+            return None  # Evicted by another worker in the meantime
+        return path
+
+    def delete(self, filename: str):
+        """Remove an artifact from disk"""
+        try:
+            os.remove(self._path(filename))
+        except (ValueError, FileNotFoundError):
+            pass
+
+    def _scan(self):
+        """(last used, name, size, expires at) of every artifact, least recently used first"""
+        artifacts = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            artifacts.append((stat.st_atime, entry.name, stat.st_size, stat.st_mtime))
+        return sorted(artifacts)
+
+    def sweep(self):
+        """Drop expired artifacts, then evict least recently used ones until well under the size cap"""
+        now = time.time()
+        victims = []
+        kept = []
+        for artifact in self._scan():
+            (victims if artifact[3] <= now else kept).append(artifact)
+
+        total_bytes = sum(size for _, _, size, _ in kept)
+        target = self.max_bytes * EVICT_TO_FRACTION if total_bytes > self.max_bytes else self.max_bytes
+        while total_bytes > target and kept:
+            artifact = kept.pop(0)
+            total_bytes -= artifact[2]
+            victims.append(artifact)
+
+        with self._bytes_lock:
+            self._bytes_in_use = total_bytes
+
+        for _, filename, _, _ in victims:
+            try:
+                os.remove(os.path.join(self.root, filename))
+            except FileNotFoundError:
+                pass  # Another worker swept it first
+
+        if victims:
+            print(f"🧹 Audio store: removed {len(victims)} artifact(s), {total_bytes / 1024 / 1024:.1f} MB in use")
+
+    def start_sweeper(self, interval: int = SWEEP_INTERVAL):
+        """Expire artifacts periodically even when nothing new is being written"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"⚠️ Audio store sweep failed: {e}")
+
+        self._sweeper = Thread(target=run, name="audio-store-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stats(self):
+        artifacts = self._scan()
+        return {"files": len(artifacts), "bytes": sum(size for _, _, size, _ in artifacts),
+                "max_bytes": self.max_bytes, "ttl": self.ttl}
@@ -0,0 +1,177 @@
+"""Micro-batching of query encodes across concurrent requests
+
+Request threads hand their texts to one encoder thread. While other callers are
+already waiting in encode(), it waits up to ENCODE_MAX_WAIT_MS for their texts too
+(at most ENCODE_MAX_BATCH), encodes everything in one call and gives each caller its
+rows back. A lone caller is encoded immediately, so idle-time latency is unchanged.
+
+Compare throughput and latency with and without batching:
+    python batching_encoder.py benchmark
+    python batching_encoder.py benchmark --fake     # simulated model, no download
+"""
+import os
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+ENCODE_MAX_BATCH = int(os.getenv("ENCODE_MAX_BATCH", "32"))
+ENCODE_MAX_WAIT_MS = float(os.getenv("ENCODE_MAX_WAIT_MS", "5"))
+
+
+class MicroBatchEncoder:
+    """Wraps an embedding model; small encode() calls from many threads share one batch"""
+
+    def __init__(self, model, max_batch: int = ENCODE_MAX_BATCH, max_wait_ms: float = ENCODE_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+        self._inflight = 0  # Callers currently inside encode()
+        self._inflight_lock = threading.Lock()
+        self.counters = {"batches": 0, "texts": 0, "direct": 0}
+
+    def __getattr__(self, name):
+        # Everything else (e.g. .dimension) comes from the wrapped model
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def _ensure_worker(self):
+        # Threads do not survive fork (gunicorn preload), so start lazily per process
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker_pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+                self._worker.start()
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        sentences = list(sentences)
+        # Bulk encodes (indexing) are already batched; keyword options keep their exact semantics
+        if kwargs or len(sentences) > self.max_batch:
+            self.counters["direct"] += 1
+            return self.model.encode(sentences, **kwargs)
+
+        self._ensure_worker()
+        future = Future()
+        with self._inflight_lock:
+            self._inflight += 1
+        try:
+            self._queue.put((sentences, future))
+            return future.result()
+        finally:
+            with self._inflight_lock:
+                self._inflight -= 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            # Only wait for callers that are already on their way, up to max_batch texts
+            while size < self.max_batch and len(batch) < self._inflight:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for sentences, _ in batch for text in sentences]
+            try:
+                embeddings = np.asarray(self.model.encode(texts))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.counters["batches"] += 1
+            self.counters["texts"] += len(texts)
+            start = 0
+            for sentences, future in batch:
+                future.set_result(embeddings[start:start + len(sentences)])
+                start += len(sentences)
+
+    def stats(self):
+        batches = self.counters["batches"]
+        return {
+            **self.counters,
+            "mean_batch_size": round(self.counters["texts"] / batches, 2) if batches else None,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+class FakeEncoder:
+    """CPU-bound stand-in: multithreaded BLAS work with a large fixed cost per call, like a small transformer"""
+
+    def __init__(self, dimension: int = 384, width: int = 384, layers: int = 12):
+        self.dimension = dimension
+        self.layers = [np.random.RandomState(i).rand(width, width).astype(np.float32) / width for i in range(layers)]
+
+    def encode(self, sentences, **kwargs):
+        # Every call pays for a 64-token "sequence" per text; weights are re-read per call
+        hidden = np.ones((len(sentences) * 64, self.layers[0].shape[0]), dtype=np.float32)
+        for weights in self.layers:
+            hidden = np.tanh(hidden @ weights @ weights.T)
+        return hidden.reshape(len(sentences), 64, -1).mean(axis=1)[:, :self.dimension]
+
+
+def _run_load(encoder, concurrency: int, queries_per_thread: int):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(worker):
+        for i in range(queries_per_thread):
+            start = time.perf_counter()
+            encoder.encode([f"What is the attendance policy for case {worker}-{i}?"])
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def benchmark(fake: bool = False, levels=(1, 2, 4, 8, 16), queries: int = 400):
+    """Throughput and per-query latency of direct vs micro-batched encodes"""
+    if fake:
+        model = FakeEncoder()
+    else:
+        from local_embedding_retriever import load_embedding_model
+        model = load_embedding_model()
+    model.encode(["warm up"])
+    batched = MicroBatchEncoder(model)
+    batched.encode(["warm up"])
+
+    print(f"{'threads':>8}{'mode':>9}{'queries/s':>11}{'p50 ms':>9}{'p95 ms':>9}")
+    for concurrency in levels:
+        per_thread = max(1, queries // concurrency)
+        for mode, encoder in (("direct", model), ("batched", batched)):
+            throughput, p50, p95 = _run_load(encoder, concurrency, per_thread)
+            print(f"{concurrency:>8}{mode:>9}{throughput:>11.1f}{p50:>9.1f}{p95:>9.1f}")
+    print(batched.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["benchmark"])
+    parser.add_argument("--fake", action="store_true", help="Use a simulated model instead of all-MiniLM-L6-v2")
+    args = parser.parse_args()
+    benchmark(fake=args.fake)
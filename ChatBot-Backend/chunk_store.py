@@ -0,0 +1,205 @@
+import os
+import copy
+import json
+import hashlib
+import threading
+import importlib.util
+from array import array
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# zstd-compress chunk texts in memory (needs the optional zstandard package). Only the
+# few chunks returned by a search are decompressed, so this trades a little CPU for RSS.
+CHUNK_COMPRESSION = os.getenv("CHUNK_COMPRESSION", "none")
+ZSTD_AVAILABLE = importlib.util.find_spec("zstandard") is not None
+ZSTD_LEVEL = 3
+
+DIGEST_SIZE = 20  # sha1
+NO_PAGE = -1
+
+
+def text_digest(text: str) -> bytes:
+    """Content hash of a chunk; keys the embedding cache and the index generation"""
+    return hashlib.sha1(text.encode()).digest()
+
+
+_zstd = threading.local()  # zstd contexts are not thread-safe and cost memory, so one per thread
+
+
+def _compress(text: str) -> bytes:
+    if not hasattr(_zstd, "compressor"):
+        import zstandard
+        _zstd.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    # compress() returns a buffer sized for the worst case; copy it so only the frame stays resident
+    return memoryview(_zstd.compressor.compress(text.encode())).tobytes()
+
+
+def _decompress(data: bytes) -> str:
+    if not hasattr(_zstd, "decompressor"):
+        import zstandard
+        _zstd.decompressor = zstandard.ZstdDecompressor()
+    return _zstd.decompressor.decompress(data).decode()
+
+
+def _document_class():
+    from langchain_core.documents import Document
+    return Document
+
+
+class ChunkStore:
+    """Array-backed chunk storage that builds langchain Documents only on access
+
+    Per chunk it keeps the text (optionally zstd-compressed), an interned source id,
+    the page number, an interned id for the remaining metadata and the text's sha1.
+    Rows are append-only; compact() returns a new store without the dead rows.
+    """
+
+    __slots__ = ("compressed", "_texts", "_source_ids", "_pages", "_meta_ids", "_digests",
+                 "_sources", "_source_index", "_metas", "_meta_index")
+
+    def __init__(self, documents=(), compressed: bool = None):
+        if compressed is None:
+            compressed = CHUNK_COMPRESSION == "zstd"
+        if compressed and not ZSTD_AVAILABLE:
+            print("⚠️ CHUNK_COMPRESSION=zstd needs the zstandard package; storing chunks uncompressed")
+            compressed = False
+        self.compressed = compressed
+        self._texts = []                  # str, or zstd frames when compressed
+        self._source_ids = array("i")
+        self._pages = array("i")
+        self._meta_ids = array("i")
+        self._digests = bytearray()       # DIGEST_SIZE bytes per chunk
+        self._sources = []                # interned source paths
+        self._source_index = {}
+        self._metas = []                  # interned dicts of the other metadata (shared by a file's pages)
+        self._meta_index = {}
+        self.extend(documents)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __getitem__(self, i: int):
+        return self.document(i)
+
+    def __iter__(self) -> Iterator:
+        for i in range(len(self)):
+            yield self.document(i)
+
+    def _intern_source(self, source: str) -> int:
+        source_id = self._source_index.get(source)
+        if source_id is None:
+            source_id = len(self._sources)
+            self._sources.append(source)
+            self._source_index[source] = source_id
+        return source_id
+
+    def _intern_meta(self, meta: Dict) -> int:
+        key = json.dumps(meta, sort_keys=True, default=str)
+        meta_id = self._meta_index.get(key)
+        if meta_id is None:
+            meta_id = len(self._metas)
+            self._metas.append(copy.deepcopy(meta))
+            self._meta_index[key] = meta_id
+        return meta_id
+
+    def _split_metadata(self, metadata: Dict):
+        meta = dict(metadata)
+        source = meta.pop("source", "")
+        page = meta.get("page")
+        if isinstance(page, int) and not isinstance(page, bool) and page >= 0:
+            del meta["page"]
+        else:
+            page = NO_PAGE
+        return self._intern_source(source), page, self._intern_meta(meta)
+
+    def append(self, document):
+        self.add(document.page_content, document.metadata)
+
+    def add(self, text: str, metadata: Dict):
+        """Append one chunk given as plain text and metadata"""
+        source_id, page, meta_id = self._split_metadata(metadata)
+        # Fill the fixed-size arrays first: readers only look at rows below len(self._texts)
+        self._source_ids.append(source_id)
+        self._pages.append(page)
+        self._meta_ids.append(meta_id)
+        self._digests += text_digest(text)
+        self._texts.append(_compress(text) if self.compressed else text)
+
+    def extend(self, documents):
+        for document in documents:
+            self.append(document)
+
+    def text(self, i: int) -> str:
+        stored = self._texts[i]
+        return _decompress(stored) if self.compressed else stored
+
+    def source(self, i: int) -> str:
+        return self._sources[self._source_ids[i]]
+
+    def has_metadata(self, i: int, key: str) -> bool:
+        """Whether row i's extra metadata has key, without building its dict"""
+        return key in self._metas[self._meta_ids[i]]
+
+    def digest(self, i: int) -> bytes:
+        return bytes(self._digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE])
+
+    def metadata(self, i: int) -> Dict:
+        """A fresh metadata dict for row i (changes need set_metadata to stick)"""
+        metadata = {"source": self.source(i)}
+        if self._pages[i] != NO_PAGE:
+            metadata["page"] = self._pages[i]
+        metadata.update(copy.deepcopy(self._metas[self._meta_ids[i]]))
+        return metadata
+
+    def set_metadata(self, i: int, metadata: Dict):
+        source_id, page, meta_id = self._split_metadata(metadata)
+        self._source_ids[i] = source_id
+        self._pages[i] = page
+        self._meta_ids[i] = meta_id
+
+    def document(self, i: int):
+        """Materialize row i as a langchain Document"""
+        return _document_class()(page_content=self.text(i), metadata=self.metadata(i))
+
+    @contextmanager
+    def editing(self):
+        """Indexable view whose Documents' metadata changes are written back on exit"""
+        touched = {}
+
+        class View:
+            def __len__(view):
+                return len(self)
+
+            def __getitem__(view, i):
+                if i not in touched:
+                    touched[i] = self.document(i)
+                return touched[i]
+
+        yield View()
+        for i, document in touched.items():
+            self.set_metadata(i, document.metadata)
+
+    def compact(self, live) -> "ChunkStore":
+        """New store holding only the rows where live is true, without re-compressing"""
+        store = ChunkStore(compressed=self.compressed)
+        for i, alive in enumerate(live):
+            if alive:
+                store.append_row(self, i)
+        return store
+
+    def append_row(self, other: "ChunkStore", i: int):
+        """Append row i of another store with the same compression setting"""
+        self._source_ids.append(self._intern_source(other.source(i)))
+        self._pages.append(other._pages[i])
+        self._meta_ids.append(self._intern_meta(other._metas[other._meta_ids[i]]))
+        self._digests += other.digest(i)
+        self._texts.append(other._texts[i])
+
+    def stats(self) -> Dict:
+        return {
+            "chunks": len(self),
+            "sources": len(self._sources),
+            "metadata_variants": len(self._metas),
+            "text_bytes": sum(len(text) for text in self._texts),
+            "compressed": self.compressed,
+        }
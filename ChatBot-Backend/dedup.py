@@ -0,0 +1,122 @@
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+# Chunks whose estimated Jaccard similarity (over word shingles) reaches this are merged
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 16  # 4 rows per band: near-certain candidate recall at 0.8 similarity
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(42)
+_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.int64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.int64)
+
+
+def shingles(text: str) -> List[str]:
+    """Overlapping word n-grams of the whitespace/case-normalized text"""
+    words = re.sub(r"\s+", " ", text.lower()).strip().split(" ")
+    if len(words) <= SHINGLE_SIZE:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """MinHash signature of a chunk's shingle set"""
+    hashes = np.array([zlib.crc32(s.encode()) % _PRIME for s in set(shingles(text))], dtype=np.int64)
+    # (a * x + b) mod p for every permutation and shingle, then the minimum per permutation
+    return ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1)
+
+
+class NearDuplicateIndex:
+    """LSH buckets over MinHash signatures; positions match the retriever's document list"""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.rows = NUM_PERM // BANDS
+        self.buckets = defaultdict(list)
+        self.signatures = []
+
+    def _band_keys(self, signature):
+        for band in range(BANDS):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, signature: np.ndarray) -> int:
+        position = len(self.signatures)
+        self.signatures.append(signature)
+        for key in self._band_keys(signature):
+            self.buckets[key].append(position)
+        return position
+
+    def find(self, signature: np.ndarray, accept: Optional[Callable[[int], bool]] = None) -> Optional[int]:
+        """Most similar indexed position at or above the threshold, if any"""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+
+        best, best_similarity = None, self.threshold
+        for position in candidates:
+            if accept and not accept(position):
+                continue
+            similarity = float(np.mean(self.signatures[position] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = position, similarity
+        return best
+
+
+def duplicate_entry(doc) -> dict:
+    return {"source": doc.metadata.get("source", ""), "page": doc.metadata.get("page")}
+
+
+def attribute_duplicate(canonical, duplicate):
+    """Record that duplicate's text also appears in canonical, keeping its source for citations"""
+    entries = canonical.metadata.setdefault("duplicate_sources", [])
+    entry = duplicate_entry(duplicate)
+    if entry != duplicate_entry(canonical) and entry not in entries:
+        entries.append(entry)
+    for extra in duplicate.metadata.get("duplicate_sources", []):
+        if extra not in entries:
+            entries.append(extra)
+
+
+def chunk_sources(doc) -> List[str]:
+    """Every file a (possibly merged) chunk appears in"""
+    sources = [doc.metadata.get("source", "")]
+    for entry in doc.metadata.get("duplicate_sources", []):
+        if entry["source"] not in sources:
+            sources.append(entry["source"])
+    return sources
+
+
+def context_text(doc) -> str:
+    """Chunk text for the prompt, naming the other files a merged chunk also appears in"""
+    others = [os.path.basename(source) for source in chunk_sources(doc)[1:]]
+    if not others:
+        return doc.page_content
+    return f"{doc.page_content}\n(Also stated in: {', '.join(others)})"
+
+
+def deduplicate_chunks(chunks: List, index: NearDuplicateIndex, existing: List = (),
+                       accept: Optional[Callable[[int], bool]] = None) -> List:
+    """Return the chunks that are not near-duplicates, adding them to index
+
+    Duplicates are folded into the canonical chunk (from existing or from earlier in
+    chunks) as extra sources. Positions in index are len(existing) + position in the
+    returned list, so callers append the result to existing.
+    """
+    kept = []
+    for chunk in chunks:
+        signature = minhash_signature(chunk.page_content)
+        match = index.find(signature, accept)
+        if match is None:
+            index.add(signature)
+            kept.append(chunk)
+            continue
+        canonical = existing[match] if match < len(existing) else kept[match - len(existing)]
+        attribute_duplicate(canonical, chunk)
+    return kept
@@ -0,0 +1,251 @@
+"""Offline retrieval evaluation: recall@k, MRR and latency per retriever configuration
+
+Runs the labelled questions in retrieval_eval.json ({"question", "sources": [file names]})
+against indexes built from data/ and prints one row per configuration:
+
+    python eval_retrieval.py                                        # current settings, every mode
+    python eval_retrieval.py --chunking 1000:200,500:100,1500:300   # chunk_size:chunk_overlap variants
+    python eval_retrieval.py --cutoffs 0,0.1,0.2,0.3 --dedup both --sharded --json eval.json
+
+A question counts as recalled at k when any of its labelled files is the source of (or a
+merged duplicate in) one of the top k chunks. Many questions list two or three files, so
+strict recall (S@k) only accepts the first listed file, the one that actually answers it.
+MRR uses the rank of the first accepted chunk within the top MRR_DEPTH. Embeddings are built into a scratch cache, so build times are
+cold unless --cache-dir is given. The winning settings map to CHUNK_SIZE, CHUNK_OVERLAP,
+RETRIEVAL_MIN_SIMILARITY, RETRIEVAL_TOP_K, INDEX_DEDUP and SHARDED_INDEX.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from dedup import chunk_sources
+from index_snapshot import LexicalIndex
+from local_embedding_retriever import (
+    CHUNK_OVERLAP, CHUNK_SIZE, INDEX_DEDUP, MIN_SIMILARITY, SUPPORTED_SUFFIXES, TOP_K,
+    LocalEmbeddingRetriever, load_file_chunks, source_name,
+)
+
+EVAL_FILE = "retrieval_eval.json"
+MRR_DEPTH = 10
+# Rows within this much recall@TOP_K of the best are considered equally accurate
+RECALL_TOLERANCE = 0.02
+
+
+class _PageSplitter:
+    """Keeps loader pages whole, so data/ is parsed once and re-split per chunking variant"""
+
+    def split_documents(self, documents):
+        return documents
+
+
+def load_questions(path: str = EVAL_FILE) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    for entry in questions:
+        if not entry.get("question") or not entry.get("sources"):
+            raise ValueError(f"Every entry needs a question and at least one source: {entry}")
+    return questions
+
+
+def load_pages(data_dir: str = "data") -> List:
+    files = [file for suffix in SUPPORTED_SUFFIXES for file in Path(data_dir).glob(f"*{suffix}")]
+    pages = []
+    for file in sorted(files):
+        try:
+            pages.extend(load_file_chunks(file, _PageSplitter()))
+        except Exception as e:
+            print(f"⚠️ Could not load {file.name}: {e}")
+    if not pages:
+        raise ValueError(f"No documents could be loaded from '{data_dir}'.")
+    return pages
+
+
+def check_labels(questions: List[Dict], pages: List):
+    """Warn about labelled files that produced no chunks; no configuration can recall them"""
+    loaded = {os.path.basename(source_name(page)) for page in pages}
+    missing = sorted({source for entry in questions for source in entry["sources"]} - loaded)
+    if missing:
+        print(f"⚠️ {len(missing)} labelled file(s) are not in the index, so recall is capped: {', '.join(missing)}")
+
+
+def split_pages(pages: List, chunk_size: int, chunk_overlap: int) -> List:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_documents(pages)
+
+
+def first_relevant_rank(documents: List, sources: List[str]):
+    """1-based rank of the first chunk from a labelled file, or None"""
+    wanted = {os.path.basename(source) for source in sources}
+    for rank, doc in enumerate(documents, 1):
+        if any(os.path.basename(source) in wanted for source in chunk_sources(doc)):
+            return rank
+    return None
+
+
+def evaluate(search: Callable[[str, int], List], questions: List[Dict], ks: List[int]) -> Dict:
+    """Recall@k, MRR and per-query latency of search(question, depth) over the labelled set"""
+    depth = max(max(ks), MRR_DEPTH)
+    search(questions[0]["question"], depth)  # warm-up, not timed
+    ranks, strict_ranks, latencies, misses = [], [], [], []
+    for entry in questions:
+        start = time.perf_counter()
+        documents = search(entry["question"], depth)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rank = first_relevant_rank(documents, entry["sources"])
+        ranks.append(rank)
+        strict_ranks.append(first_relevant_rank(documents, entry["sources"][:1]))
+        if rank is None or rank > max(ks):
+            misses.append(entry["question"])
+
+    def recall(found, k):
+        return round(sum(1 for rank in found if rank and rank <= k) / len(found), 3)
+
+    return {
+        **{f"recall@{k}": recall(ranks, k) for k in ks},
+        **{f"strict_recall@{k}": recall(strict_ranks, k) for k in ks},
+        "mrr": round(sum(1.0 / rank for rank in ranks if rank) / len(ranks), 3),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "misses": misses,
+    }
+
+
+def index_size(retrievers: List[LocalEmbeddingRetriever]) -> Dict:
+    """Chunk count and in-memory bytes of the texts and embedding matrices"""
+    chunks = sum(len(retriever.documents) for retriever in retrievers)
+    text_bytes = sum(retriever.documents.stats()["text_bytes"] for retriever in retrievers)
+    vector_bytes = sum(getattr(retriever, "document_embeddings", np.empty(0)).nbytes
+                       for retriever in retrievers if retriever.use_embeddings)
+    return {"chunks": chunks, "index_mb": round((text_bytes + vector_bytes) / 1e6, 2)}
+
+
+def run(questions: List[Dict], chunkings: List[tuple], cutoffs: List[float], dedup_modes: List[bool],
+        sharded: bool, ks: List[int], cache_dir: str) -> List[Dict]:
+    print(f"🔄 Parsing data/ once for {len(chunkings)} chunking variant(s)...")
+    pages = load_pages()
+    check_labels(questions, pages)
+    rows = []
+
+    def add_row(config, mode, build_seconds, size, search):
+        metrics = evaluate(search, questions, ks)
+        row = {"config": config, "mode": mode, **size, "build_s": round(build_seconds, 2), **metrics}
+        rows.append(row)
+        print(f"   {mode:<22} recall@{ks[-1]}={metrics[f'recall@{ks[-1]}']:.2f}  "
+              f"strict={metrics[f'strict_recall@{ks[-1]}']:.2f}  mrr={metrics['mrr']:.2f}  "
+              f"p50={metrics['latency_p50_ms']:.1f}ms")
+
+    for chunk_size, chunk_overlap in chunkings:
+        chunks = split_pages(pages, chunk_size, chunk_overlap)
+        for dedup in dedup_modes:
+            config = f"{chunk_size}:{chunk_overlap}{' dedup' if dedup else ''}"
+            print(f"📚 {config}: {len(chunks)} chunks before dedup")
+            cache_file = os.path.join(cache_dir, f"{chunk_size}-{chunk_overlap}-{int(dedup)}.pkl")
+            start = time.perf_counter()
+            retriever = LocalEmbeddingRetriever(chunks, deduplicate=dedup, embeddings_cache_file=cache_file)
+            build_seconds = time.perf_counter() - start
+            size = index_size([retriever])
+
+            if retriever.use_embeddings:
+                encode = retriever.embedding_model.encode
+                for cutoff in cutoffs:
+                    add_row(config, f"embedding >{cutoff:g}", build_seconds, size,
+                            lambda q, depth, cutoff=cutoff: [doc for _, doc in retriever.search_by_vector(
+                                encode([q])[0], depth, cutoff)])
+
+            add_row(config, "keyword", build_seconds, size,
+                    lambda q, depth: [doc for _, doc in retriever.search_by_keywords(q, depth)])
+
+            start = time.perf_counter()
+            retriever.lexical_index = LexicalIndex.build(retriever.documents)
+            lexical_seconds = time.perf_counter() - start
+            add_row(config, "keyword+lexical", build_seconds + lexical_seconds, size,
+                    lambda q, depth: [doc for _, doc in retriever.search_by_keywords(q, depth)])
+            retriever.lexical_index = None
+
+            if sharded and retriever.use_embeddings:
+                from sharded_retriever import ShardedRetriever, collection_for, load_collection_tags
+                tags = load_collection_tags()
+                grouped = {}
+                for chunk in chunks:
+                    grouped.setdefault(collection_for(source_name(chunk), tags), []).append(chunk)
+                start = time.perf_counter()
+                shards = {name: LocalEmbeddingRetriever(
+                              group, deduplicate=dedup,
+                              embeddings_cache_file=os.path.join(cache_dir, f"{chunk_size}-{chunk_overlap}-{int(dedup)}-{name}.pkl"))
+                          for name, group in grouped.items()}
+                sharded_retriever = ShardedRetriever(shards)
+                shard_build_seconds = time.perf_counter() - start
+                for cutoff in cutoffs:
+                    add_row(config, f"sharded >{cutoff:g}", shard_build_seconds, index_size(list(shards.values())),
+                            lambda q, depth, cutoff=cutoff: sharded_retriever.get_relevant_documents(q, depth, cutoff))
+    return rows
+
+
+def print_report(rows: List[Dict], ks: List[int]):
+    recall_key = f"recall@{TOP_K}" if TOP_K in ks else f"recall@{ks[-1]}"
+    best_recall = max(row[recall_key] for row in rows)
+    # Fastest configuration that keeps accuracy within tolerance of the best
+    accurate = [row for row in rows if row[recall_key] >= best_recall - RECALL_TOLERANCE]
+    pick = min(accurate, key=lambda row: row["latency_p95_ms"])
+
+    header = (f"{'config':<16}{'mode':<22}" + "".join(f"{'R@' + str(k):>7}" for k in ks) +
+              "".join(f"{'S@' + str(k):>7}" for k in ks) +
+              f"{'MRR':>7}{'chunks':>8}{'MB':>8}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    print("\n" + header)
+    print("-" * len(header))
+    for row in rows:
+        marker = " ◀" if row is pick else ""
+        print(f"{row['config']:<16}{row['mode']:<22}" + "".join(f"{row[f'recall@{k}']:>7.2f}" for k in ks) +
+              "".join(f"{row[f'strict_recall@{k}']:>7.2f}" for k in ks) +
+              f"{row['mrr']:>7.2f}{row['chunks']:>8}{row['index_mb']:>8.1f}{row['build_s']:>9.1f}"
+              f"{row['latency_p50_ms']:>9.1f}{row['latency_p95_ms']:>9.1f}{marker}")
+    print(f"\n◀ fastest p95 with {recall_key} within {RECALL_TOLERANCE} of the best ({best_recall:.2f})")
+    print("   R@k accepts any labelled file, S@k only the first one listed")
+    if pick["misses"]:
+        print(f"   Not recalled in the top {ks[-1]} by that configuration:")
+        for question in pick["misses"]:
+            print(f"   - {question}")
+
+
+def _floats(text: str) -> List[float]:
+    return [float(value) for value in text.split(",") if value.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=EVAL_FILE, help="Labelled question set (JSON)")
+    parser.add_argument("--chunking", default=f"{CHUNK_SIZE}:{CHUNK_OVERLAP}",
+                        help="Comma-separated chunk_size:chunk_overlap pairs")
+    parser.add_argument("--cutoffs", default=f"{MIN_SIMILARITY:g}", help="Comma-separated similarity cutoffs")
+    parser.add_argument("--k", default="1,3,5", help="Comma-separated k values for recall@k")
+    parser.add_argument("--dedup", choices=["on", "off", "both"], default="on" if INDEX_DEDUP else "off")
+    parser.add_argument("--sharded", action="store_true", help="Also evaluate per-collection shards")
+    parser.add_argument("--cache-dir", help="Reuse embedding caches between runs (build times are then warm)")
+    parser.add_argument("--json", help="Also write every row to this file")
+    args = parser.parse_args()
+
+    chunkings = [tuple(int(part) for part in pair.split(":")) for pair in args.chunking.split(",") if pair.strip()]
+    dedup_modes = {"on": [True], "off": [False], "both": [False, True]}[args.dedup]
+    ks = sorted(int(k) for k in _floats(args.k))
+    questions = load_questions(args.questions)
+
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="retrieval-eval-")
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        rows = run(questions, chunkings, _floats(args.cutoffs), dedup_modes, args.sharded, ks, cache_dir)
+    finally:
+        if not args.cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print_report(rows, ks)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"✅ Wrote {len(rows)} rows to {args.json}")
@@ -0,0 +1,52 @@
+# Gunicorn settings for multi-worker deployments.
+#
+#   gunicorn -c gunicorn.conf.py integrated_backend:app
+#
+# The app is preloaded in the master process, so the embedding model, chunk list and
+# embedding matrix are loaded once and shared copy-on-write with every forked worker
+# instead of each worker loading its own copy.
+import gc
+import os
+
+bind = os.getenv("NEXBOT_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("NEXBOT_WORKERS", "4"))
+# More threads than ADMISSION_MAX_INFLIGHT: queued requests wait on a thread, and a text
+# request must be able to reach the admission queue while avatar requests are waiting
+threads = int(os.getenv("NEXBOT_THREADS", "16"))
+worker_class = "gthread"
+timeout = 120
+
+preload_app = True
+
+# Background warm-up threads do not survive fork, so the master must load synchronously
+os.environ["NEXBOT_LAZY_STARTUP"] = "0"
+# ...and the app leaves its sweeper/poller threads to post_fork
+os.environ["NEXBOT_PRELOADED"] = "1"
+
+# Keep torch single-threaded in the master: an OpenMP pool created before fork can
+# deadlock in the children. Workers raise their own thread count in post_fork.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+TORCH_THREADS_PER_WORKER = int(os.getenv("NEXBOT_TORCH_THREADS", "1"))
+
+# No collections while the master loads: gc would touch every object header and
+# dirty pages the workers are meant to share
+gc.disable()
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far into the permanent generation so the
+    # workers' collector never writes to the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    try:
+        import torch
+        torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+    except ImportError:
+        pass
+    # Threads do not survive fork: start the audio/session sweepers and snapshot poller here
+    import integrated_backend
+    integrated_backend.start_background_threads()
+    server.log.info(f"Worker {worker.pid} forked with shared QA index")
@@ -0,0 +1,312 @@
+"""Versioned, checksummed index snapshots for multi-node deployment
+
+On the build node (parses data/, embeds, writes index_snapshots/<version>/):
+    python index_snapshot.py build
+    python index_snapshot.py list
+    python index_snapshot.py verify [version]
+
+Serving nodes start with INDEX_SNAPSHOT_DIR=index_snapshots. They load the version
+named in index_snapshots/CURRENT read-only, with the vectors memory-mapped, and reload
+when CURRENT changes. Copy the directory between nodes with rsync or shared storage.
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from chunk_store import ChunkStore
+from local_embedding_retriever import EMBEDDING_RUNTIME, LocalEmbeddingRetriever, SUPPORTED_SUFFIXES
+
+SNAPSHOT_FORMAT = 1
+DEFAULT_SNAPSHOT_DIR = "index_snapshots"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.jsonl.gz"
+VECTORS_FILE = "vectors.npy"
+LEXICAL_FILE = "lexical.json.gz"
+SNAPSHOTS_TO_KEEP = int(os.getenv("INDEX_SNAPSHOTS_TO_KEEP", "3"))
+SNAPSHOT_POLL_SECONDS = int(os.getenv("INDEX_SNAPSHOT_POLL_SECONDS", "30"))
+
+_token_re = re.compile(r"[a-z0-9]+")
+# Query words too common to narrow the keyword search's candidate rows
+CANDIDATE_STOPWORDS = {
+    "the", "and", "for", "are", "was", "what", "which", "who", "how", "can", "does", "with",
+    "about", "from", "this", "that", "there", "any", "all", "get", "will", "should", "tell",
+}
+MIN_CANDIDATE_WORD_LENGTH = 3
+MAX_CACHED_EXPANSIONS = 4096
+
+
+class LexicalIndex:
+    """Inverted index from lowercase word to the rows containing it"""
+
+    def __init__(self, postings: Dict[str, np.ndarray]):
+        self.postings = postings
+        self._source_rows = None  # lowercase source path -> rows, built on first use
+        self._expansions = {}  # query word -> indexed words containing it
+
+    @classmethod
+    def build(cls, documents: ChunkStore) -> "LexicalIndex":
+        postings = defaultdict(list)
+        for i in range(len(documents)):
+            for token in set(_token_re.findall(documents.text(i).lower())):
+                postings[token].append(i)
+        return cls({token: np.array(rows, dtype=np.int32) for token, rows in postings.items()})
+
+    def _containing(self, word: str) -> List[str]:
+        """Indexed words that contain word, as the keyword scorer's substring test would match"""
+        words = self._expansions.get(word)
+        if words is None:
+            words = [token for token in self.postings if word in token]
+            if len(self._expansions) >= MAX_CACHED_EXPANSIONS:
+                self._expansions.clear()
+            self._expansions[word] = words
+        return words
+
+    def candidates(self, query_lower: str, documents: ChunkStore) -> Optional[Set[int]]:
+        """Rows that can score on a query word (e.g. "waiver" in "waivers") or whose file name contains one
+
+        Stopwords are skipped since nearly every chunk contains them; None means the query
+        has no other words and every row has to be scored.
+        """
+        words = {word for word in _token_re.findall(query_lower)
+                 if len(word) >= MIN_CANDIDATE_WORD_LENGTH and word not in CANDIDATE_STOPWORDS}
+        if not words:
+            return None
+        rows = set()
+        for word in words:
+            for token in self._containing(word):
+                rows.update(self.postings[token].tolist())
+        if self._source_rows is None:
+            source_rows = defaultdict(list)
+            for i in range(len(documents)):
+                source_rows[documents.source(i).lower()].append(i)
+            self._source_rows = source_rows
+        for source, source_rows in self._source_rows.items():
+            if any(word in source for word in words):
+                rows.update(source_rows)
+        return rows
+
+    def to_json(self) -> Dict:
+        return {token: rows.tolist() for token, rows in self.postings.items()}
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "LexicalIndex":
+        return cls({token: np.array(rows, dtype=np.int32) for token, rows in data.items()})
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_current(snapshot_dir: str) -> Optional[str]:
+    path = os.path.join(snapshot_dir, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return f.read().strip() or None
+
+
+def write_snapshot(retriever: LocalEmbeddingRetriever, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR,
+                   source_files=()) -> str:
+    """Write the retriever's live chunks, vectors and lexical index as a new version"""
+    documents, embeddings, live = retriever._snapshot()
+    store = documents.compact(live)
+    generation = retriever.generation()
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{generation[:8]}"
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tmp_dir = os.path.join(snapshot_dir, f".{version}.tmp")
+    os.makedirs(tmp_dir)
+
+    with gzip.open(os.path.join(tmp_dir, CHUNKS_FILE), "wt", encoding="utf-8") as f:
+        for i in range(len(store)):
+            f.write(json.dumps({"text": store.text(i), "metadata": store.metadata(i)}, default=str) + "\n")
+    files = [CHUNKS_FILE]
+
+    if retriever.use_embeddings and embeddings is not None:
+        np.save(os.path.join(tmp_dir, VECTORS_FILE), np.ascontiguousarray(embeddings[live], dtype=np.float32))
+        files.append(VECTORS_FILE)
+
+    with gzip.open(os.path.join(tmp_dir, LEXICAL_FILE), "wt", encoding="utf-8") as f:
+        json.dump(LexicalIndex.build(store).to_json(), f)
+    files.append(LEXICAL_FILE)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "generation": generation,
+        "created_at": time.time(),
+        "chunks": len(store),
+        "embedding_runtime": EMBEDDING_RUNTIME if VECTORS_FILE in files else None,
+        "dimension": int(embeddings.shape[1]) if VECTORS_FILE in files else None,
+        "sources": {os.path.basename(path): _sha256(path) for path in source_files},
+        "files": {name: _sha256(os.path.join(tmp_dir, name)) for name in files},
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Publish atomically: the version directory first, then the CURRENT pointer
+    os.replace(tmp_dir, os.path.join(snapshot_dir, version))
+    pointer_tmp = os.path.join(snapshot_dir, f".{CURRENT_FILE}.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(snapshot_dir, CURRENT_FILE))
+    _prune(snapshot_dir, version)
+    return version
+
+
+def _prune(snapshot_dir: str, current: str):
+    """Keep the newest SNAPSHOTS_TO_KEEP versions (never the current one)"""
+    versions = sorted(name for name in os.listdir(snapshot_dir)
+                      if not name.startswith(".") and os.path.isdir(os.path.join(snapshot_dir, name)))
+    for version in versions[:-SNAPSHOTS_TO_KEEP]:
+        if version != current:
+            shutil.rmtree(os.path.join(snapshot_dir, version), ignore_errors=True)
+
+
+def verify_snapshot(path: str) -> Dict:
+    """Manifest of a snapshot directory, after checking every file's checksum"""
+    with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')}")
+    for name, checksum in manifest["files"].items():
+        if _sha256(os.path.join(path, name)) != checksum:
+            raise ValueError(f"Checksum mismatch for {name} in snapshot {manifest['version']}")
+    return manifest
+
+
+def load_snapshot(path: str) -> LocalEmbeddingRetriever:
+    """Read-only retriever over a verified snapshot; vectors stay memory-mapped"""
+    manifest = verify_snapshot(path)
+
+    store = ChunkStore()
+    with gzip.open(os.path.join(path, CHUNKS_FILE), "rt", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            store.add(row["text"], row["metadata"])
+
+    embeddings = None
+    if VECTORS_FILE in manifest["files"]:
+        if manifest["embedding_runtime"] != EMBEDDING_RUNTIME:
+            print(f"⚠️ Snapshot vectors were built with {manifest['embedding_runtime']}, this node uses "
+                  f"{EMBEDDING_RUNTIME}; serving keyword search only")
+        else:
+            # Page cache backed and shared by every worker on the node
+            embeddings = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+
+    with gzip.open(os.path.join(path, LEXICAL_FILE), "rt", encoding="utf-8") as f:
+        lexical_index = LexicalIndex.from_json(json.load(f))
+
+    retriever = LocalEmbeddingRetriever.from_snapshot(store, embeddings, lexical_index)
+    retriever.snapshot_version = manifest["version"]
+    print(f"📦 Loaded index snapshot {manifest['version']}: {manifest['chunks']} chunks")
+    return retriever
+
+
+def load_current_snapshot(snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> LocalEmbeddingRetriever:
+    version = read_current(snapshot_dir)
+    if version is None:
+        raise ValueError(f"No index snapshot in '{snapshot_dir}'. Build one with: python index_snapshot.py build")
+    return load_snapshot(os.path.join(snapshot_dir, version))
+
+
+class SnapshotWatcher:
+    """Polls CURRENT and hands a newly published snapshot to on_load"""
+
+    def __init__(self, snapshot_dir: str, get_version: Callable[[], Optional[str]],
+                 on_load: Callable[[LocalEmbeddingRetriever], None], interval: int = SNAPSHOT_POLL_SECONDS):
+        self.snapshot_dir = snapshot_dir
+        self.get_version = get_version
+        self.on_load = on_load
+        self.interval = interval
+        self.last_error = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="snapshot-watcher", daemon=True)
+            self._thread.start()
+
+    def check(self) -> bool:
+        """Load the published version if it differs from the served one"""
+        version = read_current(self.snapshot_dir)
+        served = self.get_version()
+        # Nothing published yet, or the published version is already live. Nothing served
+        # means this node started before the first snapshot was published (or is still warming up)
+        if version is None or version == served:
+            return False
+        try:
+            retriever = load_snapshot(os.path.join(self.snapshot_dir, version))
+        except Exception as e:
+            # Keep serving the previous version; a half-copied snapshot fails its checksums
+            self.last_error = f"{version}: {e}"
+            print(f"⚠️ Could not load index snapshot {version}: {e}")
+            return False
+        self.last_error = None
+        self.on_load(retriever)
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠️ Snapshot watcher error: {e}")
+
+
+def build(snapshot_dir: str = DEFAULT_SNAPSHOT_DIR) -> str:
+    """Parse and embed data/ and publish the result as a new snapshot version"""
+    from pathlib import Path
+    from local_embedding_retriever import build_retriever
+
+    retriever = build_retriever()
+    source_files = sorted(str(file) for suffix in SUPPORTED_SUFFIXES for file in Path("data").glob(f"*{suffix}"))
+    version = write_snapshot(retriever, snapshot_dir, source_files)
+    print(f"✅ Published index snapshot {version} in {snapshot_dir}")
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build", "list", "verify"])
+    parser.add_argument("version", nargs="?", help="Snapshot version for verify (default: CURRENT)")
+    parser.add_argument("--dir", default=os.getenv("INDEX_SNAPSHOT_DIR") or DEFAULT_SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.dir)
+    elif args.command == "list":
+        current = read_current(args.dir)
+        for name in sorted(os.listdir(args.dir)) if os.path.isdir(args.dir) else []:
+            manifest_path = os.path.join(args.dir, name, MANIFEST_FILE)
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                marker = "*" if name == current else " "
+                print(f"{marker} {name}  {manifest['chunks']} chunks  {len(manifest['sources'])} files")
+    else:
+        version = args.version or read_current(args.dir)
+        if version is None:
+            sys.exit(f"No snapshot in {args.dir}")
+        try:
+            manifest = verify_snapshot(os.path.join(args.dir, version))
+        except (OSError, ValueError) as e:
+            sys.exit(f"❌ {e}")
+        print(f"✅ Snapshot {version} is intact ({manifest['chunks']} chunks)")
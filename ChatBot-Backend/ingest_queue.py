@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import uuid
+import queue
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional
+
+from local_embedding_retriever import load_file_chunks
+
+# How many finished jobs to keep for the status endpoint
+MAX_JOB_HISTORY = 100
+
+# Every gunicorn worker holds its own copy of the index: each one appends the changes it
+# makes here, and replays the other workers' changes into its own copy
+CHANGE_LOG_FILE = os.getenv("INDEX_CHANGE_LOG", os.path.join("indexes", "changes.log"))
+CHANGE_POLL_SECONDS = 2
+
+
+class IndexingQueue:
+    """Single background worker that adds or tombstones one file at a time in the live index"""
+
+    def __init__(self, get_retriever: Callable[[], Optional[object]], data_folder: str = "data",
+                 change_log: Optional[str] = CHANGE_LOG_FILE, reload_index: Optional[Callable[[], None]] = None):
+        # The QA chain can be rebuilt, so always look the current retriever up at run time
+        self.get_retriever = get_retriever
+        # Replays a full rebuild made by another worker
+        self.reload_index = reload_index
+        self.data_folder = data_folder
+        self.change_log = change_log
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = Lock()
+        self._worker = None
+        self._log_offset = 0
+        if change_log:
+            os.makedirs(os.path.dirname(change_log) or ".", exist_ok=True)
+            # Create this before the index is built from data/: earlier changes are already in it
+            self._log_offset = self._log_size()
+
+    def start(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = Thread(target=self._run, name="index-ingest", daemon=True)
+            self._worker.start()
+
+    def enqueue_add(self, path: str) -> str:
+        """Parse, chunk and embed one file, replacing any chunks it already has in the index"""
+        return self._enqueue("add", path)
+
+    def enqueue_delete(self, path: str) -> str:
+        """Tombstone every chunk of one file"""
+        return self._enqueue("delete", path)
+
+    def _enqueue(self, action: str, path: str) -> str:
+        job = self._new_job(action, os.path.basename(path))
+        self._queue.put((job["id"], path))
+        self.start()
+        return job["id"]
+
+    def record_rebuild(self, collection: Optional[str] = None):
+        """Have the other workers repeat a rebuild (of one collection, or everything) this one just did"""
+        self._log_change({"action": "rebuild", "collection": collection})
+
+    def _new_job(self, action: str, filename: Optional[str], replayed: bool = False,
+                 collection: Optional[str] = None) -> Dict:
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "action": action,
+            "file": filename,
+            "collection": collection,
+            "state": "queued",
+            "chunks": 0,
+            "error": None,
+            "replayed": replayed,
+            "queued_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > MAX_JOB_HISTORY:
+                self._jobs.popitem(last=False)
+        return job
+
+    def _update(self, job: Dict, **fields):
+        # Readers copy jobs under the lock, so never let them see a half-updated one
+        with self._lock:
+            job.update(fields)
+
+    def _run(self):
+        while True:
+            self._replay_changes()
+            try:
+                job_id, path = self._queue.get(timeout=CHANGE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is not None and self._execute(job, path):
+                self._log_change({"action": job["action"], "file": job["file"]})
+
+    def _execute(self, job: Dict, path: Optional[str]) -> bool:
+        self._update(job, state="running")
+        try:
+            chunks = self._process(job, path)
+            self._update(job, chunks=chunks, state="done", finished_at=time.time())
+            print(f"✅ Indexed {job['action']} of {job['file'] or job['collection'] or 'all files'}: {chunks} chunks")
+            return True
+        except Exception as e:
+            self._update(job, state="failed", error=str(e), finished_at=time.time())
+            print(f"⚠️ Indexing {job['action']} of {job['file'] or job['collection'] or 'all files'} failed: {e}")
+            return False
+
+    def _log_size(self) -> int:
+        try:
+            return os.path.getsize(self.change_log)
+        except FileNotFoundError:
+            return 0
+
+    def _log_change(self, entry: Dict):
+        """Append a finished change for the other workers; small appends are atomic"""
+        if not self.change_log:
+            return
+        try:
+            with open(self.change_log, "a") as f:
+                f.write(json.dumps({**entry, "pid": os.getpid(), "at": time.time()}) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not record index change for other workers: {e}")
+
+    def _replay_changes(self):
+        """Apply changes logged by other workers since the last check, in order"""
+        if not self.change_log:
+            return
+        size = self._log_size()
+        if size <= self._log_offset:
+            return
+        with open(self.change_log, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read(size - self._log_offset)
+        # A line another worker is still writing waits for the next poll
+        complete = data.rfind(b"\n") + 1
+        self._log_offset += complete
+
+        for line in data[:complete].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("pid") == os.getpid():
+                continue  # Already applied when it was made
+            filename = entry.get("file")
+            job = self._new_job(entry["action"], filename, replayed=True, collection=entry.get("collection"))
+            self._execute(job, os.path.join(self.data_folder, filename) if filename else None)
+
+    def _process(self, job: Dict, path: Optional[str]) -> int:
+        action = job["action"]
+        if action == "rebuild" and not job["collection"]:
+            if self.reload_index is None:
+                raise RuntimeError("No way to reload the index in this process")
+            self.reload_index()
+            return 0
+
+        retriever = self.get_retriever()
+        if retriever is None:
+            raise RuntimeError("QA system is not loaded yet; the file will be picked up by the next rebuild")
+
+        if action == "rebuild":
+            if not hasattr(retriever, "rebuild_collection"):
+                raise RuntimeError("The index is not sharded by collection")
+            # The worker that rebuilt it already wrote the fresh embeddings cache
+            return retriever.rebuild_collection(job["collection"], reuse_cache=True)
+
+        filename = os.path.basename(path)
+        if action == "delete":
+            return retriever.remove_source(filename)
+
+        # Parse first so a broken upload leaves the previous version searchable
+        chunks = load_file_chunks(Path(path))
+        retriever.remove_source(filename)
+        return retriever.add_documents(chunks)
+
+    def job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def jobs(self) -> List[Dict]:
+        """Most recent jobs first"""
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())]
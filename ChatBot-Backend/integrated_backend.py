@@ -1,16 +1,17 @@
 import os
+import math
 import json
 import base64
 import subprocess
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_file
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_from_directory, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 import warnings
 warnings.filterwarnings("ignore")
 import time
-from threading import Lock
+from threading import Lock, Thread, get_ident
 from functools import wraps
 from io import BytesIO
 
@@ -25,7 +26,21 @@ MIN_API_INTERVAL = 3  # 3 seconds between API calls
 # Import your existing retriever
 import sys
 sys.path.append('ChatBot-Backend')
-from local_embedding_retriever import get_qa_chain, build_retriever, rebuild_embeddings_cache
+from local_embedding_retriever import (
+    get_qa_chain, build_retriever, rebuild_embeddings_cache, is_error_answer, INDEX_SNAPSHOT_DIR, SUPPORTED_SUFFIXES,
+)
+from intent_router import IntentRouter
+from audio_store import AudioArtifactStore
+from ingest_queue import IndexingQueue, CHANGE_LOG_FILE
+from sharded_retriever import set_collection_tag
+from session_store import SessionStore
+from sampling_profiler import SamplingProfiler, PROFILE_DIR, MAX_PROFILE_SECONDS
+from answer_store import AnswerStore
+from batching_encoder import MicroBatchEncoder
+from index_snapshot import SnapshotWatcher
+from tts_queue import TTSQueue, TTS_ASYNC
+from speech import clean_text_for_tts, generate_audio_with_voice_variants, generate_simple_lipsync
+from admission import AdmissionController, Overloaded
 
 # Rate limiting decorator
 def rate_limit_api(func):
@@ -54,14 +69,14 @@ def rate_limit_api(func):
 
     return wrapper
 
-def call_qa_chain_safely(qa_chain, question):
+def call_qa_chain_safely(qa_chain, question, history="", search_query=None):
     """Safely call QA chain without rate limiting"""
     if not qa_chain:
-        return "Policy assistant is currently unavailable."
+        return unavailable_message()
 
     # Check if qa_chain is a function or has an invoke method
     if callable(qa_chain):
-        return qa_chain(question)
+        return qa_chain(question, history=history, search_query=search_query)
     elif hasattr(qa_chain, 'invoke'):
         return qa_chain.invoke(question)
     else:
@@ -77,15 +92,6 @@ except ImportError:
 
 # TTS will use gTTS only for better web audio compatibility
 
-# Rate limiting imports
-import time
-from threading import Lock
-
-# Rate limiting variables
-last_request_time = 0
-request_lock = Lock()
-MIN_REQUEST_INTERVAL = 3  # 3 seconds between requests
-
 # Set environment variables
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
@@ -94,37 +100,195 @@ app.secret_key = "your_secret_key_here"
 CORS(app)  # Enable CORS for 3D frontend
 
 UPLOAD_FOLDER = "data"
-ALLOWED_EXTENSIONS = {'pdf', 'docx', 'xlsx', 'txt'}
+# Only what load_file_chunks can index, so an accepted upload never fails in the ingest queue
+ALLOWED_EXTENSIONS = {suffix.lstrip('.') for suffix in SUPPORTED_SUFFIXES}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Audio storage
+# Audio storage: generated files go to audios/generated, bounded by AUDIO_STORE_MAX_MB and AUDIO_STORE_TTL_SECONDS
 AUDIO_FOLDER = "audios"
 os.makedirs(AUDIO_FOLDER, exist_ok=True)
+audio_store = AudioArtifactStore(AUDIO_FOLDER)
+
+# Multi-turn chat sessions: bounded by SESSION_TTL_SECONDS, MAX_SESSIONS and SESSION_RECENT_TURNS
+sessions = SessionStore()
+
+# Admission control: per-lane concurrency limits and bounded queues, text ahead of avatar
+# ahead of batch traffic; overflow gets a fast 503 with Retry-After (see admission.py)
+admission = AdmissionController()
+BUSY_MESSAGE = "NexBot is handling a lot of questions right now. Please try again in a few seconds."
+
+def admitted(lane):
+    """Run the route in an admission lane, answering 503 when the lane is overloaded"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.method == 'OPTIONS':
+                return func(*args, **kwargs)
+            try:
+                with admission.admit(lane):
+                    return func(*args, **kwargs)
+            except Overloaded as e:
+                print(f"🚦 Shed {request.path} ({e.reason}), retry after {e.retry_after}s")
+                response = jsonify({'error': 'overloaded', 'message': BUSY_MESSAGE, 'response': BUSY_MESSAGE,
+                                    'answer': BUSY_MESSAGE, 'retry_after': e.retry_after})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+        return wrapper
+    return decorator
+
+# Sampling profiler: admins (or callers with X-Profile-Token = PROFILER_TOKEN) can profile
+# one request with ?profile=1 / "X-Profile: 1", or every thread for a time window
+profiler = SamplingProfiler()
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+
+def profiling_allowed():
+    if "admin" in session:
+        return True
+    return bool(PROFILER_TOKEN) and request.headers.get("X-Profile-Token") == PROFILER_TOKEN
+
+@app.before_request
+def start_request_profile():
+    if request.args.get("profile") == "1" or request.headers.get("X-Profile") == "1":
+        if profiling_allowed():
+            g.profile_id = profiler.start(f"{request.method} {request.path}", thread_id=get_ident())
+
+@app.after_request
+def finish_request_profile(response):
+    profile_id = g.pop("profile_id", None)
+    if profile_id:
+        summary = profiler.stop(profile_id)
+        if summary:
+            response.headers["X-Profile-Id"] = summary["id"]
+            response.headers["Access-Control-Expose-Headers"] = "X-Profile-Id"
+    return response
+
+@app.teardown_request
+def discard_request_profile(error=None):
+    # The request failed before after_request ran; still save what was sampled
+    profile_id = g.pop("profile_id", None)
+    if profile_id:
+        profiler.stop(profile_id)
+
+def answer_in_session(session_id, message):
+    """Answer a message with its session's compact history and record the turn"""
+    search_query, history = sessions.context(session_id, message)
+    if search_query != message:
+        print(f"🔁 Follow-up rewritten for retrieval: {search_query[:80]}")
+    answer = call_qa_chain_safely(qa_chain, message, history=history, search_query=search_query)
+    # Busy and error replies say nothing about the topic, so they stay out of the history
+    if qa_chain and not is_error_answer(answer):
+        sessions.record(session_id, message, answer, search_query=search_query)
+    return answer
+
+# Answers, audio and lipsync pre-generated offline by `python answer_store.py build`
+answer_store = AnswerStore()
+
+def stored_answer(message, session_id=None):
+    """Pre-generated entry for a standalone question; follow-ups need the live chain"""
+    if qa_chain is None:
+        return None
+    if session_id and sessions.context(session_id, message)[0] != message:
+        return None
+    entry = answer_store.lookup(message, getattr(qa_chain, 'retriever', None))
+    if entry:
+        print(f"📦 Pre-generated answer ({entry['score']:.2f}): {entry['question'][:50]}")
+        if session_id:
+            sessions.record(session_id, message, entry['answer'])
+    return entry
+
+# Startup mode: with NEXBOT_LAZY_STARTUP=1 the server binds immediately and the
+# QA chain (corpus parsing, embedding model, Gemini client) is built in the background.
+LAZY_STARTUP = os.getenv("NEXBOT_LAZY_STARTUP", "0") == "1"
 
 # Initialize QA chain
 qa_chain = None
-try:
+qa_status = {"state": "starting", "error": None, "started_at": time.time(), "ready_at": None}
+_warmup_lock = Lock()
+
+def warm_up_qa_chain(retriever=None):
+    """Build the QA chain once (around retriever, if given); later calls return the existing chain"""
+    global qa_chain
+    with _warmup_lock:
+        if qa_chain is not None:
+            return qa_chain
+        qa_status["state"] = "loading"
+        try:
+            qa_chain = get_qa_chain(retriever)
+            qa_status.update(state="ready", error=None, ready_at=time.time())
+            print("✅ Policy QA system initialized successfully!")
+        except Exception as e:
+            qa_status.update(state="failed", error=str(e))
+            print(f"⚠️ Failed to initialize QA system: {e}")
+    return qa_chain
+
+def reload_qa_chain():
+    """Rebuild the QA chain from data/, reusing whatever embeddings are cached"""
+    global qa_chain
     qa_chain = get_qa_chain()
-    print("✅ Policy QA system initialized successfully!")
-except Exception as e:
-    print(f"⚠️ Failed to initialize QA system: {e}")
+    qa_status.update(state="ready", error=None, ready_at=time.time())
+
+# Uploads and deletions update the live index in the background, one file at a time. Set up
+# before the index is built, so changes other workers log from here on are replayed into it
+ingest_queue = IndexingQueue(lambda: getattr(qa_chain, 'retriever', None), UPLOAD_FOLDER,
+                             change_log=None if INDEX_SNAPSHOT_DIR else CHANGE_LOG_FILE,
+                             reload_index=reload_qa_chain)
+
+if LAZY_STARTUP:
+    print("🚀 Lazy startup: warming up the QA system in the background...")
+    Thread(target=warm_up_qa_chain, name="qa-warmup", daemon=True).start()
+else:
+    warm_up_qa_chain()
+
+def unavailable_message():
+    """Message for requests that arrive before the QA chain is usable"""
+    if qa_status["state"] in ("starting", "loading"):
+        return "The policy assistant is still starting up. Please try again in a few seconds."
+    return "Policy system not available. Please contact administrator."
+
+# With INDEX_SNAPSHOT_DIR set, this node serves a prebuilt snapshot and swaps in newer
+# versions as they are published (see index_snapshot.py)
+def swap_retriever(retriever):
+    if qa_chain is None:
+        # No snapshot was published yet when this node started: start serving this one
+        warm_up_qa_chain(retriever)
+    if qa_chain is not None and qa_chain.retriever is not retriever:
+        qa_chain.retriever = retriever
+    print(f"🔄 Now serving index snapshot {retriever.snapshot_version}")
+
+snapshot_watcher = None
+if INDEX_SNAPSHOT_DIR:
+    snapshot_watcher = SnapshotWatcher(
+        INDEX_SNAPSHOT_DIR,
+        lambda: getattr(getattr(qa_chain, 'retriever', None), 'snapshot_version', None),
+        swap_retriever,
+    )
+
+# gunicorn.conf.py sets NEXBOT_PRELOADED: threads started in the preloading master die at
+# fork, so post_fork calls start_background_threads() in every worker instead
+PRELOADED = os.getenv("NEXBOT_PRELOADED", "0") == "1"
+
+def start_background_threads():
+    """Sweepers and pollers this process needs; safe to call more than once"""
+    audio_store.start_sweeper()
+    sessions.start_sweeper()
+    if ingest_queue.change_log:
+        ingest_queue.start()  # Also replays other workers' index changes
+    if snapshot_watcher is not None:
+        snapshot_watcher.start()
+
+if not PRELOADED:
+    start_background_threads()
+
+# Fast-path router for greetings, thanks, out-of-scope queries and curated FAQs
+intent_router = IntentRouter()
 
 # Helper functions
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # Removed local TTS - using gTTS only for better web compatibility
-
-def clean_text_for_tts(text):
-    """Clean text for better TTS by removing asterisks and markdown"""
-    import re
-    # Remove asterisks (both single and double)
-    text = re.sub(r'\*+', '', text)
-    # Remove other markdown formatting
-    text = re.sub(r'[_#`~]', '', text)
-    # Clean up extra spaces
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+# clean_text_for_tts, generate_audio_with_voice_variants and generate_simple_lipsync live in speech.py
 
 def text_to_speech_gtts_with_rate_limit(text, filepath=None, voice_type='female'):
     """gTTS without rate limiting and with voice variants"""
@@ -180,90 +344,16 @@ def text_to_speech_gtts_with_rate_limit(text, filepath=None, voice_type='female'
 
 def text_to_speech_gtts(text, filename, voice_type='female'):
     """Convert text to speech using gTTS with voice variants"""
-    filepath = os.path.join(AUDIO_FOLDER, filename)
-
     print(f"🌐 Generating {voice_type} voice audio with gTTS...")
-    if text_to_speech_gtts_with_rate_limit(text, filepath, voice_type):
+    audio_bytes = text_to_speech_gtts_with_rate_limit(text, None, voice_type)
+    if audio_bytes:
+        filepath = audio_store.write_bytes(filename, audio_bytes)
         print(f"✅ gTTS {voice_type} voice generation successful")
         return filepath
 
     print(f"❌ gTTS {voice_type} voice generation failed")
     return None
 
-def generate_audio_with_voice_variants(text, voice_type):
-    """Generate audio with different voice variants using gTTS"""
-    try:
-        print(f"🎤 Generating {voice_type} voice TTS for: '{text[:50]}...'")
-
-        # Single US female voice for all avatars (faster, no delay)
-        voice_config = {
-            'lang': 'en',
-            'tld': 'com',  # US English - simple, clear voice
-            'slow': False
-        }
-
-        config = voice_config
-        print(f"📁 Using US female voice ({config['tld']} variant)")        # Create gTTS object
-        # Clean text to remove asterisks and markdown
-        cleaned_text = clean_text_for_tts(text)
-        tts = gTTS(text=cleaned_text, lang=config['lang'], tld=config['tld'], slow=config['slow'])
-
-        # Save to BytesIO buffer
-        audio_buffer = BytesIO()
-        tts.write_to_fp(audio_buffer)
-        audio_buffer.seek(0)
-        audio_bytes = audio_buffer.read()
-
-        print(f"✅ {voice_type} voice audio generated: {len(audio_bytes)} bytes")
-        return base64.b64encode(audio_bytes).decode('utf-8')
-
-    except Exception as e:
-        print(f"❌ Audio generation error: {e}")
-        return None
-
-def generate_simple_lipsync(text):
-    """Generate simple lipsync data for text"""
-    # Estimate duration based on text length (roughly 150 words per minute)
-    word_list = text.split()
-    word_count = len(word_list)
-    duration = max(1.0, word_count / 2.5)  # Minimum 1 second, roughly 150 WPM
-
-    # Generate basic mouth cues based on text content
-    mouth_cues = []
-    current_time = 0.0
-    time_per_word = duration / max(1, word_count)
-
-    # Simple vowel/consonant mapping for basic lipsync
-    vowel_visemes = ['A', 'E', 'I', 'O', 'U']  # Open mouth shapes
-    consonant_visemes = ['B', 'F', 'G', 'H', 'X']  # Various consonant shapes
-
-    for i, word in enumerate(word_list):
-        word_duration = time_per_word * 0.8  # Leave some gap between words
-        cue_duration = word_duration / max(1, len(word))
-
-        for j, char in enumerate(word.lower()):
-            if char.isalpha():
-                # Choose viseme based on character
-                if char in 'aeiou':
-                    viseme = vowel_visemes[ord(char) % len(vowel_visemes)]
-                else:
-                    viseme = consonant_visemes[ord(char) % len(consonant_visemes)]
-
-                mouth_cues.append({
-                    "start": current_time,
-                    "end": current_time + cue_duration,
-                    "value": viseme
-                })
-                current_time += cue_duration
-
-        # Add a small pause between words
-        current_time += time_per_word * 0.2
-
-    return {
-        "metadata": {"duration": duration},
-        "mouthCues": mouth_cues
-    }
-
 def get_audio_duration(audio_file):
     """Get actual duration of audio file using ffprobe"""
     try:
@@ -277,9 +367,12 @@ def get_audio_duration(audio_file):
 
 def create_lipsync_data(audio_file, json_file):
     """Create lip-sync data using Rhubarb or intelligent fallback"""
+    json_name = os.path.basename(json_file)
+    # The WAV is only needed by Rhubarb, so it lives in scratch space and is removed afterwards
+    wav_file = audio_store.temp_path('wav')
+    rhubarb_output = audio_store.temp_path('json')
     try:
         # Convert mp3 to wav if needed
-        wav_file = audio_file.replace('.mp3', '.wav')
         subprocess.run([
             'ffmpeg', '-y', '-i', audio_file, wav_file
         ], capture_output=True)
@@ -292,8 +385,9 @@ def create_lipsync_data(audio_file, json_file):
         rhubarb_success = False
         try:
             result = subprocess.run([
-                '/Users/parvaggarwal/Coding/Chatbot-Edu/bin/rhubarb', '-f', 'json', '-o', json_file, wav_file, '-r', 'phonetic'
+                '/Users/parvaggarwal/Coding/Chatbot-Edu/bin/rhubarb', '-f', 'json', '-o', rhubarb_output, wav_file, '-r', 'phonetic'
             ], capture_output=True, check=True, text=True)
+            json_file = audio_store.adopt(rhubarb_output, json_name)
             print("✅ Rhubarb lip-sync generated successfully")
             rhubarb_success = True
         except subprocess.CalledProcessError as e:
@@ -328,13 +422,16 @@ def create_lipsync_data(audio_file, json_file):
                 "metadata": {"duration": duration},
                 "mouthCues": cues
             }
-            with open(json_file, 'w') as f:
-                json.dump(simple_lipsync, f)
+            json_file = audio_store.write_bytes(json_name, json.dumps(simple_lipsync).encode())
 
         return json_file
     except Exception as e:
         print(f"Lipsync error: {e}")
         return None
+    finally:
+        for scratch_file in (wav_file, rhubarb_output):
+            if os.path.exists(scratch_file):
+                os.remove(scratch_file)
 
 def audio_file_to_base64(filepath):
     """Convert audio file to base64"""
@@ -358,20 +455,68 @@ def index():
     return render_template("index.html")
 
 @app.route("/ask", methods=["POST"])
+@admitted("text")
 def ask():
     # Support both 'query' and 'message' for backward compatibility
     query = request.json.get("query") or request.json.get("message", "")
     if not query:
         return jsonify({"answer": "Please enter a question."})
 
+    routed = intent_router.route(query)
+    if routed:
+        return jsonify({"answer": routed["answer"], "response": routed["answer"], "intent": routed["intent"]})
+
+    stored = stored_answer(query)
+    if stored:
+        return jsonify({"answer": stored["answer"], "response": stored["answer"], "pregenerated": True})
+
     if qa_chain:
         answer = qa_chain(query)
         return jsonify({"answer": answer, "response": answer})  # Return both for compatibility
     else:
-        return jsonify({"answer": "Policy system not available. Please contact administrator."})
+        return jsonify({"answer": unavailable_message()})
+
+# Each LLM call waits for local_embedding_retriever's limiter (one call every 2 s, shared by
+# all workers on the host), so 40 questions take at least 80 s; with other traffic a batch
+# can run into gunicorn's 120 s timeout
+MAX_BATCH_QUESTIONS = 40
+
+@app.route("/ask-batch", methods=["POST"])
+@admitted("batch")
+def ask_batch():
+    """Answer a list of questions in one request; results keep the input order"""
+    data = request.get_json(silent=True) or {}
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "Provide a non-empty 'queries' list."}), 400
+    if len(queries) > MAX_BATCH_QUESTIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_QUESTIONS} questions per batch."}), 400
+
+    results = [None] * len(queries)
+    pending = []
+    for index, query in enumerate(queries):
+        if not isinstance(query, str) or not query.strip():
+            results[index] = {"query": query, "answer": None, "error": "Please enter a question."}
+            continue
+        routed = intent_router.route(query)
+        if routed:
+            results[index] = {"query": query, "answer": routed["answer"], "error": None, "intent": routed["intent"]}
+        else:
+            pending.append(index)
+
+    if pending:
+        if qa_chain:
+            answers = qa_chain.batch([queries[index] for index in pending])
+        else:
+            answers = [{"query": queries[index], "answer": None, "error": unavailable_message()} for index in pending]
+        for index, answer in zip(pending, answers):
+            results[index] = answer
+
+    return jsonify({"results": results})
 
 # Fast text-only endpoint for chat mode (no audio/lip-sync processing)
 @app.route("/chat-text", methods=["POST", "OPTIONS"])
+@admitted("text")
 def chat_text():
     if request.method == 'OPTIONS':
         return '', 200
@@ -380,23 +525,38 @@ def chat_text():
         data = request.get_json()
         message = data.get('message', '')
         voice_type = data.get('voice_type', 'female')  # New parameter for voice type
+        session_id = sessions.resolve(data.get('session_id'))
 
         if not message.strip():
             return jsonify({'error': 'Please enter a question.'}), 400
 
         print(f"📝 Text chat request ({voice_type} voice): {message[:50]}...")
 
-        # Quick test responses for hello/test
-        if message.lower().strip() in ['test', 'hello', 'hi']:
+        # Answer greetings, thanks, out-of-scope queries and FAQs without retrieval or LLM
+        routed = intent_router.route(message)
+        if routed:
+            return jsonify({
+                'response': routed['answer'],
+                'message': routed['answer'],
+                'mode': 'text-only',
+                'intent': routed['intent'],
+                'voice_type': voice_type,
+                'session_id': session_id
+            })
+
+        stored = stored_answer(message, session_id)
+        if stored:
             return jsonify({
-                'response': "Hello! I'm your Educational Policy Assistant. I'm working properly. How can I help you with policy questions?",
-                'message': "Hello! I'm your Educational Policy Assistant. I'm working properly. How can I help you with policy questions?",
+                'response': stored['answer'],
+                'message': stored['answer'],
                 'mode': 'text-only',
-                'voice_type': voice_type
+                'pregenerated': True,
+                'voice_type': voice_type,
+                'session_id': session_id
             })
 
-        # Use the rate-limited wrapper
-        response = call_qa_chain_safely(qa_chain, message)
+        # Follow-ups are resolved against the session's recent turns
+        response = answer_in_session(session_id, message)
 
         print(f"✅ Response generated successfully")
 
@@ -404,7 +564,8 @@ def chat_text():
             'response': response,
             'message': response,
             'mode': 'text-only',
-            'voice_type': voice_type
+            'voice_type': voice_type,
+            'session_id': session_id
         })
 
     except Exception as e:
@@ -440,120 +601,324 @@ def admin_dashboard():
     if "admin" not in session:
         return redirect(url_for("admin_login"))
     files = os.listdir(UPLOAD_FOLDER)
-    return render_template("admin_dashboard.html", files=files)
+    retriever = getattr(qa_chain, 'retriever', None)
+    collections = retriever.stats() if hasattr(retriever, 'rebuild_collection') else None
+    return render_template("admin_dashboard.html", files=files, faqs=intent_router.current_faqs(),
+                           ingest_jobs=ingest_queue.jobs()[:10], collections=collections,
+                           profiles=profiler.saved()[:10], active_profiles=profiler.active())
+
+def snapshot_read_only():
+    """409 response for index changes on a node that serves a read-only snapshot, else None"""
+    if INDEX_SNAPSHOT_DIR:
+        return "This node serves a read-only index snapshot; add or remove files on the build node", 409
+    return None
 
 @app.route("/admin/upload", methods=["POST"])
 def upload_file():
     if "admin" not in session:
         return redirect(url_for("admin_login"))
+    if snapshot_read_only():
+        return snapshot_read_only()
     file = request.files["file"]
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file.save(path)
+        # Index just this file; it becomes searchable without a full rebuild
+        ingest_queue.enqueue_add(path)
         return redirect(url_for("admin_dashboard"))
     return "Invalid file type", 400
 
+@app.route("/admin/delete", methods=["POST"])
+def delete_file():
+    if "admin" not in session:
+        return redirect(url_for("admin_login"))
+    if snapshot_read_only():
+        return snapshot_read_only()
+    # Match the listed name exactly: shipped files may contain spaces, % or parentheses
+    filename = os.path.basename(request.form.get("filename", ""))
+    if not filename or filename not in os.listdir(app.config['UPLOAD_FOLDER']):
+        return "File not found", 404
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.isfile(path):
+        return "File not found", 404
+    os.remove(path)
+    ingest_queue.enqueue_delete(path)
+    return redirect(url_for("admin_dashboard"))
+
+@app.route("/admin/ingest-status")
+def ingest_status():
+    if "admin" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+    job_id = request.args.get("job")
+    if job_id:
+        job = ingest_queue.job(job_id)
+        return (jsonify(job), 200) if job else (jsonify({"error": "Unknown job"}), 404)
+    return jsonify({"jobs": ingest_queue.jobs()})
+
 @app.route("/admin/rebuild", methods=["POST"])
 def rebuild_index():
     if "admin" not in session:
         return redirect(url_for("admin_login"))
-    global qa_chain
+    collection = request.form.get("collection", "")
+    retriever = getattr(qa_chain, 'retriever', None)
+    if collection and hasattr(retriever, 'rebuild_collection'):
+        # Sharded index: re-parse and re-embed just this collection
+        retriever.rebuild_collection(collection)
+        ingest_queue.record_rebuild(collection)
+        return redirect(url_for("admin_dashboard"))
     rebuild_embeddings_cache()
-    qa_chain = get_qa_chain()
+    reload_qa_chain()
+    # The other workers reload from the caches this one just wrote
+    ingest_queue.record_rebuild()
+    return redirect(url_for("admin_dashboard"))
+
+@app.route("/admin/collections", methods=["POST"])
+def tag_collection():
+    if "admin" not in session:
+        return redirect(url_for("admin_login"))
+    if snapshot_read_only():
+        return snapshot_read_only()
+    # Tags are keyed by the real file name, which may contain spaces or parentheses
+    filename = os.path.basename(request.form.get("filename", ""))
+    if not filename or filename not in os.listdir(app.config['UPLOAD_FOLDER']):
+        return "File not found", 404
+    set_collection_tag(filename, request.form.get("collection", ""))
+    # Re-indexing moves the file's chunks into the shard of its new collection
+    ingest_queue.enqueue_add(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    return redirect(url_for("admin_dashboard"))
+
+@app.route("/admin/profile/start", methods=["POST"])
+def start_profile_window():
+    """Sample every thread for the next N seconds (at most MAX_PROFILE_SECONDS)"""
+    if not profiling_allowed():
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json(silent=True) or request.form
+    try:
+        seconds = float(data.get("seconds", 30))
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds must be a number"}), 400
+    # float() also accepts "nan" and "inf", which would give the window no usable end time
+    if not math.isfinite(seconds) or not 0 < seconds <= MAX_PROFILE_SECONDS:
+        return jsonify({"error": f"seconds must be between 0 and {MAX_PROFILE_SECONDS}"}), 400
+    profile_id = profiler.start("window", seconds=seconds)
+    if request.form:
+        return redirect(url_for("admin_dashboard"))
+    return jsonify({"id": profile_id, "file": f"{profile_id}.folded"})
+
+@app.route("/admin/profile/stop", methods=["POST"])
+def stop_profile_window():
+    if not profiling_allowed():
+        return jsonify({"error": "Unauthorized"}), 401
+    stopped = profiler.stop_all()
+    if request.form:
+        return redirect(url_for("admin_dashboard"))
+    return jsonify({"stopped": stopped})
+
+@app.route("/admin/profiles")
+def list_profiles():
+    if not profiling_allowed():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({"active": profiler.active(), "saved": profiler.saved()})
+
+@app.route("/admin/profiles/<filename>")
+def download_profile(filename):
+    """Folded stacks, ready for flamegraph.pl or speedscope"""
+    if not profiling_allowed():
+        return jsonify({"error": "Unauthorized"}), 401
+    return send_from_directory(PROFILE_DIR, secure_filename(filename), mimetype="text/plain", as_attachment=True)
+
+@app.route("/admin/faqs", methods=["POST"])
+def add_faq():
+    if "admin" not in session:
+        return redirect(url_for("admin_login"))
+    try:
+        intent_router.add_faq(request.form.get("question", ""), request.form.get("answer", ""))
+    except ValueError as e:
+        return str(e), 400
+    return redirect(url_for("admin_dashboard"))
+
+@app.route("/admin/faqs/delete", methods=["POST"])
+def delete_faq():
+    if "admin" not in session:
+        return redirect(url_for("admin_login"))
+    intent_router.remove_faq(request.form.get("question", ""))
     return redirect(url_for("admin_dashboard"))
 
 # ------------------ 3D AVATAR API ROUTES ------------------
+# gTTS and lipsync run on a worker pool (TTS_WORKERS, TTS_QUEUE_DEPTH) so /chat does not wait for audio.
+# Job state and audio go through audio_store, so /chat/audio polls work on any gunicorn worker.
+tts_queue = TTSQueue(generate_audio_with_voice_variants, generate_simple_lipsync, store=audio_store)
+
+def speech_for(text, voice_type, wait_for_audio=False):
+    """Audio and lipsync fields for a /chat response: a TTS job to fetch, or inline when asked to wait"""
+    if wait_for_audio or not TTS_ASYNC:
+        return {
+            "audio": generate_audio_with_voice_variants(text, voice_type) or "",
+            "lipsync": generate_simple_lipsync(text)
+        }
+    job_id = tts_queue.submit(text, voice_type)
+    if job_id is None:
+        # Queue is full: answer with text only rather than pile up TTS work
+        print("⚠️ TTS queue full, answering without audio")
+        return {"audio": "", "lipsync": None, "audio_status": "busy"}
+    return {"audio": "", "lipsync": None, "audio_job": job_id, "audio_status": "pending"}
+
+def pick_animation(answer):
+    """Determine appropriate animation based on content"""
+    lowered = answer.lower()
+    if any(word in lowered for word in ["sorry", "apologize", "error", "problem"]):
+        return "Talking_1"
+    if any(word in lowered for word in ["great", "excellent", "perfect", "congratulations"]):
+        return "Talking_2"
+    if "not found" in lowered or "couldn't find" in lowered:
+        return "Talking_1"
+    return "Talking_0"
+
 @app.route("/chat", methods=["POST"])
+@admitted("avatar")
 def chat_3d():
-    """3D Avatar chat endpoint with voice variants"""
+    """3D Avatar chat endpoint with voice variants
+
+    Returns the text at once; audio and lipsync follow from /chat/audio/<audio_job>.
+    Clients that want them inline send "wait_for_audio": true.
+    """
+    data = request.get_json(silent=True) or {}
+    voice_type = data.get("voice_type", "female")  # New parameter for voice type
+    wait_for_audio = bool(data.get("wait_for_audio"))
     try:
-        data = request.get_json()
         user_message = data.get("message", "")
-        voice_type = data.get("voice_type", "female")  # New parameter for voice type
+        session_id = sessions.resolve(data.get("session_id"))
 
         print(f"🎭 3D chat request ({voice_type} voice): {user_message[:50]}...")
 
         # Default welcome message if no message provided
         if not user_message:
             welcome_text = "Hello! I'm your Educational Policy Assistant. How can I help you today?"
-            welcome_audio = generate_audio_with_voice_variants(welcome_text, voice_type)
 
             return jsonify({
                 "message": welcome_text,
-                "audio": welcome_audio or "",
+                **speech_for(welcome_text, voice_type, wait_for_audio),
                 "animation": "Talking_1",
-                "lipsync": generate_simple_lipsync(welcome_text),
-                "voice_type": voice_type
+                "voice_type": voice_type,
+                "session_id": session_id
+            })
+
+        # Answer greetings, thanks, out-of-scope queries and FAQs without retrieval or LLM
+        routed = intent_router.route(user_message)
+        if routed:
+            return jsonify({
+                "message": routed["answer"],
+                **speech_for(routed["answer"], voice_type, wait_for_audio),
+                "animation": "Talking_1",
+                "intent": routed["intent"],
+                "voice_type": voice_type,
+                "session_id": session_id
             })
 
         # Check if QA system is available
         if not qa_chain:
-            error_text = "I apologize, but the policy system is currently unavailable. Please try again later."
-            error_audio = generate_audio_with_voice_variants(error_text, voice_type)
+            error_text = unavailable_message()
 
             return jsonify({
                 "message": error_text,
-                "audio": error_audio or "",
+                **speech_for(error_text, voice_type, wait_for_audio),
                 "animation": "Talking_0",
-                "lipsync": generate_simple_lipsync(error_text),
-                "voice_type": voice_type
+                "voice_type": voice_type,
+                "session_id": session_id
             })
 
-        # Get answer from policy QA system
-        policy_answer = call_qa_chain_safely(qa_chain, user_message)
-        print(f"✅ 3D response generated successfully")
-
-        # Generate audio with specified voice type
-        response_audio = generate_audio_with_voice_variants(policy_answer, voice_type)
+        # Common questions: answer, audio and lipsync were generated offline
+        stored = stored_answer(user_message, session_id)
+        if stored:
+            if stored["audio"]:
+                speech = {"audio": stored["audio"],
+                          "lipsync": stored["lipsync"] or generate_simple_lipsync(stored["answer"])}
+            else:
+                speech = speech_for(stored["answer"], voice_type, wait_for_audio)
+            return jsonify({
+                "message": stored["answer"],
+                **speech,
+                "animation": pick_animation(stored["answer"]),
+                "pregenerated": True,
+                "voice_type": voice_type,
+                "session_id": session_id
+            })
 
-        # Determine appropriate animation based on content
-        animation = "Talking_0"
-        if any(word in policy_answer.lower() for word in ["sorry", "apologize", "error", "problem"]):
-            animation = "Talking_1"
-        elif any(word in policy_answer.lower() for word in ["great", "excellent", "perfect", "congratulations"]):
-            animation = "Talking_2"
-        elif "not found" in policy_answer.lower() or "couldn't find" in policy_answer.lower():
-            animation = "Talking_1"
+        # Get answer from policy QA system, resolving follow-ups against the session
+        policy_answer = answer_in_session(session_id, user_message)
+        print(f"✅ 3D response generated successfully")
 
         return jsonify({
             "message": policy_answer,
-            "audio": response_audio or "",
-            "animation": animation,
-            "lipsync": generate_simple_lipsync(policy_answer),
-            "voice_type": voice_type
+            **speech_for(policy_answer, voice_type, wait_for_audio),
+            "animation": pick_animation(policy_answer),
+            "voice_type": voice_type,
+            "session_id": session_id
         })
 
     except Exception as e:
         print(f"❌ 3D Chat error: {e}")
         error_text = "I encountered an error processing your question. Please try again."
-        voice_type = request.json.get("voice_type", "female") if request.json else "female"
-        error_audio = generate_audio_with_voice_variants(error_text, voice_type)
 
         return jsonify({
             "message": error_text,
-            "audio": error_audio or "",
+            **speech_for(error_text, voice_type, wait_for_audio),
             "animation": "Talking_0",
-            "lipsync": generate_simple_lipsync(error_text),
             "voice_type": voice_type
         })
 
+# Suggested delay between polls for an unfinished audio job (gTTS takes a few seconds)
+AUDIO_POLL_RETRY_SECONDS = 1
+
+@app.route("/chat/audio/<job_id>")
+def chat_audio(job_id):
+    """Audio (base64 mp3) and lipsync of a /chat answer; 202 while still generating
+
+    Answers at once: polls run outside admission control, so holding them open would take
+    gunicorn threads away from text requests.
+    """
+    job = tts_queue.job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired audio job"}), 404
+    if job["state"] in ("done", "failed"):
+        return jsonify(job), 200
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers['Retry-After'] = str(AUDIO_POLL_RETRY_SECONDS)
+    return response
+
+@app.route("/session/clear", methods=["POST"])
+def clear_session():
+    """Forget a conversation's history (e.g. when the user starts a new chat)"""
+    data = request.get_json(silent=True) or {}
+    return jsonify({"cleared": sessions.clear(data.get("session_id", ""))})
+
 # ------------------ UTILITY ROUTES ------------------
 @app.route("/audios/<filename>")
 def serve_audio(filename):
     """Serve audio files"""
     try:
-        audio_path = os.path.join(AUDIO_FOLDER, filename)
-        if os.path.exists(audio_path):
+        audio_path = audio_store.path_for(filename)
+        audio_dir = audio_store.root
+        if not audio_path and os.path.isfile(os.path.join(AUDIO_FOLDER, filename)):
+            # Sample files shipped in audios/ are not managed by the store
+            audio_path, audio_dir = os.path.join(AUDIO_FOLDER, filename), AUDIO_FOLDER
+        if audio_path:
             # Determine mimetype based on file extension
             if filename.endswith('.mp3'):
                 mimetype = 'audio/mpeg'
             elif filename.endswith('.wav'):
                 mimetype = 'audio/wav'
+            elif filename.endswith('.json'):
+                mimetype = 'application/json'
             else:
                 mimetype = 'audio/mpeg'  # Default to mp3
-            return send_file(audio_path, mimetype=mimetype)
+            # Artifacts never change once written, so let clients cache them until they expire
+            return send_from_directory(audio_dir, filename, mimetype=mimetype,
+                                       conditional=True, max_age=audio_store.ttl)
         else:
-            print(f"⚠️ Audio file not found: {audio_path}")
+            print(f"⚠️ Audio file not found: {filename}")
             return "Audio file not found", 404
     except Exception as e:
         print(f"Error serving audio: {e}")
@@ -598,6 +963,26 @@ def debug_api():
             'error_type': type(e).__name__
         })
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness probe: the process is up and serving HTTP"""
+    return jsonify({'status': 'alive'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness probe: the QA chain is loaded and can answer questions"""
+    body = {
+        'ready': qa_chain is not None,
+        'state': qa_status['state'],
+        'error': qa_status['error'],
+        'uptime': time.time() - qa_status['started_at']
+    }
+    return jsonify(body), (200 if qa_chain is not None else 503)
+
+def encoder_stats():
+    model = getattr(getattr(qa_chain, 'retriever', None), 'embedding_model', None)
+    return model.stats() if isinstance(model, MicroBatchEncoder) else None
+
 @app.route('/status', methods=['GET'])
 def status():
     """Check system status"""
@@ -612,7 +997,20 @@ def status():
         'time_since_last_call': time_since_last,
         'rate_limit_interval': MIN_API_INTERVAL,
         'ready_for_call': time_since_last >= MIN_API_INTERVAL,
-        'qa_chain_available': qa_chain is not None
+        'qa_chain_available': qa_chain is not None,
+        'qa_state': qa_status['state'],
+        'collections': qa_chain.retriever.stats() if hasattr(getattr(qa_chain, 'retriever', None), 'stats') else None,
+        'llm_dispatcher': qa_chain.dispatcher.stats() if hasattr(qa_chain, 'dispatcher') else None,
+        'query_encoder': encoder_stats(),
+        'index_snapshot': {
+            'version': getattr(getattr(qa_chain, 'retriever', None), 'snapshot_version', None),
+            'last_error': snapshot_watcher.last_error
+        } if snapshot_watcher else None,
+        'audio_store': audio_store.stats(),
+        'tts_queue': tts_queue.stats(),
+        'admission': admission.stats(),
+        'sessions': sessions.stats(),
+        'answer_store': answer_store.stats()
     })
 
 if __name__ == "__main__":
@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import time
+import zlib
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+
+FAQ_FILE = "faqs.json"
+
+# Queries longer than this always go to retrieval + LLM
+MAX_ROUTABLE_CHARS = 200
+VECTOR_DIM = 2048
+RELOAD_CHECK_SECONDS = 10  # How often a worker looks for FAQ edits made by another worker
+
+GREETING_RESPONSE = "Hello! I'm your Educational Policy Assistant. I'm working properly. How can I help you with policy questions?"
+THANKS_RESPONSE = "You're welcome! Let me know if you have any other questions about the educational policies."
+GOODBYE_RESPONSE = "Goodbye! Feel free to come back whenever you have more policy questions."
+OUT_OF_SCOPE_RESPONSE = "I am not allowed to discuss topics outside the provided educational policy context."
+
+INTENT_RESPONSES = {
+    "greeting": GREETING_RESPONSE,
+    "thanks": THANKS_RESPONSE,
+    "goodbye": GOODBYE_RESPONSE,
+    "out_of_scope": OUT_OF_SCOPE_RESPONSE,
+}
+
+# Labelled examples used for nearest-neighbour matching
+INTENT_EXAMPLES = {
+    "greeting": [
+        "hello", "hi", "hey", "hey there", "hi there", "hello there", "good morning",
+        "good afternoon", "good evening", "greetings", "hello nexbot", "hi how are you",
+        "how are you doing", "what's up", "test",
+    ],
+    "thanks": [
+        "thanks", "thank you", "thank you so much", "thanks a lot", "many thanks",
+        "thanks for the help", "appreciate it", "great thanks", "ok thanks", "thx",
+    ],
+    "goodbye": [
+        "bye", "goodbye", "bye bye", "see you", "see you later", "that's all", "good night",
+    ],
+    "out_of_scope": [
+        "what is the weather today", "tell me a joke", "who won the cricket match",
+        "write python code for me", "what is the capital of france", "sing me a song",
+        "recommend a good movie", "suggest a restaurant nearby", "what is the stock price",
+        "who is the prime minister", "play some music", "what time is it",
+    ],
+}
+
+# Anchored keyword rules, checked before any vector matching
+KEYWORD_RULES = [
+    ("greeting", re.compile(r"^(hi+|hello+|hey+|hiya|greetings|test|good\s+(morning|afternoon|evening))(\s+(there|nexbot|bot))?$")),
+    ("thanks", re.compile(r"^((ok(ay)?|great|cool)\s+)?(thanks?|thank\s+you|thx|ty)(\s+(so\s+much|a\s+lot|very\s+much))?$")),
+    ("goodbye", re.compile(r"^(bye+(\s+bye)?|goodbye|good\s+night|see\s+(you|ya)(\s+later)?)$")),
+]
+
+# Messages mentioning any of these never take the greeting/out-of-scope shortcut
+POLICY_TERMS = {
+    "attendance", "waiver", "policy", "policies", "mooc", "moocs", "nptel", "swayam", "credit",
+    "credits", "grade", "grades", "internship", "internships", "hackathon", "hackathons",
+    "leave", "duty", "exam", "exams", "project", "projects", "patent", "copyright", "care",
+    "rpl", "prior", "learning", "scrgm", "certification", "certificate", "recruitment",
+    "revenue", "criteria", "guidelines", "eligibility", "eligible", "semester", "student",
+    "students", "marks", "upgrade", "course", "courses", "competition", "competitions",
+}
+
+INTENT_THRESHOLD = 0.78
+FAQ_THRESHOLD = 0.8
+SMALL_TALK_MAX_TOKENS = 8
+
+# Ignored when vectorizing so FAQ matches hinge on content words
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "be", "do", "does", "i", "me", "my", "we", "you",
+    "it", "of", "for", "to", "in", "on", "at", "and", "or", "what", "whats", "what's", "how",
+    "can", "please", "tell", "about", "this", "that", "there",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase and strip punctuation so rules see plain words"""
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^a-z0-9'\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def hashed_vector(text: str) -> np.ndarray:
+    """Cheap bag of words + character trigrams, hashed into a fixed-size unit vector"""
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    tokens = _TOKEN_RE.findall(text)
+    content_tokens = [token for token in tokens if token not in STOPWORDS]
+    for token in content_tokens or tokens:
+        vector[zlib.crc32(token.encode()) % VECTOR_DIM] += 3.0
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode()) % VECTOR_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def content_words(text: str) -> frozenset:
+    """Non-stopword tokens with plural/tense endings trimmed, e.g. 'exams' and 'exam' match"""
+    words = set()
+    for token in _TOKEN_RE.findall(text):
+        if token in STOPWORDS:
+            continue
+        token = token.replace("'", "")
+        for suffix in ("ing", "ed", "es", "s"):
+            if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+                token = token[:-len(suffix)]
+                break
+        words.add(token)
+    return frozenset(words)
+
+
+class IntentRouter:
+    """Answers small talk, out-of-scope queries and curated FAQs without retrieval or LLM"""
+
+    def __init__(self, faq_file: str = FAQ_FILE):
+        self.faq_file = faq_file
+        self._lock = Lock()
+        self._edit_lock = Lock()
+        self.faqs: List[Dict] = []
+        self.faq_words: List[frozenset] = []
+        self._loaded_mtime = None
+        self._checked_at = 0.0
+
+        # Intent examples never change, so embed them once
+        self.intent_labels = []
+        example_vectors = []
+        for intent, examples in INTENT_EXAMPLES.items():
+            for example in examples:
+                self.intent_labels.append(intent)
+                example_vectors.append(hashed_vector(normalize_message(example)))
+        self.intent_matrix = np.vstack(example_vectors)
+
+        self.faq_matrix = np.zeros((0, VECTOR_DIM), dtype=np.float32)
+        self.load_faqs()
+
+    def load_faqs(self):
+        """(Re)load admin-curated FAQs from disk"""
+        mtime = os.path.getmtime(self.faq_file) if os.path.exists(self.faq_file) else None
+        self._set_faqs(self._read_faqs(), mtime)
+
+    def _read_faqs(self) -> List[Dict]:
+        if not os.path.exists(self.faq_file):
+            return []
+        try:
+            with open(self.faq_file, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not load FAQs from {self.faq_file}: {e}")
+            return []
+
+    def _reload_if_changed(self):
+        """Pick up FAQs edited through another worker"""
+        now = time.time()
+        if now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        mtime = os.path.getmtime(self.faq_file) if os.path.exists(self.faq_file) else None
+        if mtime != self._loaded_mtime:
+            self.load_faqs()
+
+    def current_faqs(self) -> List[Dict]:
+        """FAQs as currently saved on disk, for the admin dashboard"""
+        self._checked_at = 0.0
+        self._reload_if_changed()
+        with self._lock:
+            return self.faqs
+
+    def _set_faqs(self, faqs: List[Dict], mtime=None):
+        if faqs:
+            matrix = np.vstack([hashed_vector(normalize_message(faq["question"])) for faq in faqs])
+        else:
+            matrix = np.zeros((0, VECTOR_DIM), dtype=np.float32)
+        words = [content_words(normalize_message(faq["question"])) for faq in faqs]
+        # Swap all references together so readers never see a mismatched set
+        with self._lock:
+            self.faqs = faqs
+            self.faq_matrix = matrix
+            self.faq_words = words
+            self._loaded_mtime = mtime
+
+    def _save_faqs(self, faqs: List[Dict]):
+        tmp_file = f"{self.faq_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(faqs, f, indent=2)
+        os.replace(tmp_file, self.faq_file)
+        self._set_faqs(faqs, os.path.getmtime(self.faq_file))
+
+    def add_faq(self, question: str, answer: str):
+        """Add or replace a curated FAQ entry"""
+        question = question.strip()
+        answer = answer.strip()
+        if not question or not answer:
+            raise ValueError("FAQ question and answer must not be empty.")
+        key = normalize_message(question)
+        # Start from the file, not memory, so edits saved by other workers are kept
+        with self._edit_lock:
+            faqs = [faq for faq in self._read_faqs() if normalize_message(faq["question"]) != key]
+            faqs.append({"question": question, "answer": answer})
+            self._save_faqs(faqs)
+
+    def remove_faq(self, question: str):
+        """Delete a curated FAQ entry by its question"""
+        key = normalize_message(question)
+        with self._edit_lock:
+            self._save_faqs([faq for faq in self._read_faqs() if normalize_message(faq["question"]) != key])
+
+    def route(self, message: str) -> Optional[Dict]:
+        """Return {'intent', 'answer', 'score'} when the message can be answered locally, else None"""
+        if not message or len(message) > MAX_ROUTABLE_CHARS:
+            return None
+
+        text = normalize_message(message)
+        if not text:
+            return None
+
+        for intent, pattern in KEYWORD_RULES:
+            if pattern.match(text):
+                return {"intent": intent, "answer": INTENT_RESPONSES[intent], "score": 1.0}
+
+        vector = hashed_vector(text)
+
+        self._reload_if_changed()
+        with self._lock:
+            faqs = self.faqs
+            faq_matrix = self.faq_matrix
+            faq_words = self.faq_words
+
+        if faqs:
+            scores = faq_matrix @ vector
+            best = int(np.argmax(scores))
+            # Similar vectors alone let "Is attendance required?" take a more specific FAQ's answer
+            if scores[best] >= FAQ_THRESHOLD and content_words(text) == faq_words[best]:
+                return {"intent": "faq", "answer": faqs[best]["answer"], "score": float(scores[best])}
+
+        tokens = text.split()
+        if len(tokens) > SMALL_TALK_MAX_TOKENS or any(token in POLICY_TERMS for token in tokens):
+            return None
+
+        scores = self.intent_matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= INTENT_THRESHOLD:
+            intent = self.intent_labels[best]
+            return {"intent": intent, "answer": INTENT_RESPONSES[intent], "score": float(scores[best])}
+
+        return None
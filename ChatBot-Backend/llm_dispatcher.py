@@ -0,0 +1,322 @@
+"""LLM dispatch with a concurrency cap, per-request deadlines, hedging and a circuit breaker
+
+Try it against the fake LLM (no API key needed):
+    python llm_dispatcher.py demo
+"""
+import os
+import sys
+import time
+import random
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+from sampling_profiler import delegate
+
+# Defaults, overridable through the environment
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "20"))
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))  # 0 disables hedging
+BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+ANSWER_CACHE_SIZE = 256
+
+
+class CircuitOpenError(Exception):
+    """The LLM is failing too often; calls are rejected without being attempted"""
+
+
+class DeadlineExceededError(Exception):
+    """The request ran out of time waiting for a slot or for the LLM"""
+
+
+class CircuitBreaker:
+    """Opens when the failure rate over the last calls spikes, probes again after a cooldown"""
+
+    def __init__(self, failure_rate=BREAKER_FAILURE_RATE, window=BREAKER_WINDOW,
+                 min_calls=BREAKER_MIN_CALLS, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                # Let exactly one probe through to test whether the LLM recovered
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self):
+        """A half-open probe was abandoned before reaching the LLM"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if success:
+                    print("✅ LLM circuit closed again")
+                    self.state = "closed"
+                    self.outcomes.clear()
+                else:
+                    self.state = "open"
+                    self.opened_at = time.time()
+                return
+
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if (self.state == "closed" and len(self.outcomes) >= self.min_calls
+                    and failures / len(self.outcomes) >= self.failure_rate):
+                print(f"🚨 LLM circuit opened: {failures}/{len(self.outcomes)} recent calls failed")
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self.outcomes),
+                "recent_failures": self.outcomes.count(False),
+            }
+
+
+class LLMDispatcher:
+    """Sends prompts to an LLM with bounded concurrency, deadlines, optional hedging and fail-fast"""
+
+    def __init__(self, llm, max_concurrency: int = LLM_MAX_CONCURRENCY, deadline: float = LLM_DEADLINE_SECONDS,
+                 hedge_after: float = LLM_HEDGE_AFTER_SECONDS, breaker: CircuitBreaker = None,
+                 before_call: Optional[Callable[[float], bool]] = None):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        # Called with the seconds left before each attempt; returns False if it cannot wait that long
+        self.before_call = before_call
+
+        # Released when an attempt really finishes, so abandoned slow calls still count
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Room for a hedge per slot; the semaphore is what limits concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="llm")
+        self._answers = OrderedDict()
+        self._answers_lock = threading.Lock()
+        self.counters = {"calls": 0, "failures": 0, "rejected": 0, "hedged": 0, "cached_fallbacks": 0}
+        self._counters_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    def invoke(self, prompt: str, cache_key: Optional[str] = None, deadline: Optional[float] = None) -> str:
+        """Return the LLM's answer, or the last good answer for cache_key when the LLM is unavailable"""
+        expires_at = time.time() + (deadline or self.deadline)
+        try:
+            answer = self._invoke_with_retry(prompt, expires_at)
+        except Exception:
+            cached = self._cached_answer(cache_key)
+            if cached is not None:
+                self._count("cached_fallbacks")
+                return cached
+            raise
+
+        if cache_key:
+            with self._answers_lock:
+                self._answers[cache_key] = answer
+                self._answers.move_to_end(cache_key)
+                while len(self._answers) > ANSWER_CACHE_SIZE:
+                    self._answers.popitem(last=False)
+        return answer
+
+    def _cached_answer(self, cache_key):
+        if not cache_key:
+            return None
+        with self._answers_lock:
+            return self._answers.get(cache_key)
+
+    def _invoke_with_retry(self, prompt, expires_at):
+        # One quick retry on rate limiting, but only if the deadline leaves room for it
+        for attempt in range(2):
+            try:
+                return self._invoke_once(prompt, expires_at)
+            except Exception as e:
+                remaining = expires_at - time.time()
+                if attempt == 0 and "429" in str(e) and remaining > 2:
+                    backoff = min(5.0, remaining / 2)
+                    print(f"Rate limited, retrying in {backoff:.1f} seconds...")
+                    time.sleep(backoff)
+                    continue
+                raise
+
+    def _invoke_once(self, prompt, expires_at):
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise CircuitOpenError("LLM circuit is open")
+
+        try:
+            if not self._slots.acquire(timeout=max(0.0, expires_at - time.time())):
+                raise DeadlineExceededError("Deadline exceeded waiting for a free LLM slot")
+            # Reserve the rate-limit slot only once a concurrency slot is held, so queued calls do not burn it
+            if not self._before_call(expires_at - time.time()):
+                self._slots.release()
+                raise DeadlineExceededError("Deadline exceeded waiting for the rate limiter")
+        except DeadlineExceededError:
+            # Local overload, not an LLM failure
+            self.breaker.release_probe()
+            raise
+
+        self._count("calls")
+        futures = [self._submit(prompt)]
+        try:
+            result = self._wait_for_first(futures, prompt, expires_at)
+        except Exception:
+            self._count("failures")
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        return result
+
+    def _before_call(self, max_wait):
+        return self.before_call is None or self.before_call(max_wait)
+
+    def _submit(self, prompt):
+        """Run one attempt on the pool; its slot is released when it completes"""
+        future = self._executor.submit(delegate(self.llm.invoke), prompt)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _wait_for_first(self, futures, prompt, expires_at):
+        hedge_at = time.time() + self.hedge_after if self.hedge_after else None
+        while True:
+            now = time.time()
+            if now >= expires_at:
+                raise DeadlineExceededError(f"LLM did not answer within {self.deadline:.0f}s")
+
+            timeout = expires_at - now
+            if hedge_at and len(futures) == 1:
+                timeout = min(timeout, max(0.0, hedge_at - now))
+
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result().content
+            if done and len(done) == len(futures):
+                # Every attempt failed; surface the first error
+                raise next(iter(done)).exception()
+            for future in done:
+                futures.remove(future)
+
+            # Hedge a slow call with a second identical request, if a slot and the rate limiter allow it right now
+            if hedge_at and len(futures) == 1 and time.time() >= hedge_at:
+                hedge_at = None
+                if self._slots.acquire(blocking=False):
+                    if self._before_call(0):
+                        self._count("hedged")
+                        futures.append(self._submit(prompt))
+                    else:
+                        self._slots.release()
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "breaker": self.breaker.stats(),
+            "max_concurrency": self.max_concurrency,
+            "deadline_seconds": self.deadline,
+            "hedge_after_seconds": self.hedge_after or None,
+        }
+
+
+class FakeLLM:
+    """Local stand-in for the Gemini client that injects latency, errors and rate limits"""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 30.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.5")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0")),
+            slow_rate=float(os.getenv("FAKE_LLM_SLOW_RATE", "0")),
+        )
+
+    def invoke(self, prompt):
+        roll = self._random.random()
+        if roll < self.slow_rate:
+            time.sleep(self.slow_latency)
+        else:
+            time.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+
+        roll = self._random.random()
+        if roll < self.error_rate:
+            raise RuntimeError("500 Internal error (injected by FakeLLM)")
+        if roll < self.error_rate + self.rate_limit_rate:
+            raise RuntimeError("429 Resource exhausted (injected by FakeLLM)")
+
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        return SimpleNamespace(content=f"[fake answer] {question}")
+
+
+def _demo():
+    """Healthy, then degraded, then recovered fake LLM under concurrent load"""
+    phases = [
+        ("healthy", FakeLLM(latency=0.2, seed=1)),
+        ("degraded", FakeLLM(latency=0.2, error_rate=0.7, slow_rate=0.2, slow_latency=5, seed=2)),
+        ("recovered", FakeLLM(latency=0.2, seed=3)),
+    ]
+    dispatcher = LLMDispatcher(phases[0][1], max_concurrency=4, deadline=2, hedge_after=0.5,
+                               breaker=CircuitBreaker(window=10, min_calls=5, cooldown=2))
+
+    def ask(i):
+        start = time.time()
+        try:
+            dispatcher.invoke(f"Question: q{i % 5}\nAnswer:", cache_key=f"q{i % 5}")
+            outcome = "ok"
+        except Exception as e:
+            outcome = type(e).__name__
+        return outcome, time.time() - start
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for name, llm in phases:
+            dispatcher.llm = llm
+            if name == "recovered":
+                time.sleep(2.1)  # Let the breaker cooldown elapse
+            results = list(pool.map(ask, range(40)))
+            outcomes = {}
+            for outcome, _ in results:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            slowest = max(elapsed for _, elapsed in results)
+            print(f"{name:<10} outcomes={outcomes} slowest={slowest:.2f}s breaker={dispatcher.breaker.state}")
+    print(dispatcher.stats())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "demo":
+        _demo()
+    else:
+        print(__doc__)
@@ -1,77 +1,198 @@
 import os
+import hashlib
 from pathlib import Path
 import warnings
+import importlib.util
 import numpy as np
 from typing import List, Dict
-import langchain
 import time
 import pickle
+import tempfile
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_dispatcher import LLMDispatcher, FakeLLM, CircuitOpenError, DeadlineExceededError
+from sampling_profiler import delegate
+from dedup import NearDuplicateIndex, context_text, deduplicate_chunks
+from chunk_store import ChunkStore, text_digest
 
 warnings.filterwarnings("ignore")
 
 # Set environment variables to avoid issues
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-# Fix langchain attributes
-langchain.verbose = False
-langchain.debug = False
-langchain.llm_cache = None
-
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredExcelLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import ChatGoogleGenerativeAI
+# langchain, torch/sentence-transformers and the Gemini client are imported lazily
+# inside the functions that need them, so importing this module stays cheap.
+# EMBEDDING_RUNTIME selects how all-MiniLM-L6-v2 runs: "torch" (sentence-transformers)
+# or "onnx" (int8 quantized export, see onnx_embedder.py). Only check that the runtime
+# is installed here; importing sentence transformers pulls in torch.
+EMBEDDING_RUNTIME = os.getenv("EMBEDDING_RUNTIME", "torch")
+if EMBEDDING_RUNTIME == "onnx":
+    EMBEDDINGS_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ("onnxruntime", "tokenizers"))
+else:
+    EMBEDDINGS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
 
-# Try to import sentence transformers for local embeddings
 try:
-    from sentence_transformers import SentenceTransformer
-    EMBEDDINGS_AVAILABLE = True
-except ImportError:
-    EMBEDDINGS_AVAILABLE = False
+    import fcntl
+except ImportError:  # Windows; the Flask dev server runs a single process there
+    fcntl = None
 
-# Rate limiting variables
+# Rate limiting variables, shared by single and batch questions
 last_request_time = 0
 MIN_REQUEST_INTERVAL = 2  # 2 seconds between requests
+_rate_limit_lock = Lock()
+# gunicorn workers on one host reserve their slots through this file, so the interval holds
+# for the whole host rather than per worker
+RATE_LIMIT_FILE = os.getenv("RATE_LIMIT_FILE", os.path.join(tempfile.gettempdir(), "nexbot-llm-rate-limit"))
+
+# Maximum LLM calls in flight for one batch of questions
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+
+def _configure_langchain():
+    """Import langchain and fix its global attributes"""
+    import langchain
+    langchain.verbose = False
+    langchain.debug = False
+    langchain.llm_cache = None
+
+
+def load_embedding_model():
+    """Load all-MiniLM-L6-v2 with the configured runtime"""
+    if EMBEDDING_RUNTIME == "onnx":
+        from onnx_embedder import OnnxEmbeddingModel
+        return OnnxEmbeddingModel()
+    from sentence_transformers import SentenceTransformer
+    # Use a smaller, faster model that works offline
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+
+# Merge query encodes from concurrent requests into micro-batches
+ENCODE_MICROBATCH = os.getenv("ENCODE_MICROBATCH", "1") == "1"
+
+_embedding_model = None
+_embedding_model_lock = Lock()
+
+
+def get_embedding_model():
+    """Process-wide embedding model, shared by every retriever/shard and kept across rebuilds"""
+    global _embedding_model
+    with _embedding_model_lock:
+        if _embedding_model is None:
+            print("🔄 Loading local embedding model (this may take a moment on first run)...")
+            model = load_embedding_model()
+            # First encode initializes the runtime; pay for it now rather than on a user query
+            model.encode(["warm up"])
+            if ENCODE_MICROBATCH:
+                # Concurrent single-query encodes are merged into one batch (see batching_encoder.py)
+                from batching_encoder import MicroBatchEncoder
+                model = MicroBatchEncoder(model)
+            _embedding_model = model
+        return _embedding_model
+
+
+SUPPORTED_SUFFIXES = [".pdf", ".txt", ".xlsx", ".xls", ".docx"]
+
+# Chunking and the similarity floor for search results; compare settings with eval_retrieval.py
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+MIN_SIMILARITY = float(os.getenv("RETRIEVAL_MIN_SIMILARITY", "0.1"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+
+# Compact the index once this share of chunks belongs to deleted files
+COMPACT_DEAD_RATIO = 0.25
+
+# Split the corpus into per-collection indexes with query routing (see sharded_retriever.py)
+SHARDED_INDEX = os.getenv("SHARDED_INDEX", "0") == "1"
+
+# Serve a prebuilt read-only index from this directory instead of parsing data/ (see index_snapshot.py)
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "")
+
+# Collapse near-duplicate chunks (e.g. EDU_REV summaries repeating the guidelines) at index time
+INDEX_DEDUP = os.getenv("INDEX_DEDUP", "1") == "1"
+
+
+def source_name(doc) -> str:
+    """File name a chunk came from (loaders store the full path)"""
+    return os.path.basename(doc.metadata.get('source', ''))
 
 
 class LocalEmbeddingRetriever:
     """Document retriever using local sentence transformers (free)"""
 
-    def __init__(self, documents, use_embeddings=True):
-        self.documents = documents
+    def __init__(self, documents, use_embeddings=True, deduplicate=INDEX_DEDUP,
+                 embeddings_cache_file="document_embeddings.pkl"):
+        # MinHash/LSH index over the kept chunks; duplicates become extra sources of one chunk
+        self.dedup_index = NearDuplicateIndex() if deduplicate else None
+        if self.dedup_index is not None:
+            total = len(documents)
+            documents = deduplicate_chunks(documents, self.dedup_index)
+            if len(documents) < total:
+                print(f"🧹 Collapsed {total - len(documents)} near-duplicate chunks into {len(documents)} unique chunks")
+
+        # Compact array-backed rows; Documents are only built for search results
+        self.documents = ChunkStore(documents)
         self.use_embeddings = use_embeddings and EMBEDDINGS_AVAILABLE
-        self.embeddings_cache_file = "document_embeddings.pkl"
+        self.embeddings_cache_file = embeddings_cache_file
+        # Bumped on every write so callers can cache derived data (e.g. shard centroids)
+        self.version = 0
+        # False marks chunks of deleted files (tombstones) until the next compaction
+        self.live = np.ones(len(documents), dtype=bool)
+        # Writers build new lists/arrays and swap them in under this lock, so a
+        # search always sees a consistent (documents, embeddings, live) snapshot
+        self._lock = Lock()
+        # Serializes add/remove so the dedup index positions stay aligned with documents
+        self._write_lock = Lock()
+        # Set for indexes loaded from a snapshot (see index_snapshot.py)
+        self.read_only = False
+        self.lexical_index = None
 
         if self.use_embeddings:
             self._initialize_embeddings()
 
+    @classmethod
+    def from_snapshot(cls, documents: ChunkStore, embeddings=None, lexical_index=None):
+        """Serve prebuilt chunks and vectors as-is: no parsing, dedup or embedding"""
+        retriever = cls([], use_embeddings=False, deduplicate=False)
+        retriever.documents = documents
+        retriever.live = np.ones(len(documents), dtype=bool)
+        retriever.lexical_index = lexical_index
+        retriever.read_only = True
+        if embeddings is not None and EMBEDDINGS_AVAILABLE:
+            retriever.embedding_model = get_embedding_model()
+            retriever.document_embeddings = embeddings
+            retriever.use_embeddings = True
+        return retriever
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("This node serves a read-only index snapshot; add or remove files on the build node")
+
     def _initialize_embeddings(self):
         """Initialize local embedding model and create document embeddings"""
         try:
-            print("🔄 Loading local embedding model (this may take a moment on first run)...")
-            # Use a smaller, faster model that works offline
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-
-            # Check if we have cached embeddings
-            if os.path.exists(self.embeddings_cache_file):
-                with open(self.embeddings_cache_file, 'rb') as f:
-                    cached_data = pickle.load(f)
-                    if len(cached_data['texts']) == len(self.documents):
-                        print("📂 Loading cached embeddings...")
-                        self.document_texts = cached_data['texts']
-                        self.document_embeddings = cached_data['embeddings']
-                        return
-
-            # Create new embeddings
-            print("🔄 Creating document embeddings...")
-            self.document_texts = [doc.page_content for doc in self.documents]
-            self.document_embeddings = self.embedding_model.encode(self.document_texts)
-
-            # Cache the embeddings
-            with open(self.embeddings_cache_file, 'wb') as f:
-                pickle.dump({
-                    'texts': self.document_texts,
-                    'embeddings': self.document_embeddings
-                }, f)
+            self.embedding_model = get_embedding_model()
+            dimension = self.embedding_model.encode(["warm up"]).shape[1]
+
+            cached = self._load_cached_embeddings()
+            digests = [self.documents.digest(i) for i in range(len(self.documents))]
+            missing = [i for i, digest in enumerate(digests) if digest not in cached]
+
+            embeddings = np.zeros((len(digests), dimension), dtype=np.float32)
+            for i, digest in enumerate(digests):
+                if digest in cached:
+                    embeddings[i] = cached[digest]
+
+            if not missing:
+                print("📂 Loading cached embeddings...")
+                self.document_embeddings = embeddings
+                return
+
+            # Only embed chunks the cache doesn't know yet
+            print(f"🔄 Creating document embeddings for {len(missing)} chunks...")
+            embeddings[missing] = self.embedding_model.encode([self.documents.text(i) for i in missing])
+            self.document_embeddings = embeddings
+            self._save_cache()
 
             print("✅ Embeddings created and cached!")
 
@@ -80,32 +201,228 @@ class LocalEmbeddingRetriever:
             print("📝 Falling back to keyword matching...")
             self.use_embeddings = False
 
-    def get_relevant_documents(self, query: str, top_k: int = 3) -> List:
+    def _load_cached_embeddings(self) -> Dict:
+        """Map chunk digest -> cached vector, if the cache was built with the same runtime"""
+        if not os.path.exists(self.embeddings_cache_file):
+            return {}
+        with open(self.embeddings_cache_file, 'rb') as f:
+            cached_data = pickle.load(f)
+        # Vectors from different runtimes differ slightly, so never mix them
+        if cached_data.get('runtime', 'torch') != EMBEDDING_RUNTIME:
+            return {}
+        if 'digests' not in cached_data:
+            # Older caches stored the full chunk texts
+            return {text_digest(text): vector for text, vector in zip(cached_data['texts'], cached_data['embeddings'])}
+        return dict(zip(cached_data['digests'], cached_data['embeddings']))
+
+    def _save_cache(self):
+        """Write the live chunks' embeddings to the cache file atomically"""
+        with self._lock:
+            live = self.live
+            # Keyed by content hash; the texts themselves are not stored again
+            digests = [self.documents.digest(i) for i, alive in enumerate(live) if alive]
+            embeddings = self.document_embeddings[live]
+
+        # Per-process scratch name: every gunicorn worker saves the same cache
+        tmp_file = f"{self.embeddings_cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({
+                'digests': digests,
+                'embeddings': embeddings,
+                'runtime': EMBEDDING_RUNTIME
+            }, f)
+        os.replace(tmp_file, self.embeddings_cache_file)
+
+    def _snapshot(self):
+        with self._lock:
+            return self.documents, getattr(self, 'document_embeddings', None), self.live
+
+    def add_documents(self, chunks: List) -> int:
+        """Append chunks to the live index, embedding only the new chunks"""
+        self._check_writable()
+        with self._write_lock:
+            if self.dedup_index is not None:
+                documents, _, live = self._snapshot()
+                # Near-duplicates of live chunks only add a source to the existing chunk
+                with documents.editing() as existing:
+                    chunks = deduplicate_chunks(chunks, self.dedup_index, existing,
+                                                accept=lambda position: position >= len(live) or live[position])
+            if not chunks:
+                return 0
+
+            vectors = self._embed_chunks(chunks) if self.use_embeddings else None
+
+            with self._lock:
+                # Appending is safe for readers: they only index rows covered by their live mask
+                self.documents.extend(chunks)
+                self.live = np.concatenate([self.live, np.ones(len(chunks), dtype=bool)])
+                if self.use_embeddings:
+                    self.document_embeddings = np.vstack([self.document_embeddings, vectors])
+                self.version += 1
+
+            if self.use_embeddings:
+                self._save_cache()
+            return len(chunks)
+
+    def _embed_chunks(self, chunks: List):
+        """Vectors for new chunks; those another worker already embedded come from the cache"""
+        cached = self._load_cached_embeddings()
+        digests = [text_digest(chunk.page_content) for chunk in chunks]
+        missing = [i for i, digest in enumerate(digests) if digest not in cached]
+        vectors = np.zeros((len(chunks), self.document_embeddings.shape[1]), dtype=np.float32)
+        for i, digest in enumerate(digests):
+            if digest in cached:
+                vectors[i] = cached[digest]
+        if missing:
+            vectors[missing] = self.embedding_model.encode([chunks[i].page_content for i in missing])
+        return vectors
+
+    def remove_source(self, filename: str) -> int:
+        """Tombstone every chunk that came from filename; returns how many were removed"""
+        self._check_writable()
+        with self._write_lock:
+            with self._lock:
+                documents = self.documents
+                matches = np.zeros(len(self.live), dtype=bool)
+                for i in range(len(self.live)):
+                    if not self.live[i]:
+                        continue
+                    is_source = os.path.basename(documents.source(i)) == filename
+                    if not is_source and not documents.has_metadata(i, 'duplicate_sources'):
+                        continue
+                    metadata = documents.metadata(i)
+                    entries = metadata.get('duplicate_sources', [])
+                    duplicates = [entry for entry in entries if os.path.basename(entry['source']) != filename]
+                    if not is_source and len(duplicates) == len(entries):
+                        continue
+                    if is_source:
+                        if not duplicates:
+                            matches[i] = True
+                            continue
+                        # The same text is still in another file: keep the chunk, cite that file
+                        promoted = duplicates.pop(0)
+                        metadata['source'] = promoted['source']
+                        if promoted['page'] is None:
+                            metadata.pop('page', None)
+                        else:
+                            metadata['page'] = promoted['page']
+                    metadata['duplicate_sources'] = duplicates
+                    documents.set_metadata(i, metadata)
+
+                removed = int(np.count_nonzero(matches))
+                self.live = self.live & ~matches
+                self.version += 1
+                dead = len(self.live) - int(np.count_nonzero(self.live))
+
+            if dead and dead >= COMPACT_DEAD_RATIO * len(self.live):
+                self.compact()
+            if removed and self.use_embeddings:
+                self._save_cache()
+            return removed
+
+    def compact(self):
+        """Drop tombstoned chunks from the lists and the embedding matrix"""
+        with self._lock:
+            live = self.live
+            self.documents = self.documents.compact(live)
+            if self.use_embeddings:
+                self.document_embeddings = self.document_embeddings[live]
+            if self.dedup_index is not None:
+                dedup_index = NearDuplicateIndex(self.dedup_index.threshold)
+                for signature, alive in zip(self.dedup_index.signatures, live):
+                    if alive:
+                        dedup_index.add(signature)
+                self.dedup_index = dedup_index
+            self.live = np.ones(len(self.documents), dtype=bool)
+            self.version += 1
+
+    def chunk_digests(self) -> List[str]:
+        """Content hashes of the live chunks, cached per index version"""
+        version = self.version
+        cached = getattr(self, '_digests', None)
+        if cached and cached[0] == version:
+            return cached[1]
+        documents, _, live = self._snapshot()
+        digests = sorted(documents.digest(i).hex() for i, is_live in enumerate(live) if is_live)
+        self._digests = (version, digests)
+        return digests
+
+    def generation(self) -> str:
+        """Identifies the indexed content; changes whenever a chunk is added or removed"""
+        return hashlib.sha1("".join(self.chunk_digests()).encode()).hexdigest()[:16]
+
+    def live_count(self) -> int:
+        return int(np.count_nonzero(self.live))
+
+    def centroid(self):
+        """Normalized mean embedding of the live chunks, used to route queries to shards"""
+        _, embeddings, live = self._snapshot()
+        if embeddings is None or not live.any():
+            return None
+        centroid = embeddings[live].mean(axis=0)
+        return centroid / (np.linalg.norm(centroid) or 1.0)
+
+    def search_by_vector(self, query_embedding, top_k: int = TOP_K, min_score: float = MIN_SIMILARITY) -> List:
+        """[(score, document)] for an already encoded query"""
+        documents, embeddings, live = self._snapshot()
+        similarities = np.dot(embeddings, np.asarray(query_embedding).ravel())
+        similarities[~live] = -np.inf
+        return self._top_scored(similarities, top_k, documents, min_score)
+
+    def search_by_keywords(self, query: str, top_k: int = TOP_K) -> List:
+        """[(score, document)] by keyword overlap"""
+        return self._score_keywords(query, top_k)
+
+    def get_relevant_documents(self, query: str, top_k: int = TOP_K) -> List:
         """Find relevant documents using embeddings or fallback to keywords"""
         if self.use_embeddings:
             return self._get_documents_by_embedding(query, top_k)
         else:
             return self._get_documents_by_keywords(query, top_k)
 
+    def get_relevant_documents_batch(self, queries: List[str], top_k: int = TOP_K) -> List[List]:
+        """Retrieve for many queries at once: one encode call and one matrix multiply"""
+        if self.use_embeddings:
+            try:
+                documents, embeddings, live = self._snapshot()
+                query_embeddings = self.embedding_model.encode(list(queries))
+                similarities = np.dot(query_embeddings, embeddings.T)
+                similarities[:, ~live] = -np.inf
+                return [self._top_documents(row, top_k, documents) for row in similarities]
+            except Exception as e:
+                print(f"⚠️ Batch embedding search failed: {e}, falling back to keywords")
+        return [self._get_documents_by_keywords(query, top_k) for query in queries]
+
+    def _top_documents(self, similarities, top_k: int, documents: List) -> List:
+        """Top k documents for one row of similarity scores"""
+        return [doc for _, doc in self._top_scored(similarities, top_k, documents)]
+
+    def _top_scored(self, similarities, top_k: int, documents: List, min_score: float = MIN_SIMILARITY) -> List:
+        """Top k (score, document) pairs for one row of similarity scores"""
+        # Get top k most similar documents
+        top_indices = np.argsort(similarities)[::-1][:top_k]
+
+        # Filter out very low similarity scores
+        relevant_docs = []
+        for idx in top_indices:
+            if similarities[idx] > min_score:  # Minimum similarity threshold
+                relevant_docs.append((float(similarities[idx]), documents[idx]))
+
+        return relevant_docs
+
     def _get_documents_by_embedding(self, query: str, top_k: int) -> List:
         """Find documents using semantic similarity (embeddings)"""
         try:
+            documents, embeddings, live = self._snapshot()
+
             # Encode the query
             query_embedding = self.embedding_model.encode([query])
 
             # Calculate cosine similarity
-            similarities = np.dot(query_embedding, self.document_embeddings.T).flatten()
-
-            # Get top k most similar documents
-            top_indices = np.argsort(similarities)[::-1][:top_k]
+            similarities = np.dot(query_embedding, embeddings.T).flatten()
+            similarities[~live] = -np.inf
 
-            # Filter out very low similarity scores
-            relevant_docs = []
-            for idx in top_indices:
-                if similarities[idx] > 0.1:  # Minimum similarity threshold
-                    relevant_docs.append(self.documents[idx])
-
-            return relevant_docs
+            return self._top_documents(similarities, top_k, documents)
 
         except Exception as e:
             print(f"⚠️ Embedding search failed: {e}, falling back to keywords")
@@ -113,14 +430,26 @@ class LocalEmbeddingRetriever:
 
     def _get_documents_by_keywords(self, query: str, top_k: int) -> List:
         """Fallback keyword-based search (improved version)"""
+        return [doc for _, doc in self._score_keywords(query, top_k)]
+
+    def _score_keywords(self, query: str, top_k: int) -> List:
+        documents, _, live = self._snapshot()
         query_lower = query.lower()
         query_words = set(query_lower.split())
 
+        # A snapshot's inverted index narrows the scan to chunks that can match a query word
+        rows = range(len(live))
+        candidates = self.lexical_index.candidates(query_lower, documents) if self.lexical_index is not None else None
+        if candidates is not None:
+            rows = sorted(candidates)
+
         # Score documents based on keyword overlap
         scored_docs = []
-        for doc in self.documents:
-            content = doc.page_content.lower()
-            source = doc.metadata.get('source', '').lower()
+        for i in rows:
+            if not live[i]:
+                continue
+            content = documents.text(i).lower()
+            source = documents.source(i).lower()
 
             # Count matches in content
             content_matches = sum(1 for word in query_words if word in content)
@@ -134,42 +463,71 @@ class LocalEmbeddingRetriever:
             total_score = content_matches + filename_matches + phrase_bonus
 
             if total_score > 0:
-                scored_docs.append((doc, total_score))
+                scored_docs.append((i, total_score))
 
         # Sort by score and return top k
         scored_docs.sort(key=lambda x: x[1], reverse=True)
-        return [doc for doc, score in scored_docs[:top_k]]
+        return [(score, documents[i]) for i, score in scored_docs[:top_k]]
+
+
+def load_file_chunks(file: Path, splitter=None) -> List:
+    """Parse one policy file and split it into chunks, streaming page by page"""
+    _configure_langchain()
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    if splitter is None:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    suffix = file.suffix.lower()
+    if suffix == ".pdf":
+        loader = PyPDFLoader(str(file))
+    elif suffix == ".txt":
+        loader = TextLoader(str(file))
+    elif suffix in [".xlsx", ".xls", ".docx"]:
+        loader = None
+    else:
+        raise ValueError(f"Unsupported file type: {file.suffix}")
+
+    if loader is not None:
+        documents = loader.lazy_load()
+    else:
+        # langchain_community's Excel and Word loaders need `unstructured`; utils/loader.py uses
+        # pandas and python-docx instead, and yields one Document per sheet with its name
+        from utils.loader import load_policy_file
+        documents = load_policy_file(str(file))
+
+    # Only the chunks are kept, never a whole parsed file
+    chunks = []
+    for document in documents:
+        document.metadata["source"] = str(file)
+        chunks.extend(splitter.split_documents([document]))
+    return chunks
 
 
 def build_retriever():
     """Build retriever with local embeddings (no API needed)"""
     data_path = Path("data")
-    files = list(data_path.glob("*.pdf")) + list(data_path.glob("*.txt")) + list(data_path.glob("*.xlsx")) + list(data_path.glob("*.xls"))
+    files = [file for suffix in SUPPORTED_SUFFIXES for file in data_path.glob(f"*{suffix}")]
 
     if not files:
-        raise ValueError("No policy files found in 'data' folder. Please add some PDF/TXT/XLSX files.")
+        raise ValueError("No policy files found in 'data' folder. Please add some PDF/TXT/XLSX/DOCX files.")
 
-    documents = []
+    _configure_langchain()
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    chunks = []
     for file in files:
         try:
-            if file.suffix == ".pdf":
-                loader = PyPDFLoader(str(file))
-            elif file.suffix == ".txt":
-                loader = TextLoader(str(file))
-            elif file.suffix in [".xlsx", ".xls"]:
-                loader = UnstructuredExcelLoader(str(file))
-            else:
-                continue
-            documents.extend(loader.load())
+            chunks.extend(load_file_chunks(file, splitter))
         except Exception as e:
             print(f"⚠️ Could not load {file.name}: {e}")
             continue
 
-    if not documents:
+    if not chunks:
         raise ValueError("No documents could be loaded successfully.")
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_documents(documents)
     print(f"✅ Loaded {len(chunks)} text chunks")
 
     # Use local embeddings if available, otherwise fallback to keywords
@@ -181,42 +539,14 @@ def build_retriever():
     return LocalEmbeddingRetriever(chunks, use_embeddings=use_embeddings)
 
 
-def get_qa_chain():
-    """Create QA system with local embeddings (no API quota issues)"""
-    retriever = build_retriever()
+NO_DOCUMENTS_ANSWER = "I couldn't find any relevant information in the policy documents for your question. Please try rephrasing your question or ask about the topics covered in your uploaded documents."
 
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.3,
-        max_tokens=500,      # Limit response length
-        timeout=30,          # 30 second timeout
-        max_retries=1,       # Reduce retries from default 6 to 1
-        request_timeout=20   # Request timeout
-    )
 
-    def qa_function(query):
-        """QA function with local document retrieval"""
-        global last_request_time
-
-        try:
-            # Rate limiting for LLM API calls only
-            current_time = time.time()
-            time_since_last = current_time - last_request_time
-            if time_since_last < MIN_REQUEST_INTERVAL:
-                time.sleep(MIN_REQUEST_INTERVAL - time_since_last)
-
-            # Retrieve relevant documents (this is now local/free)
-            docs = retriever.get_relevant_documents(query)
-
-            if not docs:
-                return "I couldn't find any relevant information in the policy documents for your question. Please try rephrasing your question or ask about the topics covered in your uploaded documents."
-
-            # Combine context from retrieved documents
-            context = "\n\n".join([doc.page_content for doc in docs])
-
-            # Create prompt with context
-            prompt = f"""You are a professional Educational Policy Assistant. Your role is to answer questions based strictly on the provided context.
+def build_prompt(context: str, query: str, history: str = "") -> str:
+    """Policy assistant prompt for a question, its retrieved context and optional conversation history"""
+    # History is already compacted by the session store (summary + last turns), so the prompt stays bounded
+    history_block = f"Conversation so far (use it only to resolve what the question refers to):\n{history}\n\n" if history else ""
+    return f"""You are a professional Educational Policy Assistant. Your role is to answer questions based strictly on the provided context.
 
 Instructions:
 1. **Tone**: Maintain a professional, helpful, and polite tone at all times.
@@ -228,34 +558,166 @@ Instructions:
 Context:
 {context}
 
-Question: {query}
+{history_block}Question: {query}
 
 Answer:"""
 
-            # Update last request time before making the API call
-            last_request_time = time.time()
 
-            # Generate response with retry logic
-            max_retries = 3
-            for attempt in range(max_retries):
+def _lock_rate_limit_file():
+    """Open and exclusively lock the shared schedule, or None to limit this process only"""
+    if fcntl is None:
+        return None
+    try:
+        fd = os.open(RATE_LIMIT_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError as e:
+        print(f"⚠️ Rate limit file unavailable ({e}), limiting per process")
+        return None
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    return fd
+
+
+def wait_for_rate_limit(max_wait: float = None) -> bool:
+    """Reserve the next LLM request slot (MIN_REQUEST_INTERVAL apart on this host) and sleep until it
+
+    Returns False without reserving anything if the slot is further away than max_wait.
+    """
+    global last_request_time
+
+    with _rate_limit_lock:
+        fd = _lock_rate_limit_file()
+        try:
+            if fd is not None:
                 try:
-                    response = llm.invoke(prompt)
-                    return response.content
-                except Exception as api_error:
-                    if "429" in str(api_error) and attempt < max_retries - 1:
-                        wait_time = (attempt + 1) * 5
-                        print(f"Rate limited, waiting {wait_time} seconds before retry...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        raise api_error
+                    last_request_time = max(last_request_time, float(os.read(fd, 64) or 0))
+                except ValueError:
+                    pass  # Unreadable schedule; the write below replaces it
+            now = time.time()
+            slot = max(now, last_request_time + MIN_REQUEST_INTERVAL)
+            if max_wait is not None and slot - now > max_wait:
+                return False
+            last_request_time = slot
+            if fd is not None:
+                os.ftruncate(fd, 0)
+                os.pwrite(fd, repr(slot).encode(), 0)
+        finally:
+            if fd is not None:
+                os.close(fd)  # Also releases the lock
+
+    if slot > now:
+        time.sleep(slot - now)
+    return True
+
+
+BUSY_ANSWER = "The policy assistant is busy right now and couldn't answer in time. Please try again in a moment."
+RATE_LIMITED_ANSWER = "I'm currently experiencing high traffic and need to slow down requests. Please wait a moment and try again."
+ERROR_ANSWER_PREFIX = "I apologize, but I encountered an error while processing your question:"
+
+
+def error_answer(error: Exception) -> str:
+    """User-facing answer for a failed question"""
+    if isinstance(error, (CircuitOpenError, DeadlineExceededError)):
+        return BUSY_ANSWER
+    if "429" in str(error):
+        return RATE_LIMITED_ANSWER
+    return f"{ERROR_ANSWER_PREFIX} {str(error)}"
+
+
+def is_error_answer(answer: str) -> bool:
+    """Whether answer came from error_answer rather than from the documents"""
+    return answer in (BUSY_ANSWER, RATE_LIMITED_ANSWER) or answer.startswith(ERROR_ANSWER_PREFIX)
+
+
+def get_qa_chain(retriever=None):
+    """Create QA system with local embeddings (no API quota issues)
+
+    Returns a callable answering one question. Its .batch(queries) attribute answers
+    many questions with one encode, one similarity matrix multiply and concurrent
+    LLM calls under the shared rate limiter. A given retriever (e.g. a snapshot that
+    was published after startup) is used as-is instead of loading or building one.
+    """
+    if retriever is None:
+        if INDEX_SNAPSHOT_DIR:
+            from index_snapshot import load_current_snapshot
+            retriever = load_current_snapshot(INDEX_SNAPSHOT_DIR)
+        elif SHARDED_INDEX:
+            from sharded_retriever import build_sharded_retriever
+            retriever = build_sharded_retriever()
+        else:
+            retriever = build_retriever()
+
+    if os.getenv("NEXBOT_FAKE_LLM", "0") == "1":
+        # Local stand-in with injectable latency/errors, see llm_dispatcher.FakeLLM
+        print("🧪 Using fake LLM")
+        llm = FakeLLM.from_env()
+    else:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
+            temperature=0.3,
+            max_tokens=500,      # Limit response length
+            timeout=30,          # 30 second timeout
+            max_retries=1,       # Reduce retries from default 6 to 1
+            request_timeout=20   # Request timeout
+        )
+
+    # Concurrency cap, deadlines, circuit breaker and optional hedging around the LLM
+    dispatcher = LLMDispatcher(llm, before_call=wait_for_rate_limit)
+
+    def generate_answer(query, docs, history="", cache_query=None):
+        """Call the LLM for one question whose documents are already retrieved"""
+        if not docs:
+            return NO_DOCUMENTS_ANSWER
+
+        # Combine context from retrieved documents; merged duplicates name their other files
+        context = "\n\n".join([context_text(doc) for doc in docs])
+        prompt = build_prompt(context, query, history)
+
+        # Falls back to the last good answer for the same question if the LLM is failing
+        return dispatcher.invoke(prompt, cache_key=" ".join((cache_query or query).lower().split()))
+
+    def qa_function(query, history="", search_query=None):
+        """QA function with local document retrieval
+
+        search_query (a follow-up rewritten with the conversation's topic) is used for
+        retrieval; history is the session's compact transcript for the prompt.
+        """
+        try:
+            # Retrieve relevant documents (this is now local/free)
+            docs = qa_function.retriever.get_relevant_documents(search_query or query)
+            return generate_answer(query, docs, history, cache_query=search_query)
 
         except Exception as e:
             print(f"Error in QA: {e}")
-            if "429" in str(e):
-                return "I'm currently experiencing high traffic and need to slow down requests. Please wait a moment and try again."
-            return f"I apologize, but I encountered an error while processing your question: {str(e)}"
+            return error_answer(e)
 
+    def qa_batch_function(queries, max_concurrency=BATCH_MAX_CONCURRENCY):
+        """Answer several questions; returns [{'query', 'answer', 'error'}] in input order"""
+        queries = list(queries)
+        if not queries:
+            return []
+
+        try:
+            docs_per_query = qa_function.retriever.get_relevant_documents_batch(queries)
+        except Exception as e:
+            print(f"Error in batch retrieval: {e}")
+            return [{"query": query, "answer": None, "error": str(e)} for query in queries]
+
+        def answer_one(index):
+            try:
+                answer = generate_answer(queries[index], docs_per_query[index])
+                return {"query": queries[index], "answer": answer, "error": None}
+            except Exception as e:
+                print(f"Error in batch QA item {index}: {e}")
+                return {"query": queries[index], "answer": None, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(queries)))) as pool:
+            return list(pool.map(delegate(answer_one), range(len(queries))))
+
+    qa_function.batch = qa_batch_function
+    qa_function.dispatcher = dispatcher
+    # Looked up on every call, so a new index (e.g. a reloaded snapshot) can be swapped in
+    qa_function.retriever = retriever
     return qa_function
 
 
@@ -264,6 +726,9 @@ def rebuild_embeddings_cache():
     if os.path.exists("document_embeddings.pkl"):
         os.remove("document_embeddings.pkl")
         print("🗑️ Cleared old embeddings cache")
+    for shard_cache in Path("indexes").glob("*.pkl"):
+        shard_cache.unlink()
+        print(f"🗑️ Cleared {shard_cache.name} collection cache")
     print("🔄 Embeddings will be rebuilt on next query")
 
 def force_rebuild_now():
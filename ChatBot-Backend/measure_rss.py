@@ -0,0 +1,53 @@
+"""Report per-process memory for a gunicorn master and its workers (Linux only)
+
+Usage: python measure_rss.py <master_pid>
+
+RSS counts shared pages in every process that maps them; PSS splits them between
+the sharers, so the PSS total is the real memory cost of the deployment.
+"""
+import os
+import sys
+
+FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+
+def read_smaps_rollup(pid):
+    """Return the smaps_rollup counters for a process in kB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].rstrip(":") in FIELDS:
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return values
+
+
+def child_pids(pid):
+    """Direct children of a process"""
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return children
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+
+    master = int(sys.argv[1])
+    processes = [("master", master)] + [("worker", pid) for pid in child_pids(master)]
+
+    print(f"{'role':<8}{'pid':>8}" + "".join(f"{field + ' MB':>18}" for field in FIELDS))
+    totals = dict.fromkeys(FIELDS, 0)
+    for role, pid in processes:
+        values = read_smaps_rollup(pid)
+        for field in FIELDS:
+            totals[field] += values.get(field, 0)
+        print(f"{role:<8}{pid:>8}" + "".join(f"{values.get(field, 0) / 1024:>18.1f}" for field in FIELDS))
+    print(f"{'total':<16}" + "".join(f"{totals[field] / 1024:>18.1f}" for field in FIELDS))
+
+
+if __name__ == "__main__":
+    main()
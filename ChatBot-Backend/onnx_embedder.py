@@ -0,0 +1,241 @@
+"""Quantized ONNX runtime for the all-MiniLM-L6-v2 embedding model
+
+Export once (needs torch + transformers + onnxruntime):
+    python onnx_embedder.py export
+Check the int8 model against the PyTorch sentence-transformers embeddings:
+    python onnx_embedder.py validate
+Compare cold start, query latency and memory of both runtimes:
+    python onnx_embedder.py benchmark
+
+Serving only needs onnxruntime and tokenizers; select it with EMBEDDING_RUNTIME=onnx.
+"""
+import os
+import sys
+import json
+import time
+import inspect
+import subprocess
+import numpy as np
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+FP32_MODEL_FILE = "model.onnx"
+INT8_MODEL_FILE = "model-int8.onnx"
+MAX_SEQ_LENGTH = 256  # Same truncation as the sentence-transformers model config
+
+MIN_COSINE_AGREEMENT = 0.98
+
+SAMPLE_TEXTS = [
+    "What is the 10% attendance waiver criteria?",
+    "How many MOOC credits can be transferred in a semester?",
+    "Explain the CARE guidelines for students.",
+    "Who is eligible for duty leave during a hackathon?",
+    "Can an internship be counted towards grade upgrade?",
+    "What documents are needed for recognition of prior learning?",
+    "Hello",
+    "Students participating in national level technical competitions may claim attendance benefit.",
+]
+
+
+class OnnxEmbeddingModel:
+    """Drop-in replacement for SentenceTransformer.encode backed by an int8 ONNX model"""
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, model_file: str = INT8_MODEL_FILE, num_threads: int = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found. Run: python onnx_embedder.py export")
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is None:
+            num_threads = int(os.getenv("ONNX_NUM_THREADS", "0"))  # 0 lets onnxruntime decide
+        options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Mean-pooled, L2-normalized embeddings, matching all-MiniLM-L6-v2's pipeline"""
+        if isinstance(sentences, str):
+            sentences = [sentences]
+
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(list(sentences[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+
+        if not batches:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.vstack(batches)
+
+
+def _TokenEmbeddingModule(model):
+    """Wrap a transformers model with a fixed positional signature for the exporter"""
+    import torch
+
+    class TokenEmbeddingModule(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    return TokenEmbeddingModule()
+
+
+def export_onnx_model(output_dir: str = ONNX_MODEL_DIR):
+    """Export the transformer to ONNX and write an int8 dynamically quantized copy"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"🔄 Exporting {MODEL_NAME} to ONNX...")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModel.from_pretrained(MODEL_NAME)
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, FP32_MODEL_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ["input_ids", "attention_mask", "token_type_ids"]}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    # Newer torch defaults to the dynamo exporter (extra onnxscript dependency); the
+    # TorchScript exporter handles this plain BERT graph fine
+    export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddingModule(model),
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **export_kwargs,
+        )
+
+    int8_path = os.path.join(output_dir, INT8_MODEL_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(output_dir)  # Writes tokenizer.json for the tokenizers runtime
+
+    print(f"✅ Wrote {fp32_path} ({os.path.getsize(fp32_path) / 1024 / 1024:.1f} MB) "
+          f"and {int8_path} ({os.path.getsize(int8_path) / 1024 / 1024:.1f} MB)")
+
+
+def _validation_texts(limit: int = 500):
+    """Sample queries plus corpus chunks from data/ when available"""
+    from pathlib import Path
+    from local_embedding_retriever import SUPPORTED_SUFFIXES, load_file_chunks
+
+    texts = list(SAMPLE_TEXTS)
+    # The embedding cache only keeps chunk hashes, so parse the documents again
+    for file in sorted(file for suffix in SUPPORTED_SUFFIXES for file in Path("data").glob(f"*{suffix}")):
+        if len(texts) - len(SAMPLE_TEXTS) >= limit:
+            break
+        try:
+            texts.extend(chunk.page_content for chunk in load_file_chunks(file))
+        except Exception as e:
+            print(f"⚠️ Could not load {file.name}: {e}")
+    return texts[:len(SAMPLE_TEXTS) + limit]
+
+
+def validate(model_dir: str = ONNX_MODEL_DIR) -> bool:
+    """Cosine agreement between PyTorch and int8 ONNX embeddings of the same texts"""
+    from sentence_transformers import SentenceTransformer
+
+    texts = _validation_texts()
+    reference = SentenceTransformer("all-MiniLM-L6-v2").encode(texts, normalize_embeddings=True)
+    candidate = OnnxEmbeddingModel(model_dir).encode(texts)
+
+    agreement = np.sum(reference * candidate, axis=1)
+    print(f"📏 Cosine agreement over {len(texts)} texts: "
+          f"min={agreement.min():.4f} mean={agreement.mean():.4f} p01={np.percentile(agreement, 1):.4f}")
+
+    # Ranking agreement matters more than raw vectors for retrieval
+    queries = len(SAMPLE_TEXTS)
+    if len(texts) > queries:
+        reference_top = np.argsort(-(reference[:queries] @ reference[queries:].T), axis=1)[:, :3]
+        candidate_top = np.argsort(-(candidate[:queries] @ candidate[queries:].T), axis=1)[:, :3]
+        overlap = np.mean([len(set(a) & set(b)) / 3 for a, b in zip(reference_top, candidate_top)])
+        print(f"📏 Top-3 retrieval overlap on sample queries: {overlap:.2%}")
+
+    passed = agreement.min() >= MIN_COSINE_AGREEMENT
+    print("✅ Validation passed" if passed else f"❌ Minimum agreement below {MIN_COSINE_AGREEMENT}")
+    return passed
+
+
+def _benchmark_runtime(runtime: str, repeats: int = 200):
+    """Measure one runtime in this (fresh) process and print a JSON result line"""
+    import resource
+
+    start = time.perf_counter()
+    if runtime == "onnx":
+        model = OnnxEmbeddingModel()
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("all-MiniLM-L6-v2")
+    model.encode([SAMPLE_TEXTS[0]])
+    cold_start = time.perf_counter() - start
+
+    latencies = []
+    for i in range(repeats):
+        query = SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+        t = time.perf_counter()
+        model.encode([query])
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    print(json.dumps({
+        "runtime": runtime,
+        "cold_start_s": round(cold_start, 2),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def benchmark():
+    """Run each runtime in its own process so cold start and memory are not shared"""
+    print(f"{'runtime':<8}{'cold start s':>14}{'p50 ms':>10}{'p95 ms':>10}{'max RSS MB':>12}")
+    for runtime in ("torch", "onnx"):
+        result = subprocess.run([sys.executable, __file__, "_benchmark-one", runtime],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{runtime:<8} failed: {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'unknown error'}")
+            continue
+        row = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{runtime:<8}{row['cold_start_s']:>14}{row['query_p50_ms']:>10}{row['query_p95_ms']:>10}{row['max_rss_mb']:>12}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "export":
+        export_onnx_model()
+    elif command == "validate":
+        sys.exit(0 if validate() else 1)
+    elif command == "benchmark":
+        benchmark()
+    elif command == "_benchmark-one":
+        _benchmark_runtime(sys.argv[2])
+    else:
+        print(__doc__)
+        sys.exit(1)
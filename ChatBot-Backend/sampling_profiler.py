@@ -0,0 +1,183 @@
+"""Low-overhead sampling profiler for live requests
+
+A background thread reads every thread's current stack (sys._current_frames) every
+PROFILE_INTERVAL_MS while at least one capture is running, and nothing at all otherwise.
+Captures are written in the folded-stack format understood by flamegraph.pl, speedscope
+and inferno:
+
+    flamegraph.pl profiles/<id>.folded > profile.svg
+"""
+import os
+import sys
+import math
+import time
+import uuid
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+PROFILE_DIR = "profiles"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+MAX_PROFILE_SECONDS = 300
+MAX_STACK_DEPTH = 64
+MAX_SAVED_PROFILES = 50
+
+# Pool thread id -> id of the request thread it is currently working for
+_delegated = {}
+
+
+def delegate(func):
+    """Wrap func so that, wherever it runs, its samples count toward the calling thread's request profile"""
+    owner = _delegated.get(threading.get_ident(), threading.get_ident())
+
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        _delegated[ident] = owner
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _delegated.pop(ident, None)
+    return run
+
+
+def frame_label(frame, leaf: bool = False) -> str:
+    """function (file) for callers; the leaf also gets its line, e.g. to tell a lock wait from a sleep"""
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    if leaf:
+        return f"{code.co_name} ({filename}:{frame.f_lineno})"
+    return f"{code.co_name} ({filename})"
+
+
+def fold_stack(frame, thread_name: str) -> str:
+    """Root-to-leaf frames joined by ';', rooted at the thread name"""
+    labels = []
+    leaf = True
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame, leaf))
+        leaf = False
+        frame = frame.f_back
+    labels.append(thread_name)
+    # flamegraph.pl splits the count off at the last space, so spaces inside frames are fine
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Collects stack samples for time windows (all threads) or single requests
+
+    A request capture follows its thread plus any pool threads running work it handed
+    off through delegate() (LLM calls, shard searches, batch answers).
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, output_dir: str = PROFILE_DIR):
+        self.interval = interval_ms / 1000.0
+        self.output_dir = output_dir
+        self._captures = {}  # capture id -> capture
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def start(self, label: str, seconds: float = None, thread_id: Optional[int] = None) -> str:
+        """Begin a capture; thread_id limits it to one request thread, seconds ends it automatically"""
+        capture_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        # NaN would compare false against every deadline, so it gets the maximum too
+        seconds = MAX_PROFILE_SECONDS if seconds is None or math.isnan(seconds) else min(seconds, MAX_PROFILE_SECONDS)
+        capture = {
+            "id": capture_id,
+            "label": label,
+            "thread_id": thread_id,
+            "started_at": time.time(),
+            "ends_at": time.time() + seconds,
+            "samples": Counter(),
+            "sample_count": 0,
+        }
+        with self._lock:
+            self._captures[capture_id] = capture
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._sampler.start()
+        return capture_id
+
+    def stop(self, capture_id: str) -> Optional[Dict]:
+        """End a capture, write its folded stacks and return its summary"""
+        with self._lock:
+            capture = self._captures.pop(capture_id, None)
+        if capture is None:
+            return None
+        return self._save(capture)
+
+    def stop_all(self) -> List[Dict]:
+        with self._lock:
+            ids = list(self._captures)
+        return [summary for summary in (self.stop(capture_id) for capture_id in ids) if summary]
+
+    def active(self) -> List[Dict]:
+        with self._lock:
+            return [{"id": c["id"], "label": c["label"], "samples": c["sample_count"],
+                     "ends_in": max(0, round(c["ends_at"] - time.time()))} for c in self._captures.values()]
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._captures:
+                    self._sampler = None
+                    return
+                captures = list(self._captures.values())
+
+            now = time.time()
+            expired = [c["id"] for c in captures if now >= c["ends_at"]]
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for capture in captures:
+                if capture["id"] in expired:
+                    continue
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id:
+                        continue
+                    if capture["thread_id"] is not None and _delegated.get(thread_id, thread_id) != capture["thread_id"]:
+                        continue
+                    capture["samples"][fold_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+                capture["sample_count"] += 1
+            del frames
+
+            for capture_id in expired:
+                self.stop(capture_id)
+            time.sleep(self.interval)
+
+    def _save(self, capture) -> Dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{capture['id']}.folded")
+        with open(path, "w") as f:
+            for stack, count in capture["samples"].most_common():
+                f.write(f"{stack} {count}\n")
+        self._prune()
+
+        duration = time.time() - capture["started_at"]
+        print(f"🔬 Profile {capture['id']} ({capture['label']}): {capture['sample_count']} samples over {duration:.1f}s")
+        return {
+            "id": capture["id"],
+            "label": capture["label"],
+            "samples": capture["sample_count"],
+            "duration_seconds": round(duration, 2),
+            "file": os.path.basename(path),
+        }
+
+    def _prune(self):
+        """Keep only the newest MAX_SAVED_PROFILES dumps"""
+        dumps = sorted(
+            (os.path.join(self.output_dir, name) for name in os.listdir(self.output_dir) if name.endswith(".folded")),
+            key=os.path.getmtime,
+        )
+        for path in dumps[:-MAX_SAVED_PROFILES]:
+            os.remove(path)
+
+    def saved(self) -> List[Dict]:
+        """Saved dumps, newest first"""
+        if not os.path.isdir(self.output_dir):
+            return []
+        dumps = []
+        for name in os.listdir(self.output_dir):
+            if name.endswith(".folded"):
+                path = os.path.join(self.output_dir, name)
+                dumps.append({"file": name, "bytes": os.path.getsize(path), "modified": os.path.getmtime(path)})
+        return sorted(dumps, key=lambda dump: dump["modified"], reverse=True)
@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import time
+import uuid
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+# Bounds: every session's history stays under these however long the conversation runs
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "5000"))
+RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "2"))  # Turns kept verbatim (trimmed)
+MAX_QUESTION_CHARS = 300
+MAX_ANSWER_CHARS = 400
+MAX_SUMMARY_CHARS = 600  # Rolling summary of the turns older than RECENT_TURNS
+SESSION_SWEEP_INTERVAL = 60  # Also how often MAX_SESSIONS is enforced
+SESSION_DIR = os.getenv("SESSION_DIR", "sessions")
+_session_id_re = re.compile(r"^[0-9a-f]{32}$")
+
+# Follow-ups that only make sense with the previous question's topic. Pronouns count only
+# where they point back ("does that apply to MOOCs?"), not as determiners or dummy subjects
+# ("this semester", "is there a waiver", "is it possible to ...").
+FOLLOW_UP_RE = re.compile(
+    r"^(what|how) about\b|^and\b|^also\b|^what if\b|^same\b|^(for|in|with) \w+|"
+    r"^(it|its|this|that|these|those|they|them)\b|"
+    r"\b(its|they|them|above|previous)\b|\bthe same\b|"
+    r"\bit\b(?!\s+(possible|necessary|mandatory|compulsory|allowed|required|true|okay|ok)\s+(to|for|that)\b)|"
+    r"\b(this|that|these|those)\s*(\?|$|\b(is|are|was|were|mean|means|apply|applies|count|counts|"
+    r"cover|covers|include|includes|one|ones)\b)|"
+    r"\bthere\s*\??$",
+    re.IGNORECASE,
+)
+MAX_FOLLOW_UP_WORDS = 12
+TOPIC_TERMS = 6
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "am", "do", "does", "did",
+    "i", "me", "my", "we", "our", "you", "your", "he", "she", "it", "its", "they", "them",
+    "this", "that", "these", "those", "there", "what", "which", "who", "whom", "when",
+    "where", "why", "how", "can", "could", "should", "would", "will", "shall", "may",
+    "might", "must", "of", "to", "in", "on", "for", "with", "about", "at", "by", "from",
+    "and", "or", "but", "if", "so", "as", "any", "all", "also", "same", "please", "tell",
+    "explain", "know", "want", "get", "need", "much", "many", "more", "than", "then",
+}
+
+_word_re = re.compile(r"[a-z0-9%]+(?:[-'][a-z0-9]+)*")
+
+
+def _trim(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def _first_sentence(text: str, limit: int) -> str:
+    plain = re.sub(r"[*_#`>]+", "", text)
+    return _trim(re.split(r"(?<=[.!?])\s", " ".join(plain.split()), maxsplit=1)[0], limit)
+
+
+def topic_terms(text: str) -> List[str]:
+    """Content words of a question, in order, without duplicates"""
+    terms = []
+    for word in _word_re.findall(text.lower()):
+        if word not in STOPWORDS and len(word) > 1 and word not in terms:
+            terms.append(word)
+    return terms
+
+
+def is_follow_up(message: str) -> bool:
+    return len(message.split()) <= MAX_FOLLOW_UP_WORDS and bool(FOLLOW_UP_RE.search(message.strip()))
+
+
+class SessionStore:
+    """Conversation sessions with TTL eviction and a size cap, shared by all workers
+
+    Each session is a small JSON file under SESSION_DIR whose mtime is its last update, so a
+    follow-up finds its history whichever gunicorn worker it lands on. Each session keeps the
+    last RECENT_TURNS turns (trimmed) plus a rolling extractive summary of older ones, so what
+    gets added to a prompt is bounded.
+    """
+
+    def __init__(self, root: str = SESSION_DIR, ttl: int = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS,
+                 recent_turns: int = RECENT_TURNS):
+        self.root = root
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.recent_turns = recent_turns
+        os.makedirs(root, exist_ok=True)
+        # Serializes read-modify-write within this process; across workers the last write wins,
+        # which only matters if one client sends two messages at once
+        self._lock = Lock()
+        self._sweeper = None
+
+    def _new_session(self) -> Dict:
+        return {"turns": [], "summary": "", "topic": []}
+
+    def _path(self, session_id: Optional[str]) -> Optional[str]:
+        if not session_id or not _session_id_re.match(session_id):
+            return None
+        return os.path.join(self.root, f"{session_id}.json")
+
+    def _get(self, session_id: Optional[str]) -> Optional[Dict]:
+        path = self._path(session_id)
+        if path is None:
+            return None
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save(self, session_id: str, session: Dict):
+        path = self._path(session_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(session, f)
+        # rename is atomic, so other workers never read a partial session
+        os.replace(tmp_path, path)
+
+    def resolve(self, session_id: Optional[str]) -> str:
+        """The client's session id if it is still live, otherwise a new one"""
+        if self._get(session_id) is not None:
+            return session_id
+        return uuid.uuid4().hex
+
+    def context(self, session_id: Optional[str], message: str) -> Tuple[str, str]:
+        """(search query, compact history text) for a new message in a session"""
+        session = self._get(session_id)
+        if session is None:
+            return message, ""
+        turns = session["turns"]
+        summary = session["summary"]
+        topic = session["topic"]
+
+        search_query = message
+        if topic and is_follow_up(message):
+            # Carry the previous topic into retrieval: "what about PhD students?" ->
+            # "what about PhD students? attendance waiver criteria"
+            missing = [term for term in topic if term not in topic_terms(message)]
+            if missing:
+                search_query = f"{message} {' '.join(missing)}"
+
+        lines = []
+        if summary:
+            lines.append(f"Earlier: {summary}")
+        for question, answer in turns:
+            lines.append(f"User: {question}")
+            lines.append(f"Assistant: {answer}")
+        return search_query, "\n".join(lines)
+
+    def record(self, session_id: str, question: str, answer: str, search_query: str = None):
+        """Append a finished turn, folding the oldest turns into the summary"""
+        if self._path(session_id) is None:
+            return
+        with self._lock:
+            session = self._get(session_id) or self._new_session()
+
+            session["turns"].append((_trim(question, MAX_QUESTION_CHARS), _first_sentence(answer, MAX_ANSWER_CHARS)))
+            while len(session["turns"]) > self.recent_turns:
+                old_question, old_answer = session["turns"].pop(0)
+                summary = f"{session['summary']} Q: {old_question} A: {_first_sentence(old_answer, 150)}".strip()
+                # Keep the most recent part of the summary
+                session["summary"] = summary[-MAX_SUMMARY_CHARS:]
+
+            # A follow-up keeps the current topic; a standalone question starts a new one
+            terms = topic_terms(search_query or question)
+            if terms:
+                session["topic"] = terms[:TOPIC_TERMS]
+            self._save(session_id, session)
+
+    def clear(self, session_id: str) -> bool:
+        path = self._path(session_id)
+        if path is None:
+            return False
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _scan(self):
+        """(last update, path) of every session file and leftover scratch file, oldest first"""
+        entries = []
+        for entry in os.scandir(self.root):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+        return sorted(entries)
+
+    def sweep(self) -> int:
+        """Drop expired sessions, then the least recently updated ones over the cap"""
+        cutoff = time.time() - self.ttl
+        entries = self._scan()
+        live = [path for mtime, path in entries if mtime >= cutoff and path.endswith(".json")]
+        expired = [path for mtime, path in entries if mtime < cutoff]
+        victims = expired + live[:max(0, len(live) - self.max_sessions)]
+        for path in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Another worker swept it first
+        return len(victims)
+
+    def start_sweeper(self, interval: int = SESSION_SWEEP_INTERVAL):
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"⚠️ Session sweep failed: {e}")
+
+        self._sweeper = Thread(target=run, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stats(self) -> Dict:
+        sessions = sum(1 for _, path in self._scan() if path.endswith(".json"))
+        return {"sessions": sessions, "max_sessions": self.max_sessions, "ttl_seconds": self.ttl}
@@ -0,0 +1,262 @@
+import os
+import re
+import hashlib
+import json
+from pathlib import Path
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from sampling_profiler import delegate
+from local_embedding_retriever import (
+    LocalEmbeddingRetriever, EMBEDDINGS_AVAILABLE, MIN_SIMILARITY, SUPPORTED_SUFFIXES, TOP_K,
+    load_file_chunks, source_name,
+)
+
+INDEX_DIR = "indexes"
+COLLECTIONS_FILE = "collections.json"  # Admin-assigned {filename: collection} overrides
+
+# How many shards a query is searched in (the best-matching ones by centroid/keywords)
+SHARD_FANOUT = int(os.getenv("SHARD_FANOUT", "2"))
+# Extra routing score when the query mentions one of a collection's keywords
+KEYWORD_ROUTE_BONUS = 0.3
+
+# Filename keyword -> collection, first match wins; anything else goes to "general"
+COLLECTION_RULES = [
+    ("attendance", ["attendance", "duty_leave", "care"]),
+    ("mooc", ["mooc", "scrgm", "nptel", "certification"]),
+    ("hackathon", ["hackathon", "competition"]),
+    ("internship", ["internship", "recruitment", "higher_studies"]),
+    ("projects", ["project", "patent", "revenue", "websites", "social_media", "community_service"]),
+    ("prior_learning", ["prior_learning", "rpl"]),
+    ("grades", ["grade"]),
+]
+DEFAULT_COLLECTION = "general"
+
+# Query words that point at a collection, used alongside centroid similarity
+ROUTING_KEYWORDS = {
+    "attendance": ["attendance", "waiver", "duty leave", "leave", "care"],
+    "mooc": ["mooc", "nptel", "swayam", "scrgm", "coursera", "certification", "credit transfer"],
+    "hackathon": ["hackathon", "competition", "contest"],
+    "internship": ["internship", "recruitment", "placement", "higher studies", "gate", "gre"],
+    "projects": ["project", "patent", "copyright", "revenue", "startup", "social media"],
+    "prior_learning": ["prior learning", "rpl"],
+    "grades": ["grade", "upgrade", "marks"],
+}
+
+_shard_name_re = re.compile(r"[^a-z0-9_]+")
+
+
+def load_collection_tags() -> Dict[str, str]:
+    if not os.path.exists(COLLECTIONS_FILE):
+        return {}
+    with open(COLLECTIONS_FILE, 'r') as f:
+        return json.load(f)
+
+
+def set_collection_tag(filename: str, collection: str):
+    """Pin a file to a collection (empty collection removes the override)"""
+    tags = load_collection_tags()
+    collection = _shard_name_re.sub("_", collection.strip().lower()).strip("_")
+    if collection:
+        tags[filename] = collection
+    else:
+        tags.pop(filename, None)
+    tmp_file = f"{COLLECTIONS_FILE}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(tags, f, indent=2)
+    os.replace(tmp_file, COLLECTIONS_FILE)
+
+
+def collection_for(filename: str, tags: Dict[str, str] = None) -> str:
+    """Collection a file belongs to: admin tag first, then filename rules"""
+    tags = load_collection_tags() if tags is None else tags
+    if filename in tags:
+        return tags[filename]
+    lowered = filename.lower().replace(" ", "_").replace("-", "_")
+    for collection, keywords in COLLECTION_RULES:
+        if any(keyword in lowered for keyword in keywords):
+            return collection
+    return DEFAULT_COLLECTION
+
+
+def shard_cache_file(collection: str) -> str:
+    return os.path.join(INDEX_DIR, f"{collection}.pkl")
+
+
+class ShardedRetriever:
+    """Per-collection LocalEmbeddingRetrievers behind the same interface, with query routing"""
+
+    def __init__(self, shards: Dict[str, LocalEmbeddingRetriever], use_embeddings=True, fanout=SHARD_FANOUT):
+        self.shards = shards
+        self.use_embeddings = use_embeddings and all(shard.use_embeddings for shard in shards.values())
+        self.fanout = fanout
+        self._pool = ThreadPoolExecutor(max_workers=max(1, fanout), thread_name_prefix="shard")
+        self._lock = Lock()
+        self._centroids = {}  # collection -> (shard version, centroid)
+        if self.use_embeddings:
+            self.embedding_model = next(iter(shards.values())).embedding_model
+
+    def _centroid(self, name, shard):
+        cached = self._centroids.get(name)
+        if cached and cached[0] == shard.version:
+            return cached[1]
+        centroid = shard.centroid()
+        self._centroids[name] = (shard.version, centroid)
+        return centroid
+
+    def route(self, query: str, query_embedding=None) -> List[str]:
+        """Names of the shards worth searching for this query, best first"""
+        with self._lock:
+            shards = dict(self.shards)
+        if len(shards) <= self.fanout:
+            return list(shards)
+
+        query_lower = query.lower()
+        scores = {}
+        for name, shard in shards.items():
+            if shard.live_count() == 0:
+                continue
+            score = 0.0
+            if query_embedding is not None:
+                centroid = self._centroid(name, shard)
+                if centroid is not None:
+                    score = float(np.dot(centroid, np.asarray(query_embedding).ravel()))
+            if any(keyword in query_lower for keyword in ROUTING_KEYWORDS.get(name, [])):
+                score += KEYWORD_ROUTE_BONUS
+            scores[name] = score
+        return sorted(scores, key=scores.get, reverse=True)[:self.fanout]
+
+    def _search(self, query: str, query_embedding, top_k: int, min_score: float = MIN_SIMILARITY) -> List:
+        names = self.route(query, query_embedding)
+        with self._lock:
+            shards = [self.shards[name] for name in names if name in self.shards]
+
+        if query_embedding is not None:
+            search = lambda shard: shard.search_by_vector(query_embedding, top_k, min_score)
+        else:
+            search = lambda shard: shard.search_by_keywords(query, top_k)
+
+        # Search the chosen shards in parallel (NumPy releases the GIL), then merge by score
+        scored = [hit for hits in self._pool.map(delegate(search), shards) for hit in hits]
+        scored.sort(key=lambda hit: hit[0], reverse=True)
+        return [doc for _, doc in scored[:top_k]]
+
+    def get_relevant_documents(self, query: str, top_k: int = TOP_K, min_score: float = MIN_SIMILARITY) -> List:
+        """Search the routed shards; min_score only applies to embedding search"""
+        query_embedding = None
+        if self.use_embeddings:
+            query_embedding = self.embedding_model.encode([query])[0]
+        return self._search(query, query_embedding, top_k, min_score)
+
+    def get_relevant_documents_batch(self, queries: List[str], top_k: int = TOP_K) -> List[List]:
+        if not self.use_embeddings:
+            return [self._search(query, None, top_k) for query in queries]
+        # One encode for the whole batch, then route each query on its own
+        query_embeddings = self.embedding_model.encode(list(queries))
+        return [self._search(query, embedding, top_k) for query, embedding in zip(queries, query_embeddings)]
+
+    def add_documents(self, chunks: List) -> int:
+        """Add chunks to their collections' shards, creating shards as needed"""
+        tags = load_collection_tags()
+        grouped = {}
+        for chunk in chunks:
+            grouped.setdefault(collection_for(source_name(chunk), tags), []).append(chunk)
+
+        added = 0
+        for name, group in grouped.items():
+            with self._lock:
+                shard = self.shards.get(name)
+            if shard is None:
+                shard = LocalEmbeddingRetriever(group, use_embeddings=self.use_embeddings,
+                                                embeddings_cache_file=shard_cache_file(name))
+                with self._lock:
+                    self.shards[name] = shard
+                added += len(shard.documents)
+            else:
+                added += shard.add_documents(group)
+        return added
+
+    def remove_source(self, filename: str) -> int:
+        """Tombstone a file's chunks; checks every shard since its tag may have changed"""
+        with self._lock:
+            shards = list(self.shards.values())
+        return sum(shard.remove_source(filename) for shard in shards)
+
+    def rebuild_collection(self, name: str, reuse_cache: bool = False) -> int:
+        """Re-parse and re-embed only the files of one collection
+
+        reuse_cache keeps the shard's embeddings cache, e.g. when repeating another worker's rebuild.
+        """
+        tags = load_collection_tags()
+        files = [file for suffix in SUPPORTED_SUFFIXES for file in Path("data").glob(f"*{suffix}")
+                 if collection_for(file.name, tags) == name]
+        chunks = []
+        for file in files:
+            try:
+                chunks.extend(load_file_chunks(file))
+            except Exception as e:
+                print(f"⚠️ Could not load {file.name}: {e}")
+
+        cache_file = shard_cache_file(name)
+        if not reuse_cache and os.path.exists(cache_file):
+            os.remove(cache_file)
+        # Embed outside the lock; searches keep using the old shard until the swap
+        shard = None
+        if chunks:
+            shard = LocalEmbeddingRetriever(chunks, use_embeddings=self.use_embeddings,
+                                            embeddings_cache_file=cache_file)
+        with self._lock:
+            if shard is not None:
+                self.shards[name] = shard
+            else:
+                self.shards.pop(name, None)
+            self._centroids.pop(name, None)
+        return len(chunks)
+
+    def generation(self) -> str:
+        """Fingerprint of the chunks currently served across all shards
+
+        Dedup runs per shard, so this differs from an unsharded index over the same files.
+        """
+        with self._lock:
+            shards = list(self.shards.values())
+        digests = sorted(digest for shard in shards for digest in shard.chunk_digests())
+        return hashlib.sha1("".join(digests).encode()).hexdigest()[:16]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: shard.live_count() for name, shard in sorted(self.shards.items())}
+
+
+def build_sharded_retriever():
+    """Build one persisted index per collection from the files in data/"""
+    data_path = Path("data")
+    files = [file for suffix in SUPPORTED_SUFFIXES for file in data_path.glob(f"*{suffix}")]
+    if not files:
+        raise ValueError("No policy files found in 'data' folder. Please add some PDF/TXT/XLSX/DOCX files.")
+
+    tags = load_collection_tags()
+    grouped = {}
+    for file in files:
+        try:
+            grouped.setdefault(collection_for(file.name, tags), []).extend(load_file_chunks(file))
+        except Exception as e:
+            print(f"⚠️ Could not load {file.name}: {e}")
+
+    grouped = {name: chunks for name, chunks in grouped.items() if chunks}
+    if not grouped:
+        raise ValueError("No documents could be loaded successfully.")
+
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    use_embeddings = EMBEDDINGS_AVAILABLE
+    shards = {}
+    for name, chunks in grouped.items():
+        print(f"📚 Collection '{name}': {len(chunks)} chunks")
+        shards[name] = LocalEmbeddingRetriever(chunks, use_embeddings=use_embeddings,
+                                               embeddings_cache_file=shard_cache_file(name))
+
+    print(f"✅ Loaded {sum(len(shard.documents) for shard in shards.values())} text chunks in {len(shards)} collections")
+    return ShardedRetriever(shards, use_embeddings=use_embeddings)
@@ -0,0 +1,95 @@
+"""gTTS audio and estimated lipsync for answers, used by the server and by offline builds"""
+import re
+import base64
+from io import BytesIO
+
+try:
+    from gtts import gTTS
+    TTS_AVAILABLE = True
+except ImportError:
+    TTS_AVAILABLE = False
+
+
+def clean_text_for_tts(text):
+    """Clean text for better TTS by removing asterisks and markdown"""
+    # Remove asterisks (both single and double)
+    text = re.sub(r'\*+', '', text)
+    # Remove other markdown formatting
+    text = re.sub(r'[_#`~]', '', text)
+    # Clean up extra spaces
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+def generate_audio_with_voice_variants(text, voice_type):
+    """Generate audio with different voice variants using gTTS"""
+    try:
+        print(f"🎤 Generating {voice_type} voice TTS for: '{text[:50]}...'")
+
+        # Single US female voice for all avatars (faster, no delay)
+        voice_config = {
+            'lang': 'en',
+            'tld': 'com',  # US English - simple, clear voice
+            'slow': False
+        }
+
+        config = voice_config
+        print(f"📁 Using US female voice ({config['tld']} variant)")        # Create gTTS object
+        # Clean text to remove asterisks and markdown
+        cleaned_text = clean_text_for_tts(text)
+        tts = gTTS(text=cleaned_text, lang=config['lang'], tld=config['tld'], slow=config['slow'])
+
+        # Save to BytesIO buffer
+        audio_buffer = BytesIO()
+        tts.write_to_fp(audio_buffer)
+        audio_buffer.seek(0)
+        audio_bytes = audio_buffer.read()
+
+        print(f"✅ {voice_type} voice audio generated: {len(audio_bytes)} bytes")
+        return base64.b64encode(audio_bytes).decode('utf-8')
+
+    except Exception as e:
+        print(f"❌ Audio generation error: {e}")
+        return None
+
+def generate_simple_lipsync(text):
+    """Generate simple lipsync data for text"""
+    # Estimate duration based on text length (roughly 150 words per minute)
+    word_list = text.split()
+    word_count = len(word_list)
+    duration = max(1.0, word_count / 2.5)  # Minimum 1 second, roughly 150 WPM
+
+    # Generate basic mouth cues based on text content
+    mouth_cues = []
+    current_time = 0.0
+    time_per_word = duration / max(1, word_count)
+
+    # Simple vowel/consonant mapping for basic lipsync
+    vowel_visemes = ['A', 'E', 'I', 'O', 'U']  # Open mouth shapes
+    consonant_visemes = ['B', 'F', 'G', 'H', 'X']  # Various consonant shapes
+
+    for i, word in enumerate(word_list):
+        word_duration = time_per_word * 0.8  # Leave some gap between words
+        cue_duration = word_duration / max(1, len(word))
+
+        for j, char in enumerate(word.lower()):
+            if char.isalpha():
+                # Choose viseme based on character
+                if char in 'aeiou':
+                    viseme = vowel_visemes[ord(char) % len(vowel_visemes)]
+                else:
+                    viseme = consonant_visemes[ord(char) % len(consonant_visemes)]
+
+                mouth_cues.append({
+                    "start": current_time,
+                    "end": current_time + cue_duration,
+                    "value": viseme
+                })
+                current_time += cue_duration
+
+        # Add a small pause between words
+        current_time += time_per_word * 0.2
+
+    return {
+        "metadata": {"duration": duration},
+        "mouthCues": mouth_cues
+    }
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Overloaded, DEFAULT_LANES, WORKER_THREADS
+
+
+@pytest.fixture(autouse=True)
+def default_settings(monkeypatch):
+    # Lane overrides from the environment would change what is being checked
+    for name in DEFAULT_LANES:
+        for setting in ("PRIORITY", "CONCURRENCY", "QUEUE", "TARGET_MS"):
+            monkeypatch.delenv(f"ADMISSION_{name.upper()}_{setting}", raising=False)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_default_lanes_leave_threads_for_text():
+    controller = AdmissionController()
+    assert controller.lower_priority_threads() < WORKER_THREADS
+
+
+def test_warns_when_lower_lanes_can_take_every_thread(capsys):
+    AdmissionController({"text": (0, 4, 8, 4000), "avatar": (1, 4, 12, 8000)}, threads=16)
+    assert "can hold 16 of 16 threads" in capsys.readouterr().out
+
+
+def test_freed_slot_goes_to_highest_priority_waiter():
+    controller = AdmissionController(max_inflight=1, max_wait=10)
+    controller.acquire("avatar")
+
+    order = []
+
+    def request(lane):
+        controller.acquire(lane)
+        order.append(lane)
+        controller.release(lane, 0.01)
+
+    # Queue them lowest priority first, so arrival order alone would give the wrong answer
+    threads = []
+    for lane in ("batch", "avatar", "text"):
+        thread = threading.Thread(target=request, args=(lane,))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: len(controller.lanes[lane].waiting) == 1)
+
+    controller.release("avatar", 0.01)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["text", "avatar", "batch"]
+
+
+def test_full_queue_is_rejected():
+    controller = AdmissionController({"batch": (0, 1, 1, 60000)}, max_wait=10)
+    controller.acquire("batch")
+    waiter = threading.Thread(target=lambda: (controller.acquire("batch"), controller.release("batch", 0.01)))
+    waiter.start()
+    wait_until(lambda: len(controller.lanes["batch"].waiting) == 1)
+
+    with pytest.raises(Overloaded) as error:
+        controller.acquire("batch")
+    assert error.value.reason == "queue full"
+
+    controller.release("batch", 0.01)
+    waiter.join(5)
+    assert controller.stats()["inflight"] == 0
+
+
+def test_admit_releases_the_slot_when_the_request_fails():
+    controller = AdmissionController({"text": (0, 1, 0, 4000)})
+    with pytest.raises(RuntimeError):
+        with controller.admit("text"):
+            assert controller.stats()["inflight"] == 1
+            with pytest.raises(Overloaded):
+                with controller.admit("text"):
+                    pass  # Never runs: the only slot is taken and there is no queue
+            raise RuntimeError("route failed")
+    assert controller.stats()["inflight"] == 0
+    assert controller.lanes["text"].counters == {"admitted": 1, "queued": 0, "rejected": 1, "timed_out": 0}
@@ -0,0 +1,67 @@
+import json
+import os
+from pathlib import Path
+
+from ingest_queue import IndexingQueue
+from local_embedding_retriever import LocalEmbeddingRetriever, load_file_chunks
+
+
+def test_changes_logged_by_another_worker_are_replayed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    Path("data/hours.txt").write_text("The library opens at nine and closes at five.")
+    change_log = os.path.join("indexes", "changes.log")
+    ingest = IndexingQueue(lambda: retriever, "data", change_log=change_log)
+    retriever = LocalEmbeddingRetriever(load_file_chunks(Path("data/hours.txt")), use_embeddings=False)
+
+    # Another worker uploaded menu.txt and then deleted hours.txt
+    Path("data/menu.txt").write_text("The canteen lunch menu changes every week.")
+    with open(change_log, "a") as f:
+        f.write(json.dumps({"action": "add", "file": "menu.txt", "pid": -1}) + "\n")
+        f.write(json.dumps({"action": "delete", "file": "hours.txt", "pid": -1}) + "\n")
+        f.write('{"action": "add", "fi')  # Still being written; left for the next poll
+
+    ingest._replay_changes()
+    live = [retriever.documents.source(i) for i in range(len(retriever.live)) if retriever.live[i]]
+    assert {os.path.basename(source) for source in live} == {"menu.txt"}
+    assert [job["replayed"] for job in ingest.jobs()] == [True, True]
+    assert ingest._log_offset < os.path.getsize(change_log)
+
+
+def test_own_changes_are_logged_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    Path("data/hours.txt").write_text("The library opens at nine and closes at five.")
+    ingest = IndexingQueue(lambda: retriever, "data", change_log=os.path.join("indexes", "changes.log"))
+    retriever = LocalEmbeddingRetriever(load_file_chunks(Path("data/hours.txt")), use_embeddings=False)
+
+    job = ingest._new_job("delete", "hours.txt")
+    assert ingest._execute(job, "data/hours.txt")
+    ingest._log_change({"action": "delete", "file": "hours.txt"})
+    ingest._replay_changes()  # Its own entry is skipped
+    assert [job["action"] for job in ingest.jobs()] == ["delete"]
+    assert not retriever.live.any()
+
+
+def test_rebuilds_by_another_worker_are_replayed(tmp_path, monkeypatch):
+    from sharded_retriever import ShardedRetriever
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    Path("data/mooc_policy.txt").write_text("Up to twenty percent of credits can come from MOOCs.")
+    reloads = []
+    change_log = os.path.join("indexes", "changes.log")
+    ingest = IndexingQueue(lambda: retriever, "data", change_log=change_log, reload_index=lambda: reloads.append(1))
+    shard = LocalEmbeddingRetriever(load_file_chunks(Path("data/mooc_policy.txt")), use_embeddings=False)
+    retriever = ShardedRetriever({"mooc": shard}, use_embeddings=False)
+
+    # Another worker rebuilt the mooc collection after a file was copied into data/, then everything
+    Path("data/nptel_courses.txt").write_text("NPTEL courses count towards MOOC credits.")
+    with open(change_log, "a") as f:
+        f.write(json.dumps({"action": "rebuild", "collection": "mooc", "pid": -1}) + "\n")
+        f.write(json.dumps({"action": "rebuild", "collection": None, "pid": -1}) + "\n")
+
+    ingest._replay_changes()
+    assert retriever.stats() == {"mooc": 2}
+    assert reloads == [1]
+    assert all(job["state"] == "done" for job in ingest.jobs())
@@ -0,0 +1,31 @@
+import pytest
+
+from intent_router import IntentRouter
+
+
+@pytest.fixture
+def router(tmp_path):
+    router = IntentRouter(str(tmp_path / "faqs.json"))
+    router.add_faq("What is the minimum attendance required?", "75% in every course.")
+    return router
+
+
+def test_faq_answers_rephrasings_of_the_same_question(router):
+    for message in ("what's the minimum attendance required", "What is the minimum attendance required?!"):
+        assert router.route(message)["intent"] == "faq"
+
+
+def test_faq_ignores_broader_or_narrower_questions(router):
+    # Close hashed vectors, but different questions; these must go to retrieval
+    assert router.route("Is attendance required?") is None
+    assert router.route("What is the minimum attendance required for exams?") is None
+
+
+def test_faq_edits_from_another_worker_are_picked_up(router):
+    other = IntentRouter(router.faq_file)
+    other.add_faq("Who approves duty leave?", "The head of department.")
+    router._checked_at = 0.0
+    assert router.route("Who approves duty leave?")["answer"] == "The head of department."
+    # Editing in the first worker keeps the entry added by the other one
+    router.remove_faq("What is the minimum attendance required?")
+    assert [faq["question"] for faq in other.current_faqs()] == ["Who approves duty leave?"]
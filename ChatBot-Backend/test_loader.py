@@ -0,0 +1,24 @@
+from pathlib import Path
+
+from local_embedding_retriever import load_file_chunks
+from utils.loader import load_policy_file
+
+SHEET = Path("data") / "Duty_Leave_Criteria_sheet.xlsx"
+
+
+def test_sheets_load_without_unstructured():
+    documents = list(load_policy_file(str(SHEET)))
+    assert documents
+    for doc in documents:
+        assert doc.metadata["sheet"]
+        assert "Duty Leave" in doc.page_content
+        assert "  " not in doc.page_content  # no column padding
+
+
+def test_sheet_chunks_keep_source_and_sheet_name():
+    chunks = load_file_chunks(SHEET)
+    assert chunks
+    sheets = {doc.metadata["sheet"] for doc in load_policy_file(str(SHEET))}
+    for chunk in chunks:
+        assert chunk.metadata["source"] == str(SHEET)
+        assert chunk.metadata["sheet"] in sheets
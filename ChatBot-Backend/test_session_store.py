@@ -0,0 +1,41 @@
+import os
+import time
+
+from session_store import SessionStore
+
+
+def test_history_is_shared_between_workers(tmp_path):
+    first, second = SessionStore(str(tmp_path)), SessionStore(str(tmp_path))
+    session_id = first.resolve(None)
+    first.record(session_id, "What is the attendance waiver criteria?", "Students with 10% participation qualify.")
+
+    # The follow-up lands on another worker
+    assert second.resolve(session_id) == session_id
+    search_query, history = second.context(session_id, "What about PhD students?")
+    assert "attendance" in search_query and "waiver" in search_query
+    assert history.startswith("User: What is the attendance waiver criteria?")
+
+
+def test_expired_and_unknown_sessions_start_fresh(tmp_path):
+    store = SessionStore(str(tmp_path), ttl=60)
+    session_id = store.resolve(None)
+    store.record(session_id, "Who is eligible for duty leave?", "Students with 60% attendance.")
+    old = time.time() - 120
+    os.utime(os.path.join(str(tmp_path), f"{session_id}.json"), (old, old))
+
+    assert store.resolve(session_id) != session_id
+    assert store.resolve("../../etc/passwd") != "../../etc/passwd"
+    assert store.context(session_id, "And for exams?") == ("And for exams?", "")
+
+
+def test_sweep_keeps_the_most_recent_sessions(tmp_path):
+    store = SessionStore(str(tmp_path), max_sessions=2)
+    ids = [store.resolve(None) for _ in range(3)]
+    for age, session_id in zip((30, 20, 10), ids):
+        store.record(session_id, "What are the CARE guidelines?", "They cover student welfare.")
+        then = time.time() - age
+        os.utime(os.path.join(str(tmp_path), f"{session_id}.json"), (then, then))
+
+    assert store.sweep() == 1
+    assert store.stats()["sessions"] == 2
+    assert store.context(ids[0], "What about them?")[1] == ""
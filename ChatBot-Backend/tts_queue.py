@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import base64
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+# Background TTS: /chat returns the answer text at once and the audio is fetched by job id
+TTS_ASYNC = os.getenv("TTS_ASYNC", "1") == "1"
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "2"))
+# Jobs waiting for a worker; beyond this /chat answers without audio instead of queueing
+TTS_QUEUE_DEPTH = int(os.getenv("TTS_QUEUE_DEPTH", "32"))
+# How long finished audio stays available for clients to fetch
+TTS_JOB_TTL_SECONDS = int(os.getenv("TTS_JOB_TTL_SECONDS", "300"))
+MAX_TTS_JOBS = 500
+
+FINISHED_STATES = ("done", "failed")
+_job_id_re = re.compile(r"^[0-9a-f]{12}$")
+
+
+class TTSQueue:
+    """Worker pool that turns answer texts into base64 audio and lipsync, one job per answer
+
+    With a store (AudioArtifactStore), each job's state and finished audio are also written
+    to disk as tts_<id>.json / tts_<id>.mp3, so a poll that lands on another gunicorn
+    worker than the one running the job is still answered.
+    """
+
+    def __init__(self, synthesize: Callable[[str, str], Optional[str]], lipsync: Callable[[str], Dict],
+                 workers: int = TTS_WORKERS, max_queue: int = TTS_QUEUE_DEPTH, ttl: int = TTS_JOB_TTL_SECONDS,
+                 store=None):
+        self.synthesize = synthesize
+        self.lipsync = lipsync
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()  # job id -> job, oldest first
+        self._by_text = {}          # (voice_type, text) -> job id, so repeated answers share one job
+        self._lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self.counters = {"submitted": 0, "reused": 0, "rejected": 0, "done": 0, "failed": 0}
+
+    def _ensure_workers(self):
+        # Threads do not survive fork (gunicorn preload), so start lazily per process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._jobs.clear()
+                self._by_text.clear()
+                self._threads = [threading.Thread(target=self._run, name=f"tts-worker-{i}", daemon=True)
+                                 for i in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, text: str, voice_type: str = "female") -> Optional[str]:
+        """Queue audio for text; returns the job id, or None when the queue is full"""
+        self._ensure_workers()
+        key = (voice_type, text)
+        with self._lock:
+            self._expire()
+            job_id = self._by_text.get(key)
+            if job_id is not None and self._jobs[job_id]["state"] != "failed":
+                self.counters["reused"] += 1
+                return job_id
+
+            job_id = uuid.uuid4().hex[:12]
+            job = {
+                "id": job_id,
+                "voice_type": voice_type,
+                "state": "queued",
+                "audio": "",
+                "lipsync": None,
+                "error": None,
+                "queued_at": time.time(),
+                "finished_at": None,
+                "text": text,
+            }
+            # Before the job is queued, so a worker's "done" can never be overwritten by this
+            self._persist(job)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.counters["rejected"] += 1
+                self._forget_stored(job_id)
+                return None
+            self._jobs[job_id] = job
+            self._by_text[key] = job_id
+            self.counters["submitted"] += 1
+            return job_id
+
+    def _expire(self):
+        """Drop finished jobs past their TTL and the oldest ones beyond MAX_TTS_JOBS (lock held)"""
+        cutoff = time.time() - self.ttl
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            expired = job["finished_at"] is not None and job["finished_at"] < cutoff
+            if not expired and len(self._jobs) <= MAX_TTS_JOBS:
+                break
+            if job["state"] not in FINISHED_STATES:
+                continue
+            del self._jobs[job_id]
+            if self._by_text.get((job["voice_type"], job["text"])) == job_id:
+                del self._by_text[(job["voice_type"], job["text"])]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job["state"] = "running"
+            try:
+                audio = self.synthesize(job["text"], job["voice_type"])
+                if not audio:
+                    raise RuntimeError("TTS produced no audio")
+                job["audio"] = audio
+                job["lipsync"] = self.lipsync(job["text"])
+                job["state"] = "done"
+            except Exception as e:
+                job["state"] = "failed"
+                job["error"] = str(e)
+                print(f"⚠️ TTS job {job['id']} failed: {e}")
+            job["finished_at"] = time.time()
+            self._persist(job)
+            self.counters[job["state"]] += 1
+
+    def _persist(self, job: Dict):
+        """Write the job's public state, and its audio once done, to the shared store"""
+        if self.store is None:
+            return
+        try:
+            if job["state"] == "done":
+                self.store.write_bytes(f"tts_{job['id']}.mp3", base64.b64decode(job["audio"]), ttl=self.ttl)
+            state = {key: value for key, value in self._public(job).items() if key != "audio"}
+            self.store.write_bytes(f"tts_{job['id']}.json", json.dumps(state).encode(), ttl=self.ttl)
+        except Exception as e:
+            print(f"⚠️ Could not store TTS job {job['id']}: {e}")
+
+    def _forget_stored(self, job_id: str):
+        if self.store is not None:
+            self.store.delete(f"tts_{job_id}.json")
+
+    def _stored_job(self, job_id: str) -> Optional[Dict]:
+        """A job run by another worker, read back from the store"""
+        if self.store is None or not _job_id_re.match(job_id):
+            return None
+        path = self.store.path_for(f"tts_{job_id}.json")
+        if path is None:
+            return None
+        try:
+            with open(path, "r") as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None  # Expired or replaced while being read
+
+        job["audio"] = ""
+        if job["state"] == "done":
+            audio_path = self.store.path_for(f"tts_{job_id}.mp3")
+            if audio_path is None:
+                return None
+            with open(audio_path, "rb") as f:
+                job["audio"] = base64.b64encode(f.read()).decode("utf-8")
+        return job
+
+    def _public(self, job: Dict) -> Dict:
+        return {key: value for key, value in job.items() if key != "text"}
+
+    def job(self, job_id: str) -> Optional[Dict]:
+        """Public view of a job; never blocks, so a poll holds a server thread only briefly"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self._stored_job(job_id)
+        return self._public(job)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job["state"] not in FINISHED_STATES)
+        return {
+            **self.counters,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "pending": pending,
+        }
@@ -1,12 +1,9 @@
 import os
+from typing import Iterator
 from langchain_core.documents import Document
-from PyPDF2 import PdfReader
-import docx
-import pandas as pd
-
-def load_policy_files(data_folder: str):
-    docs = []
 
+def load_policy_files(data_folder: str) -> Iterator[Document]:
+    """Check the folder up front, then yield one Document per PDF page / Excel sheet / text file"""
     if not os.path.exists(data_folder):
         raise ValueError(f"Data folder '{data_folder}' not found.")
 
@@ -14,37 +11,66 @@ def load_policy_files(data_folder: str):
     if not files:
         raise ValueError(f"No readable files found in '{data_folder}'.")
 
+    return _iter_policy_files(data_folder, files)
+
+def _iter_policy_files(data_folder: str, files) -> Iterator[Document]:
+    loaded = 0
     for filename in files:
         path = os.path.join(data_folder, filename)
-        ext = os.path.splitext(filename)[1].lower()
-
         try:
-            if ext == ".pdf":
-                text = ""
-                reader = PdfReader(path)
-                for page in reader.pages:
-                    text += page.extract_text() or ""
-                docs.append(Document(page_content=text, metadata={"source": filename}))
-
-            elif ext in [".docx", ".doc"]:
-                doc = docx.Document(path)
-                text = "\n".join([p.text for p in doc.paragraphs])
-                docs.append(Document(page_content=text, metadata={"source": filename}))
-
-            elif ext in [".xlsx", ".xls"]:
-                df = pd.read_excel(path)
-                text = df.to_string(index=False)
-                docs.append(Document(page_content=text, metadata={"source": filename}))
-
-            elif ext in [".txt", ".md"]:
-                with open(path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                docs.append(Document(page_content=text, metadata={"source": filename}))
-
+            for doc in load_policy_file(path):
+                loaded += 1
+                yield doc
         except Exception as e:
             print(f"⚠️ Could not load {filename}: {e}")
 
-    if not docs:
+    if not loaded:
         raise ValueError(f"No supported files found in '{data_folder}'. Ensure you have PDF, DOCX, XLSX, or TXT files.")
 
-    return docs
+def load_policy_file(path: str) -> Iterator[Document]:
+    """Yield the Documents of a single file; pages are 0-based like langchain's PyPDFLoader"""
+    filename = os.path.basename(path)
+    ext = os.path.splitext(filename)[1].lower()
+
+    if ext == ".pdf":
+        from PyPDF2 import PdfReader
+        reader = PdfReader(path)
+        for page_number, page in enumerate(reader.pages):
+            text = page.extract_text() or ""
+            if text.strip():
+                yield Document(page_content=text, metadata={"source": filename, "page": page_number})
+
+    elif ext in [".docx", ".doc"]:
+        import docx
+        doc = docx.Document(path)
+        text = "\n".join([p.text for p in doc.paragraphs])
+        yield Document(page_content=text, metadata={"source": filename})
+
+    elif ext in [".xlsx", ".xls"]:
+        import pandas as pd
+        # Read sheet by sheet so only one DataFrame is alive at a time
+        with pd.ExcelFile(path) as workbook:
+            for sheet_name in workbook.sheet_names:
+                df = workbook.parse(sheet_name)
+                if df.empty:
+                    continue
+                text = _sheet_text(df)
+                yield Document(page_content=text, metadata={"source": filename, "sheet": sheet_name})
+
+    elif ext in [".txt", ".md"]:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        yield Document(page_content=text, metadata={"source": filename})
+
+def _sheet_text(df) -> str:
+    """One "column: value; ..." line per row; to_string() pads every cell to the widest one"""
+    lines = []
+    for row in df.itertuples(index=False):
+        cells = []
+        for column, value in zip(df.columns, row):
+            value = " ".join(str(value).split())
+            if value and value.lower() != "nan":
+                cells.append(value if str(column).startswith("Unnamed") else f"{column}: {value}")
+        if cells:
+            lines.append("; ".join(cells))
+    return "\n".join(lines)